@@ -0,0 +1,95 @@
+import collections
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+
+def resource_url(url):
+    """A simple function that returns url without its query string or trailing slash."""
+    split = urlsplit(url)
+    return urlunsplit((split.scheme, split.netloc, split.path.rstrip('/'), '', ''))
+
+def cache_key(url, params=None):
+    """A simple function that returns the cache key of a GET request."""
+    return resource_url(url), urlsplit(url).query, tuple(sorted((params or {}).items()))
+
+
+class TTLCache:
+    """A thread-safe read-through cache with time-to-live and LRU eviction.
+
+    Entries expire `ttl` seconds after being stored, and the least recently
+    used entry is evicted once `maxsize` entries are held. Entries are keyed
+    by (resource url, query string, params) so every entry belonging to a
+    resource can be invalidated when it is written to.
+    """
+
+    def __init__(self, ttl=30.0, maxsize=256, clock=time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def get(self, key):
+        """Returns the value stored under key, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        """Stores value under key, evicting the least recently used entry if full."""
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, url):
+        """Drops every entry a write to url may have made stale.
+
+        That is the resource itself, anything below it, and its parent
+        collection (whose listings and filtered lookups include the resource).
+        """
+        target = resource_url(url)
+        parent = target.rsplit('/', 1)[0]
+        with self._lock:
+            stale = [key for key in self._entries
+                if key[0] == target or key[0] == parent or key[0].startswith(target + '/')]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def may_have_changed_state(response):
+    """A simple function that returns if a write request may have changed server state.
+
+    Writes rejected by the server (4xx HTTP status or envelope code) leave it
+    unchanged. Anything else, including a request that never got a response,
+    is assumed to have changed it."""
+    if response is None:
+        return True
+    if 400 <= response.status_code < 500:
+        return False
+    try:
+        response_dict = response.json()
+    except ValueError:
+        return True
+    code = response_dict.get('code') if isinstance(response_dict, dict) else None
+    return not (isinstance(code, int) and 400 <= code < 500)
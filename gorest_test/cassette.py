@@ -0,0 +1,169 @@
+import collections
+import datetime
+import gzip
+import http.client
+import io
+import json
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from timing import PhaseTimings, TimingAdapter
+
+MODES = ('record', 'replay')
+DEFAULT_DIRECTORY = "gorest_test/cassettes"
+# Never written to a cassette
+SECRET_HEADERS = ('authorization', 'cookie', 'set-cookie')
+
+
+class CassetteError(requests.ConnectionError):
+    """Raised when a request has no recorded response left to replay."""
+
+
+def request_key(method, url, body):
+    """A simple function that returns the key a request is recorded and replayed under.
+
+    The scheme and host are left out, so a cassette recorded against a fake
+    server on a random port replays whatever url the session uses."""
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', 'replace')
+    split = urlsplit(url)
+    return method.upper(), split.path, split.query, body or ''
+
+
+class Cassette:
+    """Every HTTP exchange of a session, recorded to or replayed from a gzipped JSON lines file.
+
+    The first line holds the url the session ran against. Each following
+    line is one exchange: method, url, request headers and body, status,
+    response headers and body, and the phase timings of the request.
+    Authorization and cookie headers are never written. On replay, requests
+    are matched on method, path, query and body, and identical requests get their
+    recorded responses back in the order they were recorded.
+    """
+
+    def __init__(self, path, mode, latency=True):
+        if mode not in MODES:
+            raise ValueError("Unknown cassette mode '{}'. Expected one of {}".format(mode, ", ".join(MODES)))
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.url = None
+        self._lock = threading.Lock()
+        self._exchanges = []
+        self._replay = collections.defaultdict(collections.deque)
+        if mode == 'replay':
+            self.load()
+
+    def load(self):
+        with gzip.open(self.path, 'rt', encoding='utf-8') as f:
+            self.url = json.loads(f.readline())['url']
+            for line in f:
+                exchange = json.loads(line)
+                self._replay[request_key(exchange['method'], exchange['url'], exchange['request_body'])].append(exchange)
+
+    def save(self):
+        """Writes every exchange recorded so far."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            exchanges = list(self._exchanges)
+        with gzip.open(self.path, 'wt', encoding='utf-8') as f:
+            f.write(json.dumps({'url': self.url, 'recorded_at':
+                datetime.datetime.now().astimezone().isoformat(timespec='seconds')}) + "\n")
+            for exchange in exchanges:
+                f.write(json.dumps(exchange, separators=(',', ':')) + "\n")
+
+    def record(self, request, response):
+        body = request.body.decode('utf-8', 'replace') if isinstance(request.body, bytes) else request.body
+        exchange = {
+            'method': request.method,
+            'url': request.url,
+            'request_headers': {name: value for name, value in request.headers.items()
+                if name.lower() not in SECRET_HEADERS},
+            'request_body': body,
+            'status': response.status_code,
+            'headers': {name: value for name, value in response.headers.items() if name.lower() not in SECRET_HEADERS},
+            'body': response.content.decode('utf-8', 'replace'),
+            'timings': list(getattr(response, 'timings', None) or ()),
+        }
+        with self._lock:
+            self._exchanges.append(exchange)
+
+    def next_exchange(self, request):
+        """Returns the next recorded exchange for request. Raises CassetteError if there is none."""
+        key = request_key(request.method, request.url, request.body)
+        with self._lock:
+            recorded = self._replay.get(key)
+            if not recorded:
+                raise CassetteError("No recorded response for {} {} in {}".format(request.method, request.url, self.path),
+                    request=request)
+            return recorded.popleft()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._exchanges) if self.mode == 'record' else sum(len(queue) for queue in self._replay.values())
+
+
+class RecordingAdapter(TimingAdapter):
+    """A TimingAdapter that also records every exchange to a cassette."""
+
+    def __init__(self, cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, stream=False, **kwargs):
+        response = super().send(request, stream=False, **kwargs)
+        self.cassette.record(request, response)
+        return response
+
+
+class ReplayAdapter(HTTPAdapter):
+    """An HTTPAdapter that answers every request from a cassette, without any network.
+
+    With the cassette's latency on, each response takes as long as it did
+    when recorded. Otherwise replay runs at full speed.
+    """
+
+    def __init__(self, cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        exchange = self.cassette.next_exchange(request)
+        timings = PhaseTimings(*exchange['timings']) if exchange['timings'] else None
+        if self.cassette.latency and timings is not None:
+            time.sleep(timings.total)
+
+        response = requests.Response()
+        response.status_code = exchange['status']
+        response.headers = CaseInsensitiveDict(exchange['headers'])
+        response._content = exchange['body'].encode('utf-8')
+        response.raw = io.BytesIO(response._content)
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.reason = http.client.responses.get(response.status_code, '')
+        response.elapsed = datetime.timedelta(seconds=timings.total if timings is not None else 0.0)
+        if timings is not None:
+            response.timings = timings
+        return response
+
+
+def cassette_from_env(environ):
+    """A function that returns the Cassette configured by GOREST_CASSETTE (record or replay), or None.
+
+    GOREST_CASSETTE_FILE picks the file (gorest_test/cassettes/session.jsonl.gz
+    by default) and GOREST_CASSETTE_LATENCY=0 replays at full speed."""
+    mode = environ.get('GOREST_CASSETTE')
+    if not mode:
+        return None
+    path = environ.get('GOREST_CASSETTE_FILE') or os.path.join(DEFAULT_DIRECTORY, "session.jsonl.gz")
+    return Cassette(path, mode, latency=environ.get('GOREST_CASSETTE_LATENCY', '1') not in ('0', 'false', 'no'))
@@ -0,0 +1,208 @@
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from cache import cache_key, may_have_changed_state
+from cassette import RecordingAdapter, ReplayAdapter
+from deadline import DeadlineExceeded, bounded_timeout, bounded_wait, expired
+from events import exchange_fields
+from retry import NO_RETRY
+from timing import TimingAdapter
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ApiClient:
+    """A pooled HTTP client shared by every helper and test during a session."""
+
+    def __init__(self, token=None, pool_size=10, timeout=None, registry=None, cache=None, timing_log=None,
+            cassette=None, rate_limiter=None, throttle_retries=5, retry=None, breaker=None, token_pool=None, events=None):
+        # Used by requests that do not set their own, capped to what is left of the test's deadline
+        self.timeout = timeout
+        # Every request waits for it first, and a 429 is queued again up to throttle_retries times
+        self.rate_limiter = rate_limiter
+        self.throttle_retries = throttle_retries
+        # Failed attempts are sent again as the policy allows, until the breaker opens
+        self.retry = retry or NO_RETRY
+        self.breaker = breaker
+        # Observes every response to learn which users this run created
+        self.registry = registry
+        # Serves repeated cached_get lookups. Writes invalidate what they may have made stale
+        self.cache = cache
+        # Records the PhaseTimings every response carries as response.timings
+        self.timing_log = timing_log
+        # Picks the token, and its rate limiter, of every request without its own Authorization header
+        self.token_pool = token_pool
+        # Records every attempt as an 'http' event
+        self.events = events
+        self.session = requests.Session()
+        if registry is not None:
+            self.session.hooks['response'].append(registry.observe)
+        if token_pool is not None:
+            self.session.hooks['response'].append(token_pool.observe)
+
+        # Keep up to pool_size connections alive per host, timing every request sent on them.
+        # With a cassette, every exchange is recorded to it, or replayed from it without any network
+        if cassette is None:
+            adapter = TimingAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        elif cassette.mode == 'record':
+            adapter = RecordingAdapter(cassette, pool_connections=pool_size, pool_maxsize=pool_size)
+        else:
+            adapter = ReplayAdapter(cassette)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # Default headers are built once and merged into every request. Without a token, requests carry
+        # their own Authorization header or take one from the token pool
+        if token:
+            self.session.headers['Authorization'] = "Bearer " + token
+
+    def _send(self, method, url, rate_limiter=None, **kwargs):
+        """Sends a single attempt, paced by the rate limiter. Throttled attempts are queued again."""
+        if rate_limiter is None:
+            return self.session.request(method, url, **dict(kwargs, timeout=bounded_timeout(kwargs['timeout'])))
+        for _ in range(self.throttle_retries + 1):
+            rate_limiter.acquire(bound=functools.partial(bounded_wait, reason="the rate limiter"))
+            response = self.session.request(method, url, **dict(kwargs, timeout=bounded_timeout(kwargs['timeout'])))
+            rate_limiter.observe(response)
+            if response.status_code != requests.codes.too_many_requests:
+                break
+        return response
+
+    def request(self, method, url, retry=None, **kwargs):
+        """Sends an HTTP request through the pooled session and returns the response.
+
+        retry overrides the client's retry policy for this call (NO_RETRY sends it once)."""
+        kwargs.setdefault('timeout', self.timeout)
+        policy = self.retry if retry is None else retry
+        rate_limiter, token = self.rate_limiter, None
+        if self.token_pool is not None and 'Authorization' not in (kwargs.get('headers') or {}):
+            token = self.token_pool.token_for(url)
+            kwargs['headers'] = dict(kwargs.get('headers') or {}, Authorization="Bearer " + token)
+            rate_limiter = self.token_pool.limiter(token) or rate_limiter
+        response = None
+        try:
+            attempt = 0
+            while True:
+                attempt += 1
+                if self.breaker is not None:
+                    self.breaker.before_request(url)
+                error = None
+                try:
+                    response = self._send(method, url, rate_limiter, **kwargs)
+                except requests.RequestException as e:
+                    error = expired(e)
+                    if token is not None:
+                        self.token_pool.failed(token)
+                failed = policy.is_failure(response, error)
+                if self.breaker is not None:
+                    if isinstance(error, DeadlineExceeded) and not error.sent:
+                        # The test's budget ran out before sending, which says nothing about the server
+                        self.breaker.release()
+                    else:
+                        self.breaker.record(failed)
+                retrying = policy.is_retryable(response, error) and policy.should_retry(method, attempt)
+                if error is None and self.timing_log is not None:
+                    # Retried attempts are logged apart from the latency of the request
+                    self.timing_log.observe(response, retried=retrying)
+                if self.events is not None:
+                    self.events.emit('http', **exchange_fields(method, url, response if error is None else None, error,
+                        retried=retrying))
+                if not retrying:
+                    if error is not None:
+                        raise error
+                    response.retries = attempt - 1
+                    return response
+                time.sleep(bounded_wait(policy.delay(attempt), "the retry backoff"))
+        finally:
+            if self.cache is not None and method.upper() not in SAFE_METHODS and may_have_changed_state(response):
+                self.cache.invalidate(url)
+
+    def cached_get(self, url, params=None, **kwargs):
+        """Sends a GET request unless a fresh response to it is cached. Only successful responses are cached."""
+        if self.cache is None or 'headers' in kwargs:
+            return self.get(url, params=params, **kwargs)
+        key = cache_key(url, params)
+        response = self.cache.get(key)
+        if response is None:
+            response = self.get(url, params=params, **kwargs)
+            if response.status_code == requests.codes.ok:
+                self.cache.set(key, response)
+        return response
+
+    def get(self, url, **kwargs):
+        """Sends a GET request through the pooled session."""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """Sends a POST request through the pooled session."""
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        """Sends a PUT request through the pooled session."""
+        return self.request('PUT', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        """Sends a DELETE request through the pooled session."""
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        """Closes every pooled connection."""
+        self.session.close()
+
+
+class AsyncClient:
+    """An asyncio front-end to an ApiClient.
+
+    Every request runs on a worker thread of the pooled client, so coroutines
+    can await many requests at once while sharing the same keep-alive
+    connections. At most `concurrency` requests (or blocking calls submitted
+    through `run`) are in flight at any time.
+    """
+
+    def __init__(self, client, concurrency=8):
+        self.client = client
+        self.concurrency = concurrency
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._semaphore = None
+        self._loop = None
+
+    async def run(self, func, *args, **kwargs):
+        """Runs a blocking callable on a worker thread and returns its result."""
+        loop = asyncio.get_event_loop()
+        if self._loop is not loop:
+            # Semaphores are bound to the event loop they are used in
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._loop = loop
+        async with self._semaphore:
+            # The call sees the caller's context, e.g. the deadline of the test it runs for
+            return await loop.run_in_executor(self.executor,
+                functools.partial(contextvars.copy_context().run, func, *args, **kwargs))
+
+    async def request(self, method, url, **kwargs):
+        """Sends an HTTP request without blocking the event loop."""
+        return await self.run(self.client.request, method, url, **kwargs)
+
+    async def get(self, url, **kwargs):
+        """Sends a GET request without blocking the event loop."""
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        """Sends a POST request without blocking the event loop."""
+        return await self.request('POST', url, **kwargs)
+
+    async def put(self, url, **kwargs):
+        """Sends a PUT request without blocking the event loop."""
+        return await self.request('PUT', url, **kwargs)
+
+    async def delete(self, url, **kwargs):
+        """Sends a DELETE request without blocking the event loop."""
+        return await self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        """Waits for pending calls and stops the worker threads."""
+        self.executor.shutdown(wait=True)
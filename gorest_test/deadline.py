@@ -0,0 +1,153 @@
+import collections
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+
+import requests
+
+PHASES = ('setup', 'request', 'cleanup')
+# Share of a test's budget each phase may use
+DEFAULT_SHARES = {'setup': 0.25, 'request': 0.65, 'cleanup': 0.10}
+
+# Context variables rather than thread-locals, so that requests fanned out to worker threads inherit them
+CURRENT = contextvars.ContextVar('deadline', default=None)
+_PHASE = contextvars.ContextVar('deadline_phase', default=('request', None))
+
+
+class DeadlineExceeded(requests.Timeout):
+    """Raised instead of sending a request once the test's time budget, or its phase's share of it, is used up.
+
+    Also raised in place of the timeout of a request sent with the time that was left, which then has sent set.
+    """
+
+    def __init__(self, *args, sent=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sent = sent
+
+
+class Deadline:
+    """The time budget of one test, split between its phases.
+
+    Setup helpers run in the 'setup' phase, deletes in the 'cleanup' phase,
+    and everything else in the 'request' phase. Each phase may use its share
+    of the budget, and the test as a whole the budget itself. Every request
+    sent while a deadline is current is given no more time than is left of
+    both, so a stalled server aborts the request instead of hanging the
+    session, and DeadlineExceeded names the phase that used the budget up.
+    """
+
+    def __init__(self, budget, shares=None, clock=time.monotonic):
+        self.budget = budget
+        self.shares = dict(shares or DEFAULT_SHARES)
+        self.clock = clock
+        self.started = clock()
+        self._used = collections.Counter()
+        self._lock = threading.Lock()
+
+    def spend(self, name, seconds):
+        """Accounts seconds spent in phase name."""
+        with self._lock:
+            self._used[name] += seconds
+
+    def usage(self):
+        """Returns the seconds used so far by every phase. The request phase is whatever the others did not use."""
+        now = self.clock()
+        with self._lock:
+            used = {name: self._used[name] for name in PHASES if name != 'request'}
+        name, start = _PHASE.get()
+        if start is not None and name != 'request':
+            used[name] += now - start
+        used['request'] = max(now - self.started - sum(used.values()), 0.0)
+        return used
+
+    def remaining(self):
+        """Returns (phase, seconds left) for the current phase: the least of its share and of the whole budget."""
+        name = _PHASE.get()[0]
+        usage = self.usage()
+        return name, min(self.budget * self.shares.get(name, 1.0) - usage[name], self.budget - sum(usage.values()))
+
+    def describe(self, name):
+        """Returns what used the budget up, for phase name."""
+        usage = self.usage()
+        return "Deadline exceeded during {}: it used {:.2f}s of its {:.2f}s share of the {:.2f}s test budget ({})".format(
+            name, usage[name], self.budget * self.shares.get(name, 1.0), self.budget,
+            ", ".join("{} {:.2f}s".format(phase, usage[phase]) for phase in PHASES))
+
+    def check(self, request=None):
+        """Raises DeadlineExceeded if no time is left for the current phase."""
+        name, left = self.remaining()
+        if left <= 0:
+            raise DeadlineExceeded(self.describe(name), request=request)
+        return left
+
+    def wait(self, seconds, reason):
+        """Returns seconds if that much time is left for the current phase. Raises DeadlineExceeded if not."""
+        name, left = self.remaining()
+        if seconds > left:
+            raise DeadlineExceeded("Deadline exceeded during {}: waiting {:.2f}s for {} would outlast the {:.2f}s left"
+                .format(name, seconds, reason, max(left, 0.0)))
+        return seconds
+
+    def timeout(self, timeout):
+        """Returns timeout (seconds, or a (connect, read) pair) capped to the time left. Raises DeadlineExceeded if none is."""
+        left = self.check()
+        if timeout is None:
+            return left
+        if isinstance(timeout, tuple):
+            return tuple(left if value is None else min(value, left) for value in timeout)
+        return min(timeout, left)
+
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Runs the block in phase name, accounted to the current deadline if there is one.
+
+    Nested phases count toward the outermost one."""
+    if _PHASE.get()[1] is not None:
+        yield
+        return
+    deadline = CURRENT.get()
+    clock = deadline.clock if deadline is not None else time.monotonic
+    start = clock()
+    token = _PHASE.set((name, start))
+    try:
+        yield
+    finally:
+        _PHASE.reset(token)
+        if deadline is not None:
+            deadline.spend(name, clock() - start)
+
+def current_phase():
+    """A simple function that returns the phase the caller runs in: 'setup', 'request' or 'cleanup'."""
+    return _PHASE.get()[0]
+
+def in_phase(name):
+    """A decorator that runs a helper in phase name."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def bounded_timeout(timeout):
+    """A simple function that returns timeout capped to what is left of the current deadline, if there is one."""
+    deadline = CURRENT.get()
+    return timeout if deadline is None else deadline.timeout(timeout)
+
+def bounded_wait(seconds, reason):
+    """A simple function that returns seconds, or raises DeadlineExceeded if waiting that long outlasts the current deadline."""
+    deadline = CURRENT.get()
+    return seconds if deadline is None else deadline.wait(seconds, reason)
+
+def expired(error):
+    """A simple function that returns a DeadlineExceeded in place of a timeout caused by the current deadline, or error."""
+    deadline = CURRENT.get()
+    if deadline is None or not isinstance(error, requests.Timeout) or isinstance(error, DeadlineExceeded):
+        return error
+    name, left = deadline.remaining()
+    return DeadlineExceeded(deadline.describe(name), request=error.request, sent=True) if left <= 0 else error
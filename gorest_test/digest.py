@@ -0,0 +1,104 @@
+import hashlib
+import json
+
+# Tags keep values of different types apart, e.g. the string "1" from the number 1
+_OBJECT, _ARRAY, _STRING, _NUMBER, _LITERAL, _END = b'{', b'[', b's', b'n', b'l', b'}'
+
+
+def canonical_number(value):
+    """A simple function that formats a JSON number so that equal numbers format the same (1, 1.0 and 1e0 are '1')."""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+def canonical_digest(value, ignore=()):
+    """A function that returns the SHA-256 hex digest of a parsed JSON value in canonical form.
+
+    Object keys are sorted, numbers normalized, and keys named in ignore are
+    skipped at any depth. The value is walked iteratively and fed to the hash
+    piece by piece, so no canonical string of the whole body is built.
+    """
+    hasher = hashlib.sha256()
+    ignore = frozenset(ignore)
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, bytes):
+            # A marker pushed while walking a container
+            hasher.update(item)
+        elif isinstance(item, dict):
+            hasher.update(_OBJECT)
+            stack.append(_END)
+            for key in sorted(item, reverse=True):
+                if key not in ignore:
+                    stack.append(item[key])
+                    stack.append(_STRING + json.dumps(key).encode('utf-8') + b':')
+        elif isinstance(item, list):
+            hasher.update(_ARRAY)
+            stack.append(_END)
+            stack.extend(reversed(item))
+        elif isinstance(item, str):
+            hasher.update(_STRING + json.dumps(item).encode('utf-8') + b',')
+        elif isinstance(item, bool) or item is None:
+            hasher.update(_LITERAL + json.dumps(item).encode('utf-8') + b',')
+        else:
+            hasher.update(_NUMBER + canonical_number(item).encode('ascii') + b',')
+    return hasher.hexdigest()
+
+def response_digest(response, ignore=()):
+    """A function that returns the canonical digest of a response body, computed once per response and ignore list.
+
+    Returns None if the body is not JSON."""
+    ignore = tuple(sorted(ignore))
+    digests = getattr(response, '_digests', None)
+    if digests is None:
+        digests = response._digests = {}
+    if ignore not in digests:
+        try:
+            digests[ignore] = canonical_digest(response.json(), ignore)
+        except ValueError:
+            digests[ignore] = None
+    return digests[ignore]
+
+
+class _MissingType:
+    def __repr__(self):
+        return '<missing>'
+
+_Missing = _MissingType()
+
+def structured_diff(first, second, ignore=(), path='', limit=10):
+    """A function that returns where two parsed JSON values differ, e.g. ["data[2].name: 'Ann' != 'Anne'"].
+
+    Keys named in ignore are skipped at any depth, numbers compare by value,
+    and at most limit differences are returned."""
+    differences = []
+    stack = [(path, first, second)]
+    while stack and len(differences) < limit:
+        where, a, b = stack.pop()
+        if isinstance(a, dict) and isinstance(b, dict):
+            for key in sorted(set(a) | set(b), reverse=True):
+                if key in ignore:
+                    continue
+                child = "{}.{}".format(where, key) if where else key
+                if key not in b:
+                    stack.append((child, a[key], _Missing))
+                elif key not in a:
+                    stack.append((child, _Missing, b[key]))
+                else:
+                    stack.append((child, a[key], b[key]))
+        elif isinstance(a, list) and isinstance(b, list):
+            if len(a) != len(b):
+                differences.append("{}: {} items != {} items".format(where or '<root>', len(a), len(b)))
+            for index in reversed(range(min(len(a), len(b)))):
+                stack.append(("{}[{}]".format(where, index), a[index], b[index]))
+        elif not _same_scalar(a, b):
+            differences.append("{}: {!r:.80} != {!r:.80}".format(where or '<root>', a, b))
+    return differences
+
+def _same_scalar(a, b):
+    if isinstance(a, bool) or isinstance(b, bool) or a is None or b is None:
+        return a is b or (a == b and type(a) is type(b))
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return a == b
+    return type(a) is type(b) and a == b
@@ -0,0 +1,124 @@
+import atexit
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+
+from deadline import current_phase
+from timing import endpoint_pattern
+
+# The test the caller runs for. A context variable, so that requests fanned out to worker threads inherit it
+CURRENT_TEST = contextvars.ContextVar('event_test', default=None)
+
+_STOP = object()
+
+
+def exchange_fields(method, url, response=None, error=None, retried=False):
+    """A function that returns the fields of the event recording one HTTP exchange, or the exception raised instead.
+
+    The endpoint has ids replaced, e.g. 'PUT /public-api/users/{id}', so that events aggregate across runs."""
+    if response is not None:
+        url = response.request.url
+    fields = {'method': method.upper(), 'endpoint': endpoint_pattern(method, url), 'url': url, 'retried': retried}
+    if error is not None:
+        fields.update(status=None, latency=None, outcome=type(error).__name__)
+        return fields
+    timings = getattr(response, 'timings', None)
+    fields.update(status=response.status_code,
+        latency=round(timings.total if timings is not None else response.elapsed.total_seconds(), 6),
+        outcome='retried' if retried else 'ok' if response.status_code < 500 else 'server_error')
+    return fields
+
+
+class EventSink:
+    """A buffered JSON lines file of structured events, written by a background thread.
+
+    Every event is one compact line holding its kind, the time, the run id,
+    the test and phase it happened in, and its own fields. `emit` only
+    queues the event, so the caller never waits on the disk: a writer
+    thread, started on the first event, serializes and appends events in
+    batches. When the queue is full, events are dropped and counted rather
+    than slowing the caller down. Events are appended, so one file can
+    collect many runs, told apart by their run id.
+    """
+
+    def __init__(self, path, run=None, max_queue=100000, poll_interval=1.0):
+        self.path = path
+        self.run = run or uuid.uuid4().hex
+        self.poll_interval = poll_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def emit(self, kind, **fields):
+        """Queues an event of kind. Never blocks."""
+        if self._thread is None:
+            self._start()
+        event = {'kind': kind, 'ts': round(time.time(), 6), 'run': self.run, 'test': CURRENT_TEST.get(),
+            'phase': current_phase()}
+        event.update(fields)
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._write, name='event-sink', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _write(self):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            while True:
+                try:
+                    batch = [self._queue.get(timeout=self.poll_interval)]
+                except queue.Empty:
+                    continue
+                # Drain whatever else is waiting, and write it in one go
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                lines = [json.dumps(item, separators=(',', ':'), default=str) for item in batch if isinstance(item, dict)]
+                if lines:
+                    f.write("\n".join(lines) + "\n")
+                f.flush()
+                # Anything else is a marker: an Event set once written, or _STOP
+                markers = [item for item in batch if not isinstance(item, dict)]
+                for marker in markers:
+                    if marker is not _STOP:
+                        marker.set()
+                if _STOP in markers:
+                    return
+
+    def flush(self, timeout=5.0):
+        """Waits until every event queued so far is written."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        written = threading.Event()
+        self._queue.put(written)
+        written.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """Writes every queued event and stops the writer thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+
+def sink_from_env(environ, run=None):
+    """A function that returns the EventSink writing to GOREST_EVENTS, or None if it is unset or empty."""
+    path = environ.get('GOREST_EVENTS')
+    return EventSink(path, run=run) if path else None
@@ -0,0 +1,413 @@
+"""A local, in-process stand-in for the gorest.co.in users resource.
+
+It implements GET (with pagination and filters), POST, PUT and DELETE on
+/public-api/users with the same response envelope and 422 field errors as
+the real server, plus knobs for injected latency, errors and rate limiting.
+Run it standalone from the repository main folder:
+
+    python3 gorest_test/fake_server.py --port 8000 --latency lognormal:0.02,0.5
+"""
+import argparse
+import datetime
+import hashlib
+import itertools
+import json
+import math
+import random
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+USERS_PATH = '/public-api/users'
+PAGE_LIMIT = 20
+FIELDS = ('email', 'name', 'gender', 'status')
+GENDERS = ('Male', 'Female')
+STATUSES = ('Active', 'Inactive')
+MAX_LENGTH = 200
+EMAIL_PATTERN = re.compile(r'^[^@\s]+@[^@\s.]+(\.[^@\s.]+)+$')
+
+
+def constant_latency(seconds):
+    """A simple function that returns a latency model always waiting the same time."""
+    return lambda rng: seconds
+
+def uniform_latency(low, high):
+    """A simple function that returns a latency model drawing uniformly between low and high seconds."""
+    return lambda rng: rng.uniform(low, high)
+
+def exponential_latency(mean):
+    """A simple function that returns a latency model drawing from an exponential distribution."""
+    return lambda rng: rng.expovariate(1.0 / mean)
+
+def lognormal_latency(median, sigma):
+    """A simple function that returns a latency model drawing from a log-normal distribution (long tail)."""
+    return lambda rng: rng.lognormvariate(math.log(median), sigma)
+
+LATENCY_MODELS = {
+    'constant': constant_latency,
+    'uniform': uniform_latency,
+    'exponential': exponential_latency,
+    'lognormal': lognormal_latency,
+}
+
+def parse_latency(spec):
+    """A function that turns a spec such as 'lognormal:0.02,0.5' into a latency model. Returns None for an empty spec."""
+    if not spec:
+        return None
+    name, _, arguments = spec.partition(':')
+    if name not in LATENCY_MODELS:
+        raise ValueError("Unknown latency model '{}'. Expected one of {}".format(name, ", ".join(LATENCY_MODELS)))
+    return LATENCY_MODELS[name](*[float(argument) for argument in arguments.split(',') if argument])
+
+def timestamp():
+    """A simple function that returns the current time formatted like the gorest server does."""
+    return datetime.datetime.now().astimezone().isoformat(timespec='milliseconds')
+
+
+class UserStore:
+    """The thread-safe users table behind the fake server."""
+
+    def __init__(self, seed_users=0, first_id=1000, rng=None):
+        self.lock = threading.Lock()
+        self.users = {}
+        self._ids = itertools.count(first_id)
+        rng = rng or random.Random()
+        for number in range(seed_users):
+            self.insert({
+                'name': "Seed User {}".format(number),
+                'email': "seed.user.{}@example.com".format(number),
+                'gender': rng.choice(GENDERS),
+                'status': rng.choice(STATUSES),
+            })
+
+    def insert(self, fields):
+        """Creates a user from validated fields and returns it."""
+        now = timestamp()
+        user = {'id': next(self._ids)}
+        user.update({field: fields[field] for field in ('name', 'email', 'gender', 'status')})
+        user.update({'created_at': now, 'updated_at': now})
+        self.users[user['id']] = user
+        return user
+
+    def email_taken(self, email, exclude_id=None):
+        """Returns if another user already has email."""
+        return any(user['email'] == email and user_id != exclude_id for user_id, user in self.users.items())
+
+    def validate(self, fields, partial=False, exclude_id=None):
+        """Returns the 422 field errors for fields, in the order the gorest server reports them."""
+        errors = []
+        for field in FIELDS:
+            if field not in fields:
+                if not partial:
+                    errors.append({'field': field, 'message': "can't be blank"})
+                continue
+            value = fields[field]
+            if value is None or value == '':
+                errors.append({'field': field, 'message': "can't be blank"})
+            elif not isinstance(value, str):
+                errors.append({'field': field, 'message': "is invalid"})
+            elif len(value) > MAX_LENGTH:
+                errors.append({'field': field, 'message': "is too long (maximum is {} characters)".format(MAX_LENGTH)})
+            elif field == 'email' and not EMAIL_PATTERN.match(value):
+                errors.append({'field': field, 'message': "is invalid"})
+            elif field == 'email' and self.email_taken(value, exclude_id):
+                errors.append({'field': field, 'message': "has already been taken"})
+            elif field == 'gender' and value not in GENDERS:
+                errors.append({'field': field, 'message': "can be Male or Female"})
+            elif field == 'status' and value not in STATUSES:
+                errors.append({'field': field, 'message': "can be Active or Inactive"})
+        return errors
+
+    def search(self, filters):
+        """Returns every user matching filters (substring for name/email, exact for gender/status)."""
+        users = []
+        for user_id in sorted(self.users):
+            user = self.users[user_id]
+            if all(self._matches(user, field, value) for field, value in filters.items()):
+                users.append(user)
+        return users
+
+    @staticmethod
+    def _matches(user, field, value):
+        if field in ('name', 'email'):
+            return value.lower() in user[field].lower()
+        return user[field] == value
+
+
+class FakeGorestHandler(BaseHTTPRequestHandler):
+    """Serves /public-api/users requests against the server's UserStore."""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeGorest/1.0'
+    # Headers and body are written separately, so Nagle would delay every response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_api('GET')
+
+    def do_POST(self):
+        self.handle_api('POST')
+
+    def do_PUT(self):
+        self.handle_api('PUT')
+
+    def do_PATCH(self):
+        self.handle_api('PUT')
+
+    def do_DELETE(self):
+        self.handle_api('DELETE')
+
+    def handle_api(self, method):
+        server = self.server
+        body = self.read_body()
+        token = self.bearer_token()
+
+        server.inject_latency()
+        allowed, rate_headers = server.rate_limit_headers(token or self.client_address[0])
+        if not allowed:
+            return self.send_envelope(429, None, {'message': 'Too many requests'}, status=429, headers=rate_headers)
+        if server.inject_error():
+            return self.send_envelope(500, None, {'message': 'Internal Server Error'}, status=500, headers=rate_headers)
+
+        split = urlsplit(self.path)
+        path = split.path.rstrip('/')
+        if path == USERS_PATH:
+            user_id = None
+        elif path.startswith(USERS_PATH + '/') and path[len(USERS_PATH) + 1:].isdigit():
+            user_id = int(path[len(USERS_PATH) + 1:])
+        else:
+            return self.send_envelope(404, None, {'message': 'Resource not found'}, status=404, headers=rate_headers)
+
+        if method != 'GET' and not server.is_authorized(token):
+            return self.send_envelope(401, None, {'message': 'Authentication failed'}, headers=rate_headers)
+
+        query = {key: values[-1] for key, values in parse_qs(split.query).items()}
+        with server.store.lock:
+            if user_id is None:
+                code, meta, data = self.collection(method, query, body)
+            else:
+                code, meta, data = self.member(method, user_id, body)
+        self.send_envelope(code, meta, data, headers=rate_headers)
+
+    def collection(self, method, query, fields):
+        store = self.server.store
+        if method == 'GET':
+            filters = {field: query[field] for field in FIELDS if field in query}
+            users = store.search(filters)
+            try:
+                page = max(int(query.get('page', 1)), 1)
+            except ValueError:
+                page = 1
+            pagination = {
+                'total': len(users),
+                'pages': math.ceil(len(users) / PAGE_LIMIT),
+                'page': page,
+                'limit': PAGE_LIMIT,
+            }
+            start = (page - 1) * PAGE_LIMIT
+            return 200, {'pagination': pagination}, users[start:start + PAGE_LIMIT]
+        elif method == 'POST':
+            errors = store.validate(fields)
+            if errors:
+                return 422, None, errors
+            return 201, None, store.insert(fields)
+        return 404, None, {'message': 'Resource not found'}
+
+    def member(self, method, user_id, fields):
+        store = self.server.store
+        user = store.users.get(user_id)
+        if user is None:
+            return 404, None, {'message': 'Resource not found'}
+        if method == 'GET':
+            return 200, None, user
+        elif method == 'PUT':
+            errors = store.validate(fields, partial=True, exclude_id=user_id)
+            if errors:
+                return 422, None, errors
+            changes = {field: fields[field] for field in FIELDS if field in fields and fields[field] != user[field]}
+            if changes:
+                user.update(changes)
+                user['updated_at'] = timestamp()
+            return 200, None, user
+        elif method == 'DELETE':
+            del store.users[user_id]
+            return 204, None, None
+        return 404, None, {'message': 'Resource not found'}
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        if not raw:
+            return {}
+        if 'json' in (self.headers.get('Content-Type') or ''):
+            try:
+                body = json.loads(raw)
+            except ValueError:
+                return {}
+            return body if isinstance(body, dict) else {}
+        return {key: values[-1] for key, values in parse_qs(raw.decode('utf-8'), keep_blank_values=True).items()}
+
+    def bearer_token(self):
+        authorization = self.headers.get('Authorization') or ''
+        if authorization.startswith('Bearer '):
+            return authorization[len('Bearer '):].strip()
+        return None
+
+    def send_envelope(self, code, meta, data, status=200, headers=None):
+        payload = json.dumps({'code': code, 'meta': meta, 'data': data}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+class FakeGorestServer(ThreadingHTTPServer):
+    """A threaded local server that behaves like gorest.co.in's users resource.
+
+    Knobs:
+    - latency: a latency model (see parse_latency) applied to every request.
+    - error_rate: fraction of requests answered with a 500 before being processed.
+    - rate_limit, rate_period: requests allowed per token per window of rate_period
+      seconds. Responses carry X-RateLimit-* headers, and requests over the
+      limit are answered with 429.
+    - tokens: accepted bearer tokens. One is generated when none are given.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=None, error_rate=0.0, rate_limit=None,
+            rate_period=1.0, tokens=None, seed_users=50, seed=None):
+        super().__init__((host, port), FakeGorestHandler)
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self.tokens = set(tokens) if tokens else {secrets.token_hex(32)}
+        self.store = UserStore(seed_users=seed_users, rng=random.Random(seed))
+        self._windows = {}
+        self._windows_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        """The main url of the server, e.g. http://127.0.0.1:8000."""
+        host, port = self.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    @property
+    def token(self):
+        """A bearer token the server accepts."""
+        return sorted(self.tokens)[0]
+
+    def is_authorized(self, token):
+        return token in self.tokens
+
+    def inject_latency(self):
+        if self.latency is not None:
+            with self.rng_lock:
+                delay = self.latency(self.rng)
+            time.sleep(max(delay, 0.0))
+
+    def inject_error(self):
+        if not self.error_rate:
+            return False
+        with self.rng_lock:
+            return self.rng.random() < self.error_rate
+
+    def rate_limit_headers(self, key):
+        """Counts a request against key's window. Returns if it is allowed and the X-RateLimit-* headers."""
+        if self.rate_limit is None:
+            return True, {}
+        now = time.monotonic()
+        with self._windows_lock:
+            window_start, count = self._windows.get(key, (now, 0))
+            if now - window_start >= self.rate_period:
+                window_start, count = now, 0
+            allowed = count < self.rate_limit
+            if allowed:
+                count += 1
+                self._windows[key] = (window_start, count)
+        return allowed, {
+            'X-RateLimit-Limit': str(self.rate_limit),
+            'X-RateLimit-Remaining': str(self.rate_limit - count),
+            'X-RateLimit-Reset': str(max(math.ceil(window_start + self.rate_period - now), 1)),
+        }
+
+    def start(self):
+        """Starts serving on a background thread and returns the server."""
+        self._thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05},
+            name='fake-gorest', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops serving and closes the listening socket."""
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def fake_tokens(count):
+    """A simple function that returns count bearer tokens, the same ones on every call so that every fake server of a session shares them."""
+    return [hashlib.sha256("gorest-fake-token-{}".format(index).encode('utf-8')).hexdigest() for index in range(count)]
+
+def options_from_env(environ):
+    """A function that returns FakeGorestServer keyword arguments from GOREST_FAKE_* environment variables."""
+    options = {}
+    if environ.get('GOREST_FAKE_LATENCY'):
+        options['latency'] = parse_latency(environ['GOREST_FAKE_LATENCY'])
+    if environ.get('GOREST_FAKE_ERROR_RATE'):
+        options['error_rate'] = float(environ['GOREST_FAKE_ERROR_RATE'])
+    if environ.get('GOREST_FAKE_RATE_LIMIT'):
+        options['rate_limit'] = int(environ['GOREST_FAKE_RATE_LIMIT'])
+    if environ.get('GOREST_FAKE_SEED'):
+        options['seed'] = int(environ['GOREST_FAKE_SEED'])
+    if environ.get('GOREST_FAKE_TOKENS'):
+        options['tokens'] = fake_tokens(int(environ['GOREST_FAKE_TOKENS']))
+    return options
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serves a local stand-in for gorest.co.in's users resource.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', help="latency model, e.g. constant:0.05 or lognormal:0.02,0.5")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument('--rate-limit', type=int, help="requests allowed per token per --rate-period")
+    parser.add_argument('--rate-period', type=float, default=1.0)
+    parser.add_argument('--token', action='append', help="accepted bearer token (repeatable)")
+    parser.add_argument('--seed-users', type=int, default=50)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    server = FakeGorestServer(host=args.host, port=args.port, latency=parse_latency(args.latency),
+        error_rate=args.error_rate, rate_limit=args.rate_limit, rate_period=args.rate_period,
+        tokens=args.token, seed_users=args.seed_users, seed=args.seed)
+    print("Serving {}{} (token: {})".format(server.url, USERS_PATH, server.token))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
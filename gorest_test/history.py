@@ -0,0 +1,209 @@
+"""Persistent latency history and regression detection.
+
+When GOREST_HISTORY names a database, e.g. gorest_test/history.sqlite, every
+pytest session (and runner run) appends the timings of each request it sent
+to it. Run this script from the repository main folder to compare runs:
+
+    python3 gorest_test/history.py runs
+    python3 gorest_test/history.py baseline 12
+    python3 gorest_test/history.py compare [--baseline 12] [--candidate 15]
+
+It reads the database named by GOREST_HISTORY, or by --history.
+
+An endpoint regresses when its p95 went up by more than --threshold (20% by
+default) and by more than --min-delta (1ms by default), and a one-sided
+Mann-Whitney U test says its latencies got slower with p below --alpha (0.05
+by default). compare exits with status 1 if any
+endpoint regressed.
+"""
+import argparse
+import collections
+import datetime
+import math
+import os
+import sqlite3
+import sys
+
+from latency import LatencyHistogram
+from timing import PHASES
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    session TEXT UNIQUE,
+    started_at TEXT NOT NULL,
+    url TEXT,
+    baseline INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS samples (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    test TEXT,
+    method TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    status_code INTEGER,
+    total REAL NOT NULL,
+    {phases}
+);
+CREATE INDEX IF NOT EXISTS samples_by_run ON samples (run_id, method, endpoint);
+""".format(phases=",\n    ".join("{} REAL".format(phase) for phase in PHASES))
+
+Comparison = collections.namedtuple('Comparison',
+    ['endpoint', 'baseline', 'candidate', 'ratio', 'p_value', 'regressed'])
+
+
+class HistoryStore:
+    """An append-only SQLite store of request latencies, one row per request, grouped in runs."""
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def record_run(self, entries, url=None, session=None):
+        """Stores the entries of a TimingLog as a run. Returns the run id.
+
+        Entries recorded with the same session are appended to the same run.
+        Retried attempts are left out."""
+        with self.connection:
+            row = self.connection.execute("SELECT id FROM runs WHERE session = ?", (session,)).fetchone()
+            if row is not None:
+                run_id = row[0]
+            else:
+                run_id = self.connection.execute("INSERT INTO runs (session, started_at, url) VALUES (?, ?, ?)",
+                    (session, datetime.datetime.now().astimezone().isoformat(timespec='seconds'), url)).lastrowid
+            self.connection.executemany(
+                "INSERT INTO samples (run_id, test, method, endpoint, status_code, total, {}) VALUES ({})".format(
+                    ", ".join(PHASES), ", ".join("?" * (6 + len(PHASES)))),
+                [(run_id, entry['test'], *entry['endpoint'].split(' ', 1), entry['status_code'], entry['total'],
+                    *(entry['phases'][phase] for phase in PHASES)) for entry in entries if not entry.get('retried')])
+        return run_id
+
+    def runs(self):
+        """Returns (id, started_at, url, baseline, requests) of every run, oldest first."""
+        return self.connection.execute("SELECT runs.id, started_at, url, baseline, COUNT(samples.run_id) FROM runs "
+            "LEFT JOIN samples ON samples.run_id = runs.id GROUP BY runs.id ORDER BY runs.id").fetchall()
+
+    def mark_baseline(self, run_id):
+        """Makes run_id the baseline of its url."""
+        with self.connection:
+            url, = self.connection.execute("SELECT url FROM runs WHERE id = ?", (run_id,)).fetchone()
+            self.connection.execute("UPDATE runs SET baseline = 0 WHERE url IS ?", (url,))
+            self.connection.execute("UPDATE runs SET baseline = 1 WHERE id = ?", (run_id,))
+
+    def latest_run(self, baseline=False, url=None):
+        """Returns the id of the latest run (or baseline run) against url, any url if None. Returns None if there is none."""
+        query = "SELECT id FROM runs WHERE (? IS NULL OR url = ?)" + (" AND baseline = 1" if baseline else "")
+        row = self.connection.execute(query + " ORDER BY id DESC LIMIT 1", (url, url)).fetchone()
+        return row[0] if row else None
+
+    def run_url(self, run_id):
+        row = self.connection.execute("SELECT url FROM runs WHERE id = ?", (run_id,)).fetchone()
+        return row[0] if row else None
+
+    def latencies(self, run_id):
+        """Returns the request latencies of a run grouped by 'METHOD endpoint'."""
+        grouped = collections.defaultdict(list)
+        for method, endpoint, total in self.connection.execute(
+                "SELECT method, endpoint, total FROM samples WHERE run_id = ?", (run_id,)):
+            grouped["{} {}".format(method, endpoint)].append(total)
+        return grouped
+
+    def close(self):
+        self.connection.close()
+
+
+def mann_whitney_greater(baseline, candidate):
+    """A function that returns the one-sided p-value of candidate latencies being larger than baseline ones.
+
+    Uses the normal approximation of the Mann-Whitney U statistic with tie
+    correction. Returns 1.0 when either sample is empty or all values tie."""
+    n1, n2 = len(baseline), len(candidate)
+    if not n1 or not n2:
+        return 1.0
+    ranked = sorted([(value, 0) for value in baseline] + [(value, 1) for value in candidate])
+    rank_sum, ties, index = 0.0, 0.0, 0
+    while index < len(ranked):
+        end = index
+        while end + 1 < len(ranked) and ranked[end + 1][0] == ranked[index][0]:
+            end += 1
+        # Tied values share the average of their ranks
+        rank = (index + end) / 2 + 1
+        group = end - index + 1
+        rank_sum += rank * sum(1 for _, sample in ranked[index:end + 1] if sample == 1)
+        ties += group**3 - group
+        index = end + 1
+    u = rank_sum - n2 * (n2 + 1) / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1))) if n > 1 else 0.0
+    if variance <= 0:
+        return 1.0
+    z = (u - n1 * n2 / 2 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+def p95(values):
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+    return histogram.percentile(95)
+
+def compare(baseline, candidate, threshold=0.2, alpha=0.05, min_delta=0.001):
+    """A function that compares two runs' latencies endpoint by endpoint. Returns a list of Comparisons.
+
+    baseline and candidate map endpoints to lists of latencies. Endpoints
+    missing from either run are skipped. Increases under min_delta seconds
+    are never regressions, however large relative to a fast baseline."""
+    comparisons = []
+    for endpoint in sorted(set(baseline) & set(candidate)):
+        before, after = p95(baseline[endpoint]), p95(candidate[endpoint])
+        ratio = after / before if before else math.inf
+        p_value = mann_whitney_greater(baseline[endpoint], candidate[endpoint])
+        comparisons.append(Comparison(endpoint, before, after, ratio, p_value,
+            ratio > 1 + threshold and after - before > min_delta and p_value < alpha))
+    return comparisons
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stores and compares request latency history.")
+    parser.add_argument('--history', default=os.environ.get('GOREST_HISTORY'), help="history database (GOREST_HISTORY)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('runs', help="list stored runs")
+    mark = commands.add_parser('baseline', help="mark a run as the baseline of its url")
+    mark.add_argument('run', type=int)
+    check = commands.add_parser('compare', help="flag endpoints that regressed against the baseline")
+    check.add_argument('--baseline', type=int, help="baseline run (latest baseline of the candidate's url by default)")
+    check.add_argument('--candidate', type=int, help="candidate run (latest run by default)")
+    check.add_argument('--threshold', type=float, default=0.2, help="p95 increase that counts as a regression")
+    check.add_argument('--min-delta', type=float, default=0.001, help="p95 increase in seconds that counts as a regression")
+    check.add_argument('--alpha', type=float, default=0.05, help="significance level of the Mann-Whitney U test")
+    args = parser.parse_args(argv)
+    if not args.history:
+        sys.exit("No history database. Hint: set GOREST_HISTORY or pass --history")
+
+    store = HistoryStore(args.history)
+    try:
+        if args.command == 'runs':
+            for run_id, started_at, url, baseline, requests in store.runs():
+                print("{:>5} {} {:<40} {:>6} requests{}".format(run_id, started_at, url or '-', requests,
+                    " (baseline)" if baseline else ""))
+            return 0
+        if args.command == 'baseline':
+            store.mark_baseline(args.run)
+            return 0
+
+        candidate = args.candidate or store.latest_run()
+        baseline = args.baseline or store.latest_run(baseline=True, url=store.run_url(candidate))
+        if candidate is None or baseline is None:
+            sys.exit("Nothing to compare. Hint: mark a baseline run with 'history.py baseline RUN'")
+        comparisons = compare(store.latencies(baseline), store.latencies(candidate), args.threshold, args.alpha, args.min_delta)
+        print("Run {} against baseline run {}".format(candidate, baseline))
+        print("{:<36} {:>10} {:>10} {:>8} {:>8}".format('endpoint', 'base p95', 'p95', 'change', 'p'))
+        for c in comparisons:
+            print("{:<36} {:>8.2f}ms {:>8.2f}ms {:>+7.1f}% {:>8.4f}{}".format(c.endpoint, c.baseline*1000,
+                c.candidate*1000, (c.ratio - 1)*100, c.p_value, "  REGRESSION" if c.regressed else ""))
+        return 1 if any(c.regressed for c in comparisons) else 0
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,272 @@
+import math
+import time
+
+from sequential import DEFAULT_TOLERANCE, VIOLATED, sequential_tests, settled
+
+REPORTED_PERCENTILES = (50, 95, 99)
+
+
+class LatencyHistogram:
+    """An HDR-style latency histogram.
+
+    Samples (in seconds) are counted in logarithmic buckets whose width is a
+    fixed fraction (`precision`) of their value, so percentiles keep the same
+    relative accuracy from microseconds to minutes while memory only grows
+    with the range of values seen, not with the number of samples. The
+    phase breakdown of the slowest sample, when recorded, is kept as
+    `slowest`, and `retries` counts the failed attempts that preceded the
+    samples (their latency is not recorded). A histogram corrected for
+    coordinated omission keeps the uncorrected one it was derived from as
+    `uncorrected`, and reports both side by side. Samples taken sequentially
+    keep the Verdict reached for each percentile as `verdicts`.
+    """
+
+    def __init__(self, precision=0.01, lowest=1e-6):
+        self.precision = precision
+        self.lowest = lowest
+        self._log_base = math.log1p(precision)
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.slowest = None
+        self.retries = 0
+        self.uncorrected = None
+        self.verdicts = {}
+
+    def _bucket(self, value):
+        if value <= self.lowest:
+            return 0
+        return int(math.log(value / self.lowest) / self._log_base) + 1
+
+    def _bucket_value(self, bucket):
+        # Highest value a bucket can hold, so percentiles are never under-reported
+        if bucket == 0:
+            return self.lowest
+        return self.lowest * math.exp(bucket * self._log_base)
+
+    def record(self, value, count=1, breakdown=None, retries=0):
+        """Records a latency sample in seconds, with its phase breakdown and retries if known."""
+        self.retries += retries
+        if breakdown is not None and (self.max is None or value >= self.max):
+            self.slowest = breakdown
+        bucket = self._bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """Adds every sample of another histogram with the same precision."""
+        for bucket, count in other.counts.items():
+            self.counts[bucket] = self.counts.get(bucket, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.retries += other.retries
+        if self.uncorrected is not None and other.uncorrected is not None:
+            self.uncorrected.merge(other.uncorrected)
+        if other.slowest is not None and (self.max is None or other.max >= self.max):
+            self.slowest = other.slowest
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percentile):
+        """Returns the latency under which `percentile` percent of the samples fall. Returns None if empty."""
+        if not self.count:
+            return None
+        rank = max(math.ceil(percentile / 100 * self.count), 1)
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(max(self._bucket_value(bucket), self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def summary(self, percentiles=REPORTED_PERCENTILES):
+        """Returns a one-line summary of the distribution in milliseconds."""
+        if not self.count:
+            return "n=0"
+        parts = ["n={}".format(self.count), "min={:.2f}ms".format(self.min*1000)]
+        parts += ["p{:g}={:.2f}ms".format(p, self.percentile(p)*1000) for p in percentiles]
+        parts.append("max={:.2f}ms".format(self.max*1000))
+        if self.retries:
+            parts.append("retries={}".format(self.retries))
+        if self.uncorrected is not None:
+            parts.append("(uncorrected: {})".format(self.uncorrected.summary(percentiles)))
+        if self.verdicts:
+            parts.append("[{}]".format("; ".join(verdict.summary() for _, verdict in sorted(self.verdicts.items()))))
+        return " ".join(parts)
+
+    def to_dict(self, percentiles=REPORTED_PERCENTILES):
+        """Returns the summary statistics as a dictionary of seconds."""
+        summary = {'count': self.count, 'min': self.min, 'mean': self.mean, 'max': self.max, 'retries': self.retries}
+        summary.update({'p{:g}'.format(p): self.percentile(p) for p in percentiles})
+        if self.slowest is not None:
+            summary['slowest'] = self.slowest._asdict()
+        if self.uncorrected is not None:
+            summary['uncorrected'] = self.uncorrected.to_dict(percentiles)
+        if self.verdicts:
+            summary['verdicts'] = {'p{:g}'.format(p): verdict._asdict() for p, verdict in self.verdicts.items()}
+        return summary
+
+
+def response_latency(response):
+    """A simple function that returns the latency of a response in seconds.
+
+    That is the sum of its phase timings, body download included, when the
+    client measured them, and the time until its headers were parsed
+    otherwise."""
+    timings = getattr(response, 'timings', None)
+    if timings is not None:
+        return timings.total
+    return response.elapsed.total_seconds()
+
+
+class Schedule:
+    """An intended send schedule for a loop of requests, correcting their latencies for coordinated omission.
+
+    A loop that sends a request only once the previous one returned sends
+    nothing while the server stalls, so a stall is measured once instead of
+    in every request that should have been sent during it. With an
+    `interval`, requests are meant to leave every interval seconds: `send`
+    waits for the intended time, a request that leaves late because the
+    previous one stalled has its lateness added to its latency. Every due
+    send is still made, so a stall shows in the latency of each request that
+    waited for it, and no samples are backfilled for it. Without an interval
+    nothing was due at any set time, so latencies are recorded as measured.
+    """
+
+    def __init__(self, interval=None, precision=0.01, clock=time.perf_counter, sleep=time.sleep):
+        self.interval = interval
+        self.precision = precision
+        self.clock = clock
+        self.sleep = sleep
+        self._samples = []
+        self._intended = None
+        self.last = None
+
+    def send(self, send):
+        """Calls send() at its intended time and records its latency. Returns the response.
+
+        Its corrected latency is kept as `last`."""
+        now = self.clock()
+        if self._intended is None:
+            self._intended = now
+        elif now < self._intended:
+            self.sleep(self._intended - now)
+        lateness = max(self.clock() - self._intended, 0.0) if self.interval else 0.0
+        response = send()
+        latency = response_latency(response)
+        self._samples.append((latency, lateness, getattr(response, 'timings', None), getattr(response, 'retries', 0)))
+        self.last = latency + lateness
+        if self.interval:
+            self._intended += self.interval
+        return response
+
+    def __len__(self):
+        return len(self._samples)
+
+    def histogram(self):
+        """Returns the corrected latency histogram, with the uncorrected one as its `uncorrected` if they differ."""
+        corrected = LatencyHistogram(self.precision)
+        uncorrected = LatencyHistogram(self.precision)
+        if self.interval:
+            corrected.uncorrected = uncorrected
+        for latency, lateness, breakdown, retries in self._samples:
+            uncorrected.record(latency, breakdown=breakdown, retries=retries)
+            corrected.record(latency + lateness, breakdown=breakdown, retries=retries)
+        return corrected
+
+
+class LatencySampler:
+    """Sends a request repeatedly and records every latency in a histogram.
+
+    Sampling stops after `samples` requests or, when `budget` (seconds) is
+    set, once the budget is spent, whichever comes first. At least one
+    request is always sent. Requests follow a Schedule, one every `interval`
+    seconds or back to back, and the histogram is corrected for coordinated
+    omission.
+
+    With a `confidence` (e.g. 0.95), requests measured against thresholds are
+    sampled sequentially instead: sampling goes on until every percentile is
+    met, or one violated, with that confidence, or until `max_samples`.
+    """
+
+    def __init__(self, samples=5, budget=None, precision=0.01, interval=None, confidence=None, max_samples=30,
+            tolerance=DEFAULT_TOLERANCE):
+        self.samples = samples
+        self.budget = budget
+        self.precision = precision
+        self.interval = interval
+        self.confidence = confidence
+        self.max_samples = max_samples
+        self.tolerance = tolerance
+
+    def schedule(self):
+        """Returns a new Schedule for a loop of requests measured by hand."""
+        return Schedule(self.interval, self.precision)
+
+    def __call__(self, send, samples=None, thresholds=None):
+        """Calls send() until sampling stops. Returns the first response and the latency histogram.
+
+        thresholds, e.g. {95: 1.0, 99: 2.0}, are those the latency will be
+        verified against, for sequential sampling."""
+        sequential = self.confidence is not None and bool(thresholds)
+        samples = self.max_samples if sequential else self.samples if samples is None else samples
+        tests = sequential_tests(thresholds, self.confidence, self.tolerance) if sequential else {}
+        schedule = self.schedule()
+        deadline = None if self.budget is None else time.monotonic() + self.budget
+        first_response = None
+        while True:
+            response = schedule.send(send)
+            if first_response is None:
+                first_response = response
+            for test in tests.values():
+                test.record(schedule.last)
+            if len(schedule) >= samples or (deadline is not None and time.monotonic() >= deadline) \
+                    or (tests and settled(tests)):
+                histogram = schedule.histogram()
+                histogram.verdicts = {percentile: test.verdict() for percentile, test in tests.items()}
+                return first_response, histogram
+
+    def single(self, *responses):
+        """Returns a histogram of responses that were sent only once (e.g. requests creating resources)."""
+        histogram = LatencyHistogram(self.precision)
+        for response in responses:
+            histogram.record(response_latency(response), breakdown=getattr(response, 'timings', None),
+                retries=getattr(response, 'retries', 0))
+        return histogram
+
+
+def latency_errors(histogram, thresholds):
+    """A function that returns a Performance Error message for every percentile over its threshold.
+
+    thresholds maps percentiles to seconds, e.g. {95: 1.0, 99: 2.0}. When
+    known, the phase breakdown of the slowest request is appended, to tell a
+    slow network from a slow server. A percentile sampled sequentially is
+    judged by its verdict, or by its value if the samples ran out first."""
+    errors = []
+    for percentile, threshold in sorted(thresholds.items()):
+        verdict = histogram.verdicts.get(percentile)
+        decision = verdict.decision if verdict is not None and verdict.threshold == threshold else None
+        value = histogram.percentile(percentile)
+        if decision == VIOLATED:
+            message = "Performance Error: p{:g} is over its {:.2f}ms threshold".format(percentile, threshold*1000)
+        elif decision is None and value is not None and value > threshold:
+            message = "Performance Error: p{:g} took {:.2f}ms. Threshold is {:.2f}ms"\
+                .format(percentile, value*1000, threshold*1000)
+        else:
+            continue
+        message += " ({})".format(histogram.summary())
+        if histogram.slowest is not None:
+            message += ". Slowest request: " + histogram.slowest.summary()
+        errors.append(message)
+    return errors
@@ -0,0 +1,282 @@
+"""Open-loop load generator for the users endpoint.
+
+Run it from the repository main folder, e.g. 200 requests per second for
+30 seconds with 70% list reads, 20% creates and 10% updates:
+
+    python3 gorest_test/loadgen.py --rate 200 --duration 30 --mix get=70,post=20,put=10
+
+Requests are sent on a fixed schedule (or Poisson arrivals) whether or not
+earlier requests have completed, and latency is measured from the time a
+request was scheduled to be sent. A server stall therefore shows up in the
+latency of every request that should have been sent during it, instead of
+silently slowing the generator down (coordinated omission).
+"""
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import sys
+import time
+
+import requests
+
+from client import ApiClient, AsyncClient
+from events import sink_from_env
+from fake_server import FakeGorestServer, options_from_env
+from latency import LatencyHistogram, latency_errors
+from provisioning import ProvisionedUser, create_user
+from schema import validate_users
+from slo import DEFAULT_PATH as SLO_PATH, error_rate_errors, load_slo, throughput_errors
+from testdata import OwnershipRegistry, PayloadFactory
+from tokens import print_usage, read_tokens
+from verification import (MAIN_URL, REQUEST_TIMEOUT, USERS_PATH, VALID_PAYLOAD, is_proper_json, read_token, same_user,
+    shared_token_pool, token_usage, user_resource_delete)
+
+OPERATIONS = ('get', 'post', 'put')
+ENDPOINTS = {
+    'get': 'GET /public-api/users',
+    'post': 'POST /public-api/users',
+    'put': 'PUT /public-api/users/{id}',
+}
+
+
+def parse_mix(spec):
+    """A function that turns a spec such as 'get=70,post=20,put=10' into a dictionary of weights."""
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip().lower()
+        if name not in OPERATIONS:
+            raise ValueError("Unknown operation '{}'. Expected one of {}".format(name, ", ".join(OPERATIONS)))
+        mix[name] = float(weight or 1)
+    return mix
+
+def arrival_times(rate, duration, poisson=False, rng=None):
+    """A generator of send times (seconds from the start) at a target arrival rate."""
+    rng = rng or random.Random()
+    offset = 0.0
+    count = 0
+    while True:
+        if poisson:
+            offset += rng.expovariate(rate)
+        else:
+            offset = count / rate
+        if offset >= duration:
+            return
+        count += 1
+        yield offset
+
+
+def get_users(client, user_endpoint, payload_factory, user_urls):
+    """Lists users and validates every record. Returns an error message or None."""
+    response = client.get(user_endpoint)
+    if response.status_code != requests.codes.ok:
+        return "HTTP {}".format(response.status_code)
+    response_dict = is_proper_json(response)
+    if response_dict == False or response_dict['code'] != requests.codes.ok:
+        return "code {}".format(response_dict and response_dict['code'])
+    if validate_users(response_dict['data']).invalid:
+        return "wrong datatypes"
+    return None
+
+def post_user(client, user_endpoint, payload_factory, user_urls):
+    """Creates a user from a fresh valid payload and validates it. Returns an error message or None."""
+    payload = payload_factory.make(VALID_PAYLOAD)
+    response = client.post(user_endpoint, data=payload)
+    if response.status_code != requests.codes.ok:
+        return "HTTP {}".format(response.status_code)
+    response_dict = is_proper_json(response)
+    if response_dict == False or response_dict['code'] != 201:
+        return "code {}".format(response_dict and response_dict['code'])
+    if not same_user(response_dict['data'], payload):
+        return "payload mismatch"
+    return None
+
+def put_user(client, user_endpoint, payload_factory, user_urls):
+    """Updates one of the provisioned users and validates the result. Returns an error message or None."""
+    payload = payload_factory.make(VALID_PAYLOAD)
+    response = client.put(random.choice(user_urls), data=payload)
+    if response.status_code != requests.codes.ok:
+        return "HTTP {}".format(response.status_code)
+    response_dict = is_proper_json(response)
+    if response_dict == False or response_dict['code'] != requests.codes.ok:
+        return "code {}".format(response_dict and response_dict['code'])
+    if not same_user(response_dict['data'], payload):
+        return "payload mismatch"
+    return None
+
+OPERATION_FUNCTIONS = {'get': get_users, 'post': post_user, 'put': put_user}
+
+
+class EndpointStats:
+    """Latency and outcome counts of one endpoint during a load run."""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.service_time = LatencyHistogram()
+        self.count = 0
+        self.errors = collections.Counter()
+
+    def record(self, latency, service_time, error):
+        self.count += 1
+        self.latency.record(latency)
+        self.service_time.record(service_time)
+        if error is not None:
+            self.errors[error] += 1
+
+    def to_dict(self, duration):
+        error_count = sum(self.errors.values())
+        return {
+            'requests': self.count,
+            'throughput': self.count / duration if duration else 0.0,
+            'error_rate': error_count / self.count if self.count else 0.0,
+            'errors': dict(self.errors),
+            'latency': self.latency.to_dict(),
+            'service_time': self.service_time.to_dict(),
+        }
+
+
+class LoadGenerator:
+    """Drives a request mix at a target arrival rate with open-loop scheduling."""
+
+    def __init__(self, async_client, user_endpoint, payload_factory, mix, user_urls=(), rng=None):
+        self.async_client = async_client
+        self.user_endpoint = user_endpoint
+        self.payload_factory = payload_factory
+        self.user_urls = list(user_urls)
+        self.rng = rng or random.Random()
+        self.operations = [name for name in mix if mix[name] > 0]
+        self.weights = [mix[name] for name in self.operations]
+        if 'put' in self.operations and not self.user_urls:
+            raise ValueError("PUT requests need at least one provisioned user")
+        self.stats = {name: EndpointStats() for name in self.operations}
+
+    async def send(self, name, intended):
+        started = time.perf_counter()
+        try:
+            error = await self.async_client.run(OPERATION_FUNCTIONS[name], self.async_client.client,
+                self.user_endpoint, self.payload_factory, self.user_urls)
+        except requests.RequestException as e:
+            error = type(e).__name__
+        finished = time.perf_counter()
+        # Latency counts from the scheduled send time, service time from the actual one
+        self.stats[name].record(finished - intended, finished - started, error)
+
+    async def run(self, rate, duration, poisson=False):
+        """Sends requests for duration seconds at rate requests per second. Returns the elapsed time."""
+        start = time.perf_counter()
+        tasks = []
+        for offset in arrival_times(rate, duration, poisson, self.rng):
+            intended = start + offset
+            delay = intended - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            name = self.rng.choices(self.operations, self.weights)[0]
+            tasks.append(asyncio.ensure_future(self.send(name, intended)))
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - start
+
+    def report(self, duration):
+        """Returns the per-endpoint results of the run as a dictionary."""
+        return {ENDPOINTS[name]: stats.to_dict(duration) for name, stats in self.stats.items()}
+
+    def slo_errors(self, duration, slo):
+        """Returns an error message for every latency, error-rate or throughput objective an endpoint missed."""
+        errors = []
+        for name, stats in self.stats.items():
+            objective = slo.objective(ENDPOINTS[name])
+            missed = latency_errors(stats.latency, objective.latency)
+            missed += error_rate_errors(sum(stats.errors.values()) / stats.count if stats.count else 0.0, objective)
+            missed += throughput_errors(stats.count / duration if duration else 0.0, objective)
+            errors.extend("{}: {}".format(ENDPOINTS[name], error) for error in missed)
+        return errors
+
+
+async def provision_users(async_client, user_endpoint, payload_factory, count):
+    """A coroutine that concurrently creates count users for PUT traffic and returns their URLs."""
+    results = await asyncio.gather(*[async_client.run(create_user, async_client.client, user_endpoint,
+        payload_factory.make(VALID_PAYLOAD)) for _ in range(count)], return_exceptions=True)
+    return [user.url for user in results if isinstance(user, ProvisionedUser)]
+
+async def delete_owned(async_client, registry):
+    """A coroutine that deletes every user in registry concurrently."""
+    await asyncio.gather(*[async_client.run(user_resource_delete, async_client.client, url) for url in registry.owned()])
+
+def print_report(report, duration, out=sys.stdout):
+    """A function that prints the per-endpoint throughput, error rate and latency distribution."""
+    out.write("{:<30} {:>8} {:>9} {:>8} {:>10} {:>10} {:>10} {:>10}\n".format(
+        'endpoint', 'requests', 'req/s', 'errors', 'p50', 'p95', 'p99', 'max'))
+    for endpoint, result in report.items():
+        latency = result['latency']
+        out.write("{:<30} {:>8} {:>9.1f} {:>7.2f}% {:>8.2f}ms {:>8.2f}ms {:>8.2f}ms {:>8.2f}ms\n".format(
+            endpoint, result['requests'], result['throughput'], result['error_rate']*100,
+            (latency['p50'] or 0)*1000, (latency['p95'] or 0)*1000, (latency['p99'] or 0)*1000, (latency['max'] or 0)*1000))
+        for error, count in sorted(result['errors'].items()):
+            out.write("    {} x {}\n".format(count, error))
+    out.write("Elapsed {:.2f}s\n".format(duration))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Drives the users endpoint at a target request rate.")
+    parser.add_argument('--rate', type=float, default=50.0, help="target arrival rate in requests per second")
+    parser.add_argument('--duration', type=float, default=10.0, help="length of the run in seconds")
+    parser.add_argument('--mix', default='get=70,post=20,put=10', help="request mix, e.g. get=70,post=20,put=10")
+    parser.add_argument('--poisson', action='store_true', help="Poisson arrivals instead of a fixed interval")
+    parser.add_argument('--concurrency', type=int, default=64, help="maximum number of requests in flight")
+    parser.add_argument('--users', type=int, default=10, help="users provisioned up front for PUT traffic")
+    parser.add_argument('--report', help="write the results as JSON to this file")
+    parser.add_argument('--url', default=os.environ.get('GOREST_URL', MAIN_URL), help="main url of the server under test")
+    parser.add_argument('--fake', action='store_true', help="run against a local fake server (GOREST_FAKE_* knobs apply)")
+    parser.add_argument('--slo', default=os.environ.get('GOREST_SLO', SLO_PATH),
+        help="SLO file the results are checked against")
+    args = parser.parse_args(argv)
+    mix = parse_mix(args.mix)
+    slo = load_slo(args.slo, 'fake' if args.fake else args.url)
+
+    fake_server = None
+    if args.fake:
+        fake_server = FakeGorestServer(**options_from_env(os.environ)).start()
+        args.url, token = fake_server.url, fake_server.token
+    else:
+        token = read_token()
+        if token is None:
+            sys.exit('Token file not found. Hint: run setup.py again')
+
+    user_endpoint = args.url + USERS_PATH
+    registry = OwnershipRegistry()
+    # Several tokens share the load, so the rate is not capped by one account's limit
+    token_pool = shared_token_pool(sorted(fake_server.tokens) if fake_server is not None else read_tokens(os.environ))
+    client = ApiClient(token=token, pool_size=args.concurrency, timeout=REQUEST_TIMEOUT, registry=registry,
+        token_pool=token_pool, events=sink_from_env(os.environ))
+    async_client = AsyncClient(client, concurrency=args.concurrency)
+    payload_factory = PayloadFactory()
+    try:
+        user_urls = asyncio.run(provision_users(async_client, user_endpoint, payload_factory, args.users)) if mix.get('put') else []
+        generator = LoadGenerator(async_client, user_endpoint, payload_factory, mix, user_urls)
+        duration = asyncio.run(generator.run(args.rate, args.duration, args.poisson))
+        report = generator.report(duration)
+        slo_errors = generator.slo_errors(duration, slo)
+        print_report(report, duration)
+        if token_pool is not None:
+            print_usage(token_pool.report(), sys.stdout)
+        for error in slo_errors:
+            print("SLO Error: " + error)
+        if args.report:
+            with open(args.report, 'w') as f:
+                json.dump({'rate': args.rate, 'duration': duration, 'mix': mix, 'endpoints': report,
+                    'tokens': token_usage(), 'slo_errors': slo_errors}, f, indent=2)
+    finally:
+        # Delete every user this run created
+        asyncio.run(delete_owned(async_client, registry))
+        async_client.close()
+        client.close()
+        if client.events is not None:
+            client.events.close()
+        if fake_server is not None:
+            fake_server.stop()
+    return 1 if slo_errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
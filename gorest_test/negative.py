@@ -0,0 +1,170 @@
+import asyncio
+import collections
+import itertools
+import random
+
+import requests
+
+from schema import USER_SCHEMA
+
+Mutation = collections.namedtuple('Mutation', ['field', 'kind', 'value'])
+Behavior = collections.namedtuple('Behavior', ['signature', 'cases'])
+
+MISSING = object()
+WRONG_TYPES = (('int', 1), ('float', 1.5), ('bool', True), ('list', ['x']), ('object', {'value': 'x'}))
+MALFORMED_EMAILS = ('plainaddress', '@example.com', 'user@', 'user@@example.com', 'user name@example.com',
+    'user@example', 'user@.com', 'user@example..com')
+# Lengths probed one past by the too_long cases. Not part of USER_SCHEMA, as the API does not document them
+MAX_LENGTHS = {'name': 200, 'email': 200}
+
+
+def field_mutations(field, spec):
+    """A function that returns the invalid values of a field derived from its schema spec, as Mutations."""
+    mutations = [Mutation(field, 'missing', MISSING), Mutation(field, 'null', None)]
+    if spec['type'] is not str:
+        return mutations + [Mutation(field, 'type:str', 'x')]
+    mutations += [Mutation(field, 'type:' + name, value) for name, value in WRONG_TYPES]
+    mutations.append(Mutation(field, 'empty', ''))
+    if spec.get('min_length', 0) > 1:
+        mutations.append(Mutation(field, 'too_short', 'a@b.c'[:spec['min_length'] - 1]))
+    if field in MAX_LENGTHS:
+        # Longest value plus one, kept well-formed otherwise
+        suffix = '@example.com' if 'contains' in spec else ''
+        mutations.append(Mutation(field, 'too_long', 'x' * (MAX_LENGTHS[field] + 1 - len(suffix)) + suffix))
+    if spec.get('contains') == '@':
+        mutations += [Mutation(field, 'malformed', value) for value in MALFORMED_EMAILS]
+    for value in spec.get('enum', ()):
+        mutations += [Mutation(field, 'enum', variant) for variant in (value.lower(), value.upper(), value + ' ')]
+    if 'enum' in spec:
+        mutations.append(Mutation(field, 'enum', 'Other'))
+    return mutations
+
+def generate_cases(template, schema=USER_SCHEMA, partial=False, order=2, budget=None, rng=None):
+    """A function that derives invalid payload cases for the fields of template from schema.
+
+    Every single-field mutation is a case, and so are combinations of
+    mutations on up to `order` fields. When budget is set, the single-field
+    cases are always kept and combinations are sampled to fill the budget.
+    With partial (PUT), missing fields are not invalid and are not generated.
+    Each case is a tuple of Mutations."""
+    rng = rng or random.Random(0)
+    fields = [field for field in schema if field in template]
+    per_field = {field: [mutation for mutation in field_mutations(field, schema[field])
+        if not (partial and mutation.kind == 'missing')] for field in fields}
+    cases = [(mutation,) for field in fields for mutation in per_field[field]]
+    combinations = itertools.chain.from_iterable(itertools.product(*(per_field[field] for field in subset))
+        for size in range(2, order + 1) for subset in itertools.combinations(fields, size))
+    if budget is None:
+        return cases + list(combinations)
+    # Reservoir sampling keeps memory bounded by the budget, whatever the order
+    room = max(budget - len(cases), 0)
+    sample = []
+    for index, case in enumerate(combinations):
+        if len(sample) < room:
+            sample.append(case)
+        else:
+            slot = rng.randrange(index + 1)
+            if slot < room:
+                sample[slot] = case
+    return cases + sample
+
+def apply_case(payload, case):
+    """A simple function that returns a copy of payload with the mutations of case applied."""
+    mutated = dict(payload)
+    for mutation in case:
+        if mutation.value is MISSING:
+            mutated.pop(mutation.field, None)
+        else:
+            mutated[mutation.field] = mutation.value
+    return mutated
+
+def describe_case(case):
+    """A simple function that describes a case, e.g. 'email=malformed('user@'), gender=type:int(1)'."""
+    return ", ".join("{}={}".format(mutation.field, mutation.kind) if mutation.value is MISSING
+        else "{}={}({!r:.20})".format(mutation.field, mutation.kind, mutation.value) for mutation in case)
+
+
+async def _send_cases(async_client, method, url, payloads):
+    async def send(payload):
+        try:
+            return await async_client.request(method, url, json=payload)
+        except requests.RequestException as e:
+            return e
+    return await asyncio.gather(*[send(payload) for payload in payloads])
+
+def run_cases(async_client, method, url, cases, payload_factory, template):
+    """A function that sends every case concurrently as a JSON body. Returns (case, response) pairs.
+
+    Each case starts from a fresh copy of template with a unique email, so
+    cases never collide with each other or with existing users. The response
+    is the exception raised instead when the request failed."""
+    payloads = [apply_case(payload_factory.make(template), case) for case in cases]
+    return list(zip(cases, asyncio.run(_send_cases(async_client, method, url, payloads))))
+
+
+def response_signature(response):
+    """A function that returns what a response did, stripped of anything specific to the request.
+
+    That is the HTTP status, the envelope code and, for field errors, the
+    sorted (field, message) pairs."""
+    if isinstance(response, Exception):
+        return (type(response).__name__,)
+    try:
+        response_dict = response.json()
+    except ValueError:
+        return (response.status_code, None, None)
+    if not isinstance(response_dict, dict):
+        return (response.status_code, None, None)
+    data = response_dict.get('data')
+    field_errors = None
+    if isinstance(data, list) and all(isinstance(error, dict) for error in data):
+        field_errors = tuple(sorted(((error.get('field'), error.get('message')) for error in data), key=repr))
+    return (response.status_code, response_dict.get('code'), field_errors)
+
+def is_rejected(signature):
+    """A simple function that returns if a signature is a well-formed 422 rejection."""
+    return len(signature) == 3 and signature[0] == requests.codes.ok and signature[1] == 422 and bool(signature[2])
+
+def group_behaviors(results):
+    """A function that groups (case, response) pairs by response signature. Returns Behaviors, most common first."""
+    grouped = collections.OrderedDict()
+    for case, response in results:
+        grouped.setdefault(response_signature(response), []).append(case)
+    return sorted((Behavior(signature, cases) for signature, cases in grouped.items()), key=lambda b: -len(b.cases))
+
+def describe_signature(signature):
+    """A simple function that describes a response signature, e.g. 'HTTP 200, code 422, email has already been taken'."""
+    if len(signature) == 1:
+        return signature[0]
+    outcome = "HTTP {}, code {}".format(signature[0], signature[1])
+    if signature[2]:
+        outcome += ", " + "; ".join("{} {}".format(field, message) for field, message in signature[2])
+    return outcome
+
+def describe_behavior(behavior, examples=3):
+    """A simple function that describes a Behavior with a few example cases."""
+    return "{} case(s): {}. e.g. {}".format(len(behavior.cases), describe_signature(behavior.signature),
+        " | ".join(describe_case(case) for case in behavior.cases[:examples]))
+
+def _mutation_key(mutation):
+    # Values such as lists are not hashable
+    return mutation.field, mutation.kind, repr(mutation.value)
+
+def inconsistent_cases(results):
+    """A function that returns the combined cases whose field errors are not the union of their single-field cases' errors.
+
+    Only rejected cases are compared: any other answer is already reported by the behavior grouping."""
+    singles = {}
+    for case, response in results:
+        if len(case) == 1:
+            signature = response_signature(response)
+            if is_rejected(signature):
+                singles[_mutation_key(case[0])] = set(signature[2])
+    inconsistent = []
+    for case, response in results:
+        if len(case) > 1 and all(_mutation_key(mutation) in singles for mutation in case):
+            signature = response_signature(response)
+            expected = set().union(*(singles[_mutation_key(mutation)] for mutation in case))
+            if is_rejected(signature) and set(signature[2]) != expected:
+                inconsistent.append(case)
+    return inconsistent
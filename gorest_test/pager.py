@@ -0,0 +1,83 @@
+import collections
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from latency import LatencyHistogram, response_latency
+
+Page = collections.namedtuple('Page', ['number', 'status_code', 'code', 'users', 'latency'])
+
+
+class PageStats:
+    """Per-page latency and throughput of a paginated traversal."""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.pages = 0
+        self.users = 0
+        self.elapsed = 0.0
+
+    @property
+    def pages_per_second(self):
+        return self.pages / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        """Returns a one-line summary of the traversal."""
+        return "{} pages, {} users in {:.2f}s ({:.1f} pages/s). Page latency: {}"\
+            .format(self.pages, self.users, self.elapsed, self.pages_per_second, self.latency.summary())
+
+
+def fetch_page(client, url, number, params=None):
+    """A simple function that fetches one page of a collection and returns it as a Page."""
+    page_params = dict(params or {})
+    page_params['page'] = number
+    response = client.get(url, params=page_params)
+    latency = response_latency(response)
+    try:
+        response_dict = response.json()
+    except ValueError:
+        return Page(number, response.status_code, None, [], latency), None
+    pagination = (response_dict.get('meta') or {}).get('pagination') or {}
+    return Page(number, response.status_code, response_dict.get('code'), response_dict.get('data') or [], latency), \
+        pagination.get('pages')
+
+def iter_pages(client, url, params=None, stats=None, max_pages=None, prefetch=True):
+    """A generator that walks every page of a collection, yielding one Page at a time.
+
+    The next page is requested on a background thread while the caller
+    processes the current one, and only those two pages are ever held in
+    memory, whatever the size of the collection. Traversal stops after the
+    last page reported by meta.pagination, at the first page that fails, or
+    after max_pages pages.
+    """
+    stats = stats if stats is not None else PageStats()
+    start = time.perf_counter()
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        page, total_pages = fetch_page(client, url, 1, params)
+        number = 1
+        while True:
+            last = (page.code != 200 or total_pages is None or number >= total_pages
+                or (max_pages is not None and number >= max_pages))
+            upcoming = None
+            if not last:
+                if executor is not None:
+                    # In the caller's context, so the page is sent under its test, deadline and token
+                    upcoming = executor.submit(contextvars.copy_context().run, fetch_page, client, url, number + 1,
+                        params)
+                else:
+                    upcoming = fetch_page(client, url, number + 1, params)
+
+            stats.pages += 1
+            stats.users += len(page.users)
+            stats.latency.record(page.latency)
+            yield page
+            stats.elapsed = time.perf_counter() - start
+            if last:
+                return
+            page, _ = upcoming.result() if executor is not None else upcoming
+            number += 1
+    finally:
+        stats.elapsed = time.perf_counter() - start
+        if executor is not None:
+            executor.shutdown(wait=False)
@@ -0,0 +1,120 @@
+import asyncio
+import collections
+import queue
+import threading
+
+import requests
+
+ProvisionedUser = collections.namedtuple('ProvisionedUser', ['id', 'url', 'payload'])
+
+
+class ProvisioningError(Exception):
+    """Raised when a user could not be created for the pool."""
+
+
+def create_user(client, user_endpoint, payload):
+    """A function that creates a user from payload and returns it as a ProvisionedUser."""
+    response = client.post(user_endpoint, data=payload)
+    try:
+        response_dict = response.json()
+    except ValueError:
+        response_dict = None
+    if response.status_code != requests.codes.ok or not isinstance(response_dict, dict) or response_dict.get('code') != 201:
+        raise ProvisioningError("Could not create user {} (HTTP {}, code {})".format(payload.get('email'),
+            response.status_code, response_dict.get('code') if isinstance(response_dict, dict) else None))
+    user_id = response_dict['data']['id']
+    return ProvisionedUser(user_id, user_endpoint + "/{}".format(user_id), payload)
+
+
+class CleanupQueue:
+    """Collects resources to delete and deletes them all concurrently at the end of the session.
+
+    Tests defer their cleanup here instead of deleting inline, which keeps
+    DELETE round trips off their critical path and out of their timings.
+    """
+
+    def __init__(self, async_client, delete):
+        self.async_client = async_client
+        self.delete = delete
+        self._lock = threading.Lock()
+        self._urls = []
+
+    def defer(self, url):
+        """Schedules the resource at url for deletion."""
+        with self._lock:
+            if url not in self._urls:
+                self._urls.append(url)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._urls)
+
+    async def _drain(self, urls):
+        async def delete(url):
+            try:
+                return url, await self.async_client.run(self.delete, self.async_client.client, url)
+            except requests.RequestException:
+                return url, False
+        return await asyncio.gather(*[delete(url) for url in urls])
+
+    def drain(self):
+        """Deletes every deferred resource concurrently. Returns the URLs that could not be deleted."""
+        with self._lock:
+            urls, self._urls = self._urls, []
+        if not urls:
+            return []
+        return [url for url, deleted in asyncio.run(self._drain(urls)) if not deleted]
+
+
+class UserPool:
+    """A pool of users created up front, concurrently, and handed out to tests.
+
+    Every user handed out is scheduled on the cleanup queue, so tests never
+    create or delete their users inline. When the pool runs dry, users are
+    created on demand.
+    """
+
+    def __init__(self, async_client, user_endpoint, payload_factory, template, cleanup_queue):
+        self.async_client = async_client
+        self.user_endpoint = user_endpoint
+        self.payload_factory = payload_factory
+        self.template = template
+        self.cleanup_queue = cleanup_queue
+        self._users = queue.Queue()
+
+    async def _provision(self, payloads):
+        return await asyncio.gather(*[self.async_client.run(create_user, self.async_client.client, self.user_endpoint, payload)
+            for payload in payloads], return_exceptions=True)
+
+    def provision(self, count):
+        """Creates count users concurrently and adds them to the pool. Returns the errors of failed creations."""
+        # Payloads are built up front so their emails do not depend on completion order
+        payloads = [self.payload_factory.make(self.template) for _ in range(count)]
+        errors = []
+        for result in asyncio.run(self._provision(payloads)):
+            if isinstance(result, ProvisionedUser):
+                self._users.put(result)
+            else:
+                errors.append(result)
+        return errors
+
+    def acquire(self):
+        """Returns an unused user from the pool, creating one if the pool is empty."""
+        try:
+            user = self._users.get_nowait()
+        except queue.Empty:
+            user = create_user(self.async_client.client, self.user_endpoint, self.payload_factory.make(self.template))
+        self.cleanup_queue.defer(user.url)
+        return user
+
+    def release_all(self):
+        """Schedules every user that was never handed out for deletion."""
+        while True:
+            try:
+                user = self._users.get_nowait()
+            except queue.Empty:
+                return
+            self.cleanup_queue.defer(user.url)
+
+    def __len__(self):
+        return self._users.qsize()
@@ -0,0 +1,102 @@
+import collections
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from digest import response_digest
+from negative import describe_signature, response_signature
+
+Attempt = collections.namedtuple('Attempt', ['response', 'latency'])
+
+CREATED = (requests.codes.ok, 201)
+OK = (requests.codes.ok, 200)
+DUPLICATE = (requests.codes.ok, 422, (('email', 'has already been taken'),))
+# Set by the server on every write, so never expected to converge
+VOLATILE_FIELDS = ('updated_at',)
+
+
+def fire_together(client, method, url, count, timeout=30.0, **kwargs):
+    """A function that sends count identical requests at the same moment. Returns their Attempts, in no particular order.
+
+    Each request gets a thread of its own and waits at a barrier until all
+    count are ready, so they leave together instead of as fast as a worker
+    pool hands them out. An Attempt holds the response (or the exception
+    raised instead) and its latency as seen by the caller, rate limit waits
+    and retries included."""
+    barrier = threading.Barrier(count, timeout=timeout)
+
+    def send():
+        barrier.wait()
+        start = time.perf_counter()
+        try:
+            response = client.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            response = e
+        return Attempt(response, time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=count) as executor:
+        # Each request sees the caller's context, e.g. the deadline of the test
+        futures = [executor.submit(contextvars.copy_context().run, send) for _ in range(count)]
+        return [future.result() for future in futures]
+
+def unexpected_problems(signatures, expected):
+    """A simple function that describes the signatures starting with none of expected, one per distinct signature with its count."""
+    unexpected = collections.Counter(signature for signature in signatures
+        if not any(signature[:len(prefix)] == prefix for prefix in expected))
+    return ["{} answered {}".format(count, describe_signature(signature)) for signature, count in unexpected.items()]
+
+def post_race_problems(attempts):
+    """A function that describes how a round of identical POSTs went wrong. Empty if it went right.
+
+    Exactly one request must create the user, and every other one must be
+    rejected because the email is taken."""
+    signatures = [response_signature(attempt.response) for attempt in attempts]
+    created = sum(1 for signature in signatures if signature[:2] == CREATED)
+    problems = []
+    if created == 0:
+        problems.append("no request created the user")
+    elif created > 1:
+        problems.append("{} requests created the same user".format(created))
+    return problems + unexpected_problems(signatures, (CREATED, DUPLICATE))
+
+def put_race_problems(attempts, final_response, payload):
+    """A function that describes how a round of identical PUTs went wrong. Empty if it went right.
+
+    Every request must succeed with the same body, and the user read
+    afterwards must hold the values of payload."""
+    signatures = [response_signature(attempt.response) for attempt in attempts]
+    problems = unexpected_problems(signatures, (OK,))
+    digests = {response_digest(attempt.response, VOLATILE_FIELDS) for attempt, signature in zip(attempts, signatures)
+        if signature[:2] == OK}
+    if len(digests) > 1:
+        problems.append("successful responses diverged into {} distinct bodies".format(len(digests)))
+    if final_response.status_code != requests.codes.ok or response_signature(final_response)[:2] != OK:
+        problems.append("the user could not be read back ({})".format(describe_signature(response_signature(final_response))))
+    else:
+        final = final_response.json()['data']
+        mismatched = ["{}={!r} (sent {!r})".format(field, final.get(field), value) for field, value in sorted(payload.items())
+            if final.get(field) != value]
+        if mismatched:
+            problems.append("the user ended up with " + ", ".join(mismatched))
+    return problems
+
+def created_urls(attempts):
+    """A simple function that returns the URLs of the users created by a round of POSTs."""
+    return [attempt.response.request.url.rstrip('/') + "/{}".format(attempt.response.json()['data']['id'])
+        for attempt in attempts if response_signature(attempt.response)[:2] == CREATED]
+
+def race_summary(method, width, rounds, contention):
+    """A function that returns a Race Error message for the rounds that misbehaved, or None if none did.
+
+    rounds holds the problems of every round, e.g. [[], ['2 requests created
+    the same user']], and contention the LatencyHistogram of every request
+    as seen by the caller."""
+    failed = [(index, problems) for index, problems in enumerate(rounds, 1) if problems]
+    if not failed:
+        return None
+    return "Race Error: {} of {} round(s) of {} concurrent {} requests misbehaved ({}). {}".format(len(failed),
+        len(rounds), width, method, contention.summary(),
+        " | ".join("Round {}: {}".format(index, "; ".join(problems)) for index, problems in failed))
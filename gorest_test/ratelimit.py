@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows: the bucket is then shared within the process only
+    fcntl = None
+
+
+def rate_limit_headers(response):
+    """A simple function that returns the (limit, remaining, reset) X-RateLimit-* headers of a response, or None."""
+    try:
+        return (int(response.headers['X-RateLimit-Limit']), int(response.headers['X-RateLimit-Remaining']),
+            float(response.headers['X-RateLimit-Reset']))
+    except (KeyError, ValueError):
+        return None
+
+def retry_after(response):
+    """A simple function that returns how many seconds a 429 response asks to wait. Defaults to one second."""
+    for header in ('Retry-After', 'X-RateLimit-Reset'):
+        try:
+            return max(float(response.headers[header]), 0.0)
+        except (KeyError, ValueError):
+            pass
+    return 1.0
+
+def default_state_file(token):
+    """A simple function that returns the bucket file shared by every process using token."""
+    digest = hashlib.sha1((token or '').encode('utf-8')).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), "gorest-ratelimit-{}.json".format(digest))
+
+
+class RateLimiter:
+    """A token bucket that paces requests to the server's advertised rate limit.
+
+    The bucket learns its size and refill rate from the X-RateLimit-*
+    headers of every response: the limit is the capacity, the limit spread
+    over the longest reset seen is the refill rate, and the remaining count
+    caps the tokens left. Until a response advertises a limit, requests are
+    not paced. A 429 empties the bucket until the server says to retry.
+
+    When state_file is set, the bucket is kept in that file under an
+    exclusive lock, so every thread and process using the same file (e.g.
+    pytest-xdist workers) shares one budget. Time is wall-clock so that
+    processes agree on it.
+    """
+
+    _process_lock = threading.Lock()
+
+    def __init__(self, state_file=None, clock=time.time, sleep=time.sleep):
+        self.state_file = state_file
+        self.clock = clock
+        self.sleep = sleep
+        self.waited = 0.0
+        self._state = self._initial_state()
+
+    @staticmethod
+    def _initial_state():
+        return {'tokens': None, 'capacity': None, 'rate': None, 'period': 0.0, 'updated': None, 'blocked_until': 0.0}
+
+    def _update(self, change):
+        """Applies change to the shared state under the locks and returns its result."""
+        with self._process_lock:
+            if self.state_file is None or fcntl is None:
+                return change(self._state)
+            with open(self.state_file, 'a+') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    try:
+                        state = json.loads(f.read())
+                    except ValueError:
+                        state = self._initial_state()
+                    result = change(state)
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    f.flush()
+                    return result
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refill(self, state, now):
+        if state['rate'] is not None and state['updated'] is not None:
+            state['tokens'] = min(state['capacity'], state['tokens'] + (now - state['updated']) * state['rate'])
+        state['updated'] = now
+
+    def _take(self, state):
+        now = self.clock()
+        self._refill(state, now)
+        if now < state['blocked_until']:
+            return state['blocked_until'] - now
+        if state['rate'] is None:
+            return 0.0
+        if state['tokens'] >= 1:
+            state['tokens'] -= 1
+            return 0.0
+        return (1 - state['tokens']) / state['rate']
+
+    def acquire(self, bound=None):
+        """Blocks until a request may be sent. Returns the seconds waited.
+
+        bound, if given, is called with every wait before it and returns the seconds to sleep, or raises to give up."""
+        waited = 0.0
+        while True:
+            wait = self._update(self._take)
+            if wait <= 0:
+                self.waited += waited
+                return waited
+            if bound is not None:
+                wait = bound(wait)
+            self.sleep(wait)
+            waited += wait
+
+    def observe(self, response):
+        """Adapts the bucket to the X-RateLimit-* headers of response, and backs off if it is a 429."""
+        headers = rate_limit_headers(response)
+        throttled = response.status_code == 429
+        if headers is None and not throttled:
+            return
+
+        def change(state):
+            now = self.clock()
+            self._refill(state, now)
+            if headers is not None:
+                limit, remaining, reset = headers
+                state['capacity'] = float(limit)
+                state['period'] = max(state['period'], reset)
+                state['rate'] = limit / state['period'] if state['period'] > 0 else None
+                tokens = state['tokens'] if state['tokens'] is not None else float(remaining)
+                # The server counted every request it saw, the bucket every request sent
+                state['tokens'] = min(tokens, float(remaining))
+            if throttled:
+                state['tokens'] = 0.0
+                state['blocked_until'] = max(state['blocked_until'], now + retry_after(response))
+        self._update(change)
@@ -0,0 +1,130 @@
+import collections
+import queue
+
+
+def needs(*kinds):
+    """A decorator that declares the kinds of resources a test takes, e.g. @needs('user')."""
+    def decorator(func):
+        func.needs = tuple(getattr(func, 'needs', ())) + kinds
+        return func
+    return decorator
+
+def produces(kind, count=1):
+    """A decorator that declares a test hands count resources of kind on once it is done, e.g. @produces('user').
+
+    count may name a fixture holding it instead, e.g. 'race_rounds'."""
+    def decorator(func):
+        func.produces = dict(getattr(func, 'produces', {}), **{kind: count})
+        return func
+    return decorator
+
+def exclusive(func):
+    """A decorator that declares a test must not run alongside any other, e.g. one comparing two reads of a collection."""
+    func.exclusive = True
+    return func
+
+def declared_needs(func):
+    """A simple function that returns how many resources of each kind a test needs, as a Counter."""
+    return collections.Counter(getattr(func, 'needs', ()))
+
+def declared_produces(func, values):
+    """A simple function that returns how many resources of each kind a test produces, as a Counter.
+
+    values resolves counts declared by fixture name, e.g. {'race_rounds': 3}."""
+    return collections.Counter({kind: values[count] if isinstance(count, str) else count
+        for kind, count in getattr(func, 'produces', {}).items()})
+
+def shortfall(funcs, values, kind):
+    """A simple function that returns how many resources of kind the tests need beyond what they produce."""
+    return max(sum(declared_needs(func)[kind] for func in funcs)
+        - sum(declared_produces(func, values)[kind] for func in funcs), 0)
+
+
+def resource_plan(funcs, values):
+    """A function that chains tests producing resources to the tests needing them.
+
+    Returns the edges of the dependency graph, mapping the index of every
+    test that needs a resource to the indexes of the tests it must wait for,
+    and the Counter of resources no test produces, to be provisioned up
+    front instead. Producers are handed out in order, one resource each, and
+    a test that needs resources itself never produces for another, so the
+    graph has no cycles."""
+    supply = collections.defaultdict(collections.deque)
+    for index, func in enumerate(funcs):
+        if declared_needs(func):
+            continue
+        for kind, count in declared_produces(func, values).items():
+            supply[kind].extend([index] * count)
+    edges = collections.defaultdict(set)
+    missing = collections.Counter()
+    for index, func in enumerate(funcs):
+        for kind, count in declared_needs(func).items():
+            for _ in range(count):
+                if supply[kind]:
+                    edges[index].add(supply[kind].popleft())
+                else:
+                    missing[kind] += 1
+    return dict(edges), missing
+
+def waited_for(edges, index):
+    """A simple function that returns the indexes of every test the test at index waits for, directly or not."""
+    seen, stack = set(), [index]
+    while stack:
+        for dependency in edges.get(stack.pop(), ()):
+            if dependency not in seen:
+                seen.add(dependency)
+                stack.append(dependency)
+    return seen
+
+def exclusive_plan(funcs, edges):
+    """A function that adds the edges keeping exclusive tests from overlapping any other to a dependency graph.
+
+    Every test an exclusive test does not wait for waits for it instead, so
+    it runs alone, as early as the tests it waits for allow. Returns the new
+    edges; the graph still has no cycles."""
+    edges = {index: set(dependencies) for index, dependencies in edges.items()}
+    for index, func in enumerate(funcs):
+        if not getattr(func, 'exclusive', False):
+            continue
+        before = waited_for(edges, index)
+        for other in range(len(funcs)):
+            if other != index and other not in before:
+                edges.setdefault(other, set()).add(index)
+    return edges
+
+
+class ResourceBroker:
+    """Resources handed on by the tests that created them to the tests that need them.
+
+    A test that creates a resource as a side effect offers it once it is
+    done with it, and the next test needing one takes it instead of creating
+    its own, saving both the create and the delete. Every resource is taken
+    at most once. Cleanup stays with whoever created it: offered resources
+    must already be scheduled for deletion.
+    """
+
+    def __init__(self):
+        self._resources = collections.defaultdict(queue.Queue)
+        self.offered = collections.Counter()
+        self.reused = collections.Counter()
+
+    def offer(self, kind, resource):
+        """Hands resource on to the next test needing one of kind."""
+        self.offered[kind] += 1
+        self._resources[kind].put(resource)
+
+    def take(self, kind, fallback=None):
+        """Returns a resource of kind offered by another test, or fallback() if none is left."""
+        try:
+            resource = self._resources[kind].get_nowait()
+        except queue.Empty:
+            if fallback is None:
+                raise LookupError("No {} resource available".format(kind))
+            return fallback()
+        self.reused[kind] += 1
+        return resource
+
+    def summary(self):
+        """Returns a one-line summary of the resources offered and reused, e.g. 'user: 4 offered, 4 reused'."""
+        return "; ".join("{}: {} offered, {} reused".format(kind, self.offered[kind], self.reused[kind])
+            for kind in sorted(self.offered)) or "no resources offered"
@@ -0,0 +1,109 @@
+import random
+import threading
+import time
+
+import requests
+
+from deadline import DeadlineExceeded
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+RETRY_STATUSES = (500, 502, 503, 504)
+RETRY_EXCEPTIONS = (requests.ConnectionError, requests.Timeout)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of sending a request while the circuit breaker is open."""
+
+
+class RetryPolicy:
+    """When and how long to wait before sending a failed request again.
+
+    A request is retried when it raised a connection error or timeout, or
+    got a 5xx status, as long as its method is one of `methods` (idempotent
+    ones by default) and fewer than `attempts` were made. Waits grow
+    exponentially from `backoff` up to `max_backoff`, with full jitter so
+    that concurrent clients do not retry in lockstep.
+    """
+
+    def __init__(self, attempts=3, backoff=0.1, max_backoff=2.0, methods=IDEMPOTENT_METHODS,
+            statuses=RETRY_STATUSES, rng=None):
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.methods = tuple(method.upper() for method in methods)
+        self.statuses = tuple(statuses)
+        self.rng = rng or random.Random()
+
+    def is_failure(self, response=None, error=None):
+        """Returns if an attempt failed because of the server, as counted by the circuit breaker.
+
+        A deadline only counts when the request was sent and timed out, not when the budget ran out before."""
+        if isinstance(error, DeadlineExceeded):
+            return error.sent
+        if error is not None:
+            return isinstance(error, RETRY_EXCEPTIONS) and not isinstance(error, CircuitOpenError)
+        return response.status_code in self.statuses
+
+    def is_retryable(self, response=None, error=None):
+        """Returns if an attempt failed in a way worth retrying. Deadline timeouts are not: no time is left to."""
+        return self.is_failure(response, error) and not isinstance(error, DeadlineExceeded)
+
+    def should_retry(self, method, attempt):
+        """Returns if a request that failed on its attempt-th try (from 1) may be sent again."""
+        return method.upper() in self.methods and attempt < self.attempts
+
+    def delay(self, attempt):
+        """Returns the seconds to wait after the attempt-th failed try."""
+        return self.rng.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+NO_RETRY = RetryPolicy(attempts=1)
+
+
+class CircuitBreaker:
+    """Fails requests fast once the server is clearly down.
+
+    After `threshold` consecutive failed attempts the circuit opens and every
+    request raises CircuitOpenError without being sent. After
+    `reset_timeout` seconds a single trial request is let through: the
+    circuit closes again if it succeeds, and stays open otherwise.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def before_request(self, url):
+        """Raises CircuitOpenError if url must not be sent to now."""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if self.clock() - self.opened_at >= self.reset_timeout and not self._trial:
+                self._trial = True
+                return
+        raise CircuitOpenError("Circuit open after {} consecutive failures. Not sending {}".format(self.failures, url))
+
+    def release(self):
+        """Lets another trial request through, when the attempt let through was never sent."""
+        with self._lock:
+            self._trial = False
+
+    def record(self, failed):
+        """Records the outcome of an attempt."""
+        with self._lock:
+            self._trial = False
+            if not failed:
+                self.failures = 0
+                self.opened_at = None
+                return
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = self.clock()
@@ -0,0 +1,291 @@
+"""Concurrent runner for the endpoint test matrix.
+
+Run it from the repository main folder:
+
+    python3 gorest_test/runner.py --concurrency 8 --scenario integrated
+
+Each test of test_positive.py and test_negative.py becomes a coroutine. The
+requests inside a test still run one after the other, but independent tests
+run at the same time, so a full run is bounded by the slowest test instead of
+the sum of every round trip. Tests declaring they need a resource (e.g. a
+user) wait for a test producing one and take it over, instead of having it
+created and deleted for them; only resources no test produces are
+provisioned up front.
+"""
+import argparse
+import asyncio
+import collections
+import inspect
+import os
+import sys
+import time
+
+import test_negative
+import test_positive
+from cache import TTLCache
+from client import ApiClient, AsyncClient
+from deadline import CURRENT as CURRENT_DEADLINE, Deadline
+from events import CURRENT_TEST, sink_from_env
+from fake_server import FakeGorestServer, options_from_env
+from latency import LatencySampler
+from provisioning import CleanupQueue, UserPool
+from ratelimit import RateLimiter, default_state_file
+from resources import ResourceBroker, exclusive_plan, resource_plan
+from retry import CircuitBreaker, RetryPolicy
+from slo import DEFAULT_PATH as SLO_PATH, load_slo
+from testdata import OwnershipRegistry, PayloadFactory
+from timing import TimingLog
+from tokens import print_usage, read_tokens
+from verification import (HISTORY_SESSION, INVALID_DATATYPE_PAYLOAD, INVALID_TOKEN, INVALID_VALUE_PAYLOAD, MAIN_URL,
+    MISSING_VALUE_PAYLOAD, REQUEST_TIMEOUT, USERS_PATH, VALID_PAYLOAD, read_token, record_history, shared_token_pool,
+    token_usage, user_resource_delete)
+
+SCENARIOS = ('integrated', 'idempotency', 'negative', 'race')
+
+Scenario = collections.namedtuple('Scenario', ['nodeid', 'kind', 'func'])
+Result = collections.namedtuple('Result', ['scenario', 'outcome', 'message', 'duration'])
+
+
+def scenario_kind(module, test_name):
+    """A simple function that returns which scenario of the test matrix a test belongs to."""
+    if 'race' in test_name:
+        return 'race'
+    elif module is test_negative:
+        return 'negative'
+    elif 'idempotency' in test_name:
+        return 'idempotency'
+    return 'integrated'
+
+def collect_scenarios(kinds=SCENARIOS):
+    """A function that returns every test of the matrix whose scenario is in kinds."""
+    scenarios = []
+    for module in (test_positive, test_negative):
+        for class_name, test_class in inspect.getmembers(module, inspect.isclass):
+            if not class_name.startswith('Test') or test_class.__module__ != module.__name__:
+                continue
+            for test_name, _ in inspect.getmembers(test_class, inspect.isfunction):
+                if not test_name.startswith('test'):
+                    continue
+                kind = scenario_kind(module, test_name)
+                if kind in kinds:
+                    nodeid = "gorest_test/{}.py::{}::{}".format(module.__name__, class_name, test_name)
+                    # Each test gets its own instance, as pytest does
+                    scenarios.append(Scenario(nodeid, kind, getattr(test_class(), test_name)))
+    return scenarios
+
+def session_values(client, main_url=MAIN_URL, samples=5, environment=None, interval=None, confidence=None,
+        max_samples=30):
+    """A function that returns the values the runner passes to tests in place of pytest fixtures.
+
+    environment picks the overrides of the SLO file, main_url by default, and interval the seconds between
+    the intended sends of sampled requests (back to back by default). With a confidence, latencies are
+    sampled sequentially up to max_samples."""
+    return {
+        'client': client,
+        'main_url': main_url,
+        'user_endpoint': main_url + USERS_PATH,
+        'slo': load_slo(os.environ.get('GOREST_SLO', SLO_PATH), environment or main_url),
+        'measure': LatencySampler(samples=samples, interval=interval, confidence=confidence, max_samples=max_samples),
+        'max_pages': None,
+        'invalid_token': INVALID_TOKEN,
+    }
+
+def per_test_factories(payload_factory, user_pool=None, resources=None):
+    """A function that returns the per-test values the runner builds fresh for every test.
+
+    With a resource broker, existing users are taken over from the tests producing them first."""
+    factories = {
+        'valid_payload': lambda: payload_factory.make(VALID_PAYLOAD),
+        'missing_value_payload': lambda: payload_factory.make(MISSING_VALUE_PAYLOAD),
+        'invalid_value_payload': lambda: payload_factory.make(INVALID_VALUE_PAYLOAD),
+        'invalid_datatype_payload': lambda: payload_factory.make(INVALID_DATATYPE_PAYLOAD),
+    }
+    if user_pool is not None:
+        factories['existing_user'] = user_pool.acquire if resources is None \
+            else lambda: resources.take('user', user_pool.acquire)
+    return factories
+
+
+class Runner:
+    """Runs test scenarios as concurrent coroutines on top of an AsyncClient.
+
+    Pass/fail semantics follow pytest: a test passes if it returns, fails if
+    it raises AssertionError (its message is the usual `errors` report), and
+    errors out on any other exception.
+    """
+
+    def __init__(self, async_client, values, factories=None, timing_log=None, token_pool=None, deadline_budget=None,
+            dependencies=None):
+        self.async_client = async_client
+        self.dependencies = dependencies or {}
+        self.values = values
+        self.factories = factories or {}
+        self.timing_log = timing_log
+        self.token_pool = token_pool
+        self.deadline_budget = deadline_budget
+
+    def arguments(self, scenario):
+        """Returns the keyword arguments a scenario's test function asks for."""
+        parameters = inspect.signature(scenario.func).parameters
+        missing = [name for name in parameters if name not in self.values and name not in self.factories]
+        if missing:
+            raise LookupError("fixture(s) {} not available in runner".format(", ".join(missing)))
+        return {name: self.factories[name]() if name in self.factories else self.values[name]
+            for name in parameters}
+
+    def attributed(self, scenario, **kwargs):
+        """Calls a scenario's test function, attributing the requests it sends to it in the timing log.
+
+        With a token pool, the test is assigned a token of its own first. With
+        a deadline budget, its requests are bounded by a deadline of its own."""
+        if self.timing_log is not None:
+            self.timing_log.current = scenario.nodeid
+        CURRENT_TEST.set(scenario.nodeid)
+        if self.token_pool is not None:
+            self.token_pool.assign()
+        if self.deadline_budget is not None:
+            # Each call runs in a context of its own, so this deadline is only seen by the scenario's requests
+            CURRENT_DEADLINE.set(Deadline(self.deadline_budget))
+        try:
+            return scenario.func(**kwargs)
+        finally:
+            if self.timing_log is not None:
+                self.timing_log.current = None
+            if self.token_pool is not None:
+                self.token_pool.release()
+
+    async def run_scenario(self, scenario):
+        """Runs a single scenario and returns its Result."""
+        start = time.perf_counter()
+        try:
+            await self.async_client.run(self.attributed, scenario, **self.arguments(scenario))
+            outcome, message = 'passed', ''
+        except AssertionError as e:
+            outcome, message = 'failed', str(e)
+        except Exception as e:
+            outcome, message = 'error', "{}: {}".format(type(e).__name__, e)
+        return Result(scenario, outcome, message, time.perf_counter() - start)
+
+    async def run_after(self, scenario, dependencies):
+        """Runs a scenario once the scenarios it depends on are done, whatever their outcome, and returns its Result."""
+        await asyncio.gather(*dependencies)
+        return await self.run_scenario(scenario)
+
+    async def run(self, scenarios):
+        """Runs every scenario concurrently and returns their Results in order.
+
+        A scenario with dependencies (indexes into scenarios) starts once they are done."""
+        tasks = {}
+
+        def task(index):
+            if index not in tasks:
+                dependencies = [task(dependency) for dependency in sorted(self.dependencies.get(index, ()))]
+                tasks[index] = asyncio.ensure_future(self.run_after(scenarios[index], dependencies))
+            return tasks[index]
+
+        return await asyncio.gather(*[task(index) for index in range(len(scenarios))])
+
+
+def report(results, wall_time, out=sys.stdout):
+    """A function that prints a pytest-like report of results. Returns True if every test passed."""
+    counts = collections.Counter()
+    for result in results:
+        counts[result.outcome] += 1
+        out.write("{} {} ({:.2f}ms)\n".format(result.outcome.upper(), result.scenario.nodeid, result.duration*1000))
+        if result.message:
+            out.write(result.message + "\n")
+    summary = ", ".join("{} {}".format(counts[outcome], outcome) for outcome in ('passed', 'failed', 'error') if counts[outcome])
+    out.write("{} in {:.2f}s\n".format(summary or 'no tests ran', wall_time))
+    return counts['failed'] == counts['error'] == 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs the gorest test matrix concurrently.")
+    parser.add_argument('--concurrency', type=int, default=8, help="maximum number of tests in flight")
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+        help="scenario to run (repeatable, all by default)")
+    parser.add_argument('--url', default=os.environ.get('GOREST_URL', MAIN_URL), help="main url of the server under test")
+    parser.add_argument('--samples', type=int, default=5, help="times each repeatable request is sent to measure latency")
+    parser.add_argument('--latency-interval', type=float, default=float(os.environ.get('GOREST_LATENCY_INTERVAL') or 0) or None,
+        help="seconds between the intended sends of sampled requests (back to back by default)")
+    parser.add_argument('--confidence', type=float, default=float(os.environ.get('GOREST_LATENCY_CONFIDENCE') or 0) or None,
+        help="sample latencies sequentially until met or violated with this confidence, e.g. 0.95")
+    parser.add_argument('--max-samples', type=int, default=int(os.environ.get('GOREST_LATENCY_MAX_SAMPLES', 30)),
+        help="most times a request is sent when sampled sequentially")
+    parser.add_argument('--fake', action='store_true', help="run against a local fake server (GOREST_FAKE_* knobs apply)")
+    parser.add_argument('--timing-report', default=os.environ.get('GOREST_TIMING_REPORT'),
+        help="write the phase timings of every request as JSON to this file")
+    args = parser.parse_args(argv)
+
+    fake_server = None
+    if args.fake:
+        fake_server = FakeGorestServer(**options_from_env(os.environ)).start()
+        args.url, token = fake_server.url, fake_server.token
+    else:
+        token = read_token()
+        if token is None:
+            sys.exit('Token file not found. Hint: run setup.py again')
+
+    registry = OwnershipRegistry()
+    timing_log = TimingLog()
+    token_pool = shared_token_pool(sorted(fake_server.tokens) if fake_server is not None else read_tokens(os.environ))
+    client = ApiClient(token=token, pool_size=args.concurrency, timeout=REQUEST_TIMEOUT, registry=registry,
+        cache=TTLCache(), timing_log=timing_log, rate_limiter=None if os.environ.get('GOREST_RATE_LIMIT') == '0'
+            else RateLimiter(state_file=os.environ.get('GOREST_RATE_LIMIT_FILE') or default_state_file(token)),
+        retry=RetryPolicy(attempts=int(os.environ.get('GOREST_RETRIES', 3))), breaker=CircuitBreaker(),
+        token_pool=token_pool, events=sink_from_env(os.environ, run=HISTORY_SESSION))
+    async_client = AsyncClient(client, concurrency=args.concurrency)
+    # Tests fan out on their own workers, so they never wait on the workers running them
+    test_async_client = AsyncClient(client, concurrency=args.concurrency)
+    cleanup_queue = CleanupQueue(async_client, user_resource_delete)
+    payload_factory = PayloadFactory()
+    values = session_values(client, args.url, args.samples, 'fake' if fake_server is not None else args.url,
+        args.latency_interval, args.confidence, args.max_samples)
+    values.update({
+        'async_client': test_async_client,
+        'cleanup_queue': cleanup_queue,
+        'payload_factory': payload_factory,
+        'negative_case_budget': int(os.environ.get('GOREST_NEGATIVE_CASES', 200)),
+        'race_width': int(os.environ.get('GOREST_RACE_WIDTH', 5)),
+        'race_rounds': int(os.environ.get('GOREST_RACE_ROUNDS', 3)),
+    })
+    values['resources'] = resources = ResourceBroker()
+    user_pool = UserPool(async_client, values['user_endpoint'], payload_factory, VALID_PAYLOAD, cleanup_queue)
+    try:
+        scenarios = collect_scenarios(args.scenario or SCENARIOS)
+        # Tests needing a user wait for one a test creates; only users no test creates are made up front
+        funcs = [scenario.func for scenario in scenarios]
+        dependencies, missing = resource_plan(funcs, values)
+        # Tests comparing successive reads of the collection run alone, so no other test writes in between
+        dependencies = exclusive_plan(funcs, dependencies)
+        for error in user_pool.provision(missing['user']):
+            print("Provisioning Error: {}".format(error))
+        runner = Runner(async_client, values, per_test_factories(payload_factory, user_pool, resources), timing_log,
+            token_pool, float(os.environ.get('GOREST_TEST_DEADLINE', 120)) or None, dependencies)
+        start = time.perf_counter()
+        results = asyncio.run(runner.run(scenarios))
+        passed = report(results, time.perf_counter() - start)
+        print("Resources: {}, {} provisioned up front".format(resources.summary(), missing['user']))
+        if token_pool is not None:
+            print_usage(token_pool.report(), sys.stdout)
+        if args.timing_report:
+            timing_log.write(args.timing_report, tokens=token_usage())
+        record_history(timing_log, 'fake' if fake_server is not None else args.url)
+    finally:
+        user_pool.release_all()
+        # Deferred deletes, then any user this run created but did not clean up
+        cleanup_queue.drain()
+        for url in registry.owned():
+            cleanup_queue.defer(url)
+        cleanup_queue.drain()
+        test_async_client.close()
+        async_client.close()
+        client.close()
+        if client.events is not None:
+            client.events.close()
+        if fake_server is not None:
+            fake_server.stop()
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
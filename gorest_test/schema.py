@@ -0,0 +1,132 @@
+"""Schema-compiled validation of user records.
+
+Run it from the repository main folder to benchmark the compiled validator
+against is_user_datatypes:
+
+    python3 gorest_test/schema.py --users 100000
+"""
+import argparse
+import collections
+import datetime
+import timeit
+
+USER_SCHEMA = collections.OrderedDict([
+    ('id', {'type': int, 'min': 1}),
+    ('name', {'type': str, 'min_length': 1}),
+    ('email', {'type': str, 'min_length': 5, 'contains': '@'}),
+    ('gender', {'type': str, 'enum': ('Male', 'Female')}),
+    ('status', {'type': str, 'enum': ('Active', 'Inactive')}),
+    ('created_at', {'type': str, 'format': 'datetime'}),
+    ('updated_at', {'type': str, 'format': 'datetime'}),
+])
+
+ValidationResult = collections.namedtuple('ValidationResult', ['total', 'invalid', 'failures'])
+
+_MISSING = object()
+
+
+def _field_check(field, spec, namespace):
+    """Returns the source of a boolean expression checking variable `v` against spec."""
+    type_name = '_type_{}'.format(field)
+    namespace[type_name] = spec['type']
+    terms = ['isinstance(v, {})'.format(type_name)]
+    if 'min' in spec:
+        terms.append('v >= {!r}'.format(spec['min']))
+    if 'min_length' in spec:
+        terms.append('len(v) >= {!r}'.format(spec['min_length']))
+    if 'contains' in spec:
+        terms.append('{!r} in v'.format(spec['contains']))
+    if 'enum' in spec:
+        enum_name = '_enum_{}'.format(field)
+        namespace[enum_name] = frozenset(spec['enum'])
+        terms.append('v in {}'.format(enum_name))
+    return ' and '.join(terms)
+
+def compile_validator(schema=USER_SCHEMA):
+    """A function that compiles schema into a function validating a whole page of records in one pass.
+
+    The returned function takes a list of records and returns a
+    ValidationResult with the number of records, the number of invalid
+    records, and the number of failures per field. Checks are generated as a
+    single loop with every field check inlined, so no function is called per
+    field.
+    """
+    namespace = {'_MISSING': _MISSING, '_fromisoformat': datetime.datetime.fromisoformat,
+        'ValidationResult': ValidationResult}
+    fields = list(schema)
+    lines = ['def validate_page(records):']
+    lines += ['    f{} = 0'.format(index) for index in range(len(fields))]
+    lines += [
+        '    invalid = 0',
+        '    for record in records:',
+        '        if not isinstance(record, dict):',
+        '            record = {}',
+        '        bad = False',
+    ]
+    for index, field in enumerate(fields):
+        spec = schema[field]
+        lines.append('        v = record.get({!r}, _MISSING)'.format(field))
+        lines.append('        if not ({}):'.format(_field_check(field, spec, namespace)))
+        lines.append('            f{} += 1'.format(index))
+        lines.append('            bad = True')
+        if spec.get('format') == 'datetime':
+            lines += [
+                '        else:',
+                '            try:',
+                '                _fromisoformat(v)',
+                '            except ValueError:',
+                '                f{} += 1'.format(index),
+                '                bad = True',
+            ]
+    lines += [
+        '        if bad:',
+        '            invalid += 1',
+        '    return ValidationResult(len(records), invalid, {{{}}})'.format(
+            ', '.join('{!r}: f{}'.format(field, index) for index, field in enumerate(fields))),
+    ]
+    exec(compile('\n'.join(lines), '<compiled user validator>', 'exec'), namespace)
+    return namespace['validate_page']
+
+validate_users = compile_validator(USER_SCHEMA)
+
+
+def failure_summary(result):
+    """A simple function that describes the per-field failures of a ValidationResult."""
+    return ", ".join("{}: {}".format(field, count) for field, count in result.failures.items() if count)
+
+def sample_users(count):
+    """A simple function that returns count valid user records for benchmarks."""
+    now = datetime.datetime.now().astimezone().isoformat(timespec='milliseconds')
+    return [{
+        'id': number + 1,
+        'name': "User {}".format(number),
+        'email': "user.{}@example.com".format(number),
+        'gender': 'Male' if number % 2 else 'Female',
+        'status': 'Active' if number % 3 else 'Inactive',
+        'created_at': now,
+        'updated_at': now,
+    } for number in range(count)]
+
+def benchmark(users, repeat=5):
+    """A function that times is_user_datatypes against the compiled validator. Returns the best times in seconds."""
+    from verification import is_user_datatypes
+
+    per_record = min(timeit.repeat(lambda: sum(1 for user in users if not is_user_datatypes(user)), number=1, repeat=repeat))
+    compiled = min(timeit.repeat(lambda: validate_users(users), number=1, repeat=repeat))
+    return per_record, compiled
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the compiled user validator.")
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    users = sample_users(args.users)
+    per_record, compiled = benchmark(users, args.repeat)
+    print("is_user_datatypes: {:.3f}s ({:.2f}us/user)".format(per_record, per_record / args.users * 1e6))
+    print("validate_users:    {:.3f}s ({:.2f}us/user)".format(compiled, compiled / args.users * 1e6))
+    print("speedup:           {:.1f}x".format(per_record / compiled))
+
+
+if __name__ == '__main__':
+    main()
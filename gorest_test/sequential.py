@@ -0,0 +1,79 @@
+import collections
+import math
+
+MET = 'met'
+VIOLATED = 'violated'
+# How far above its allowed share of slow samples a percentile must be for the test to call it violated
+DEFAULT_TOLERANCE = 0.25
+
+
+class Verdict(collections.namedtuple('Verdict', ['percentile', 'threshold', 'decision', 'samples', 'exceeded', 'confidence'])):
+    """The outcome of a SequentialTest: MET, VIOLATED, or None if the samples ran out first."""
+
+    def summary(self):
+        """Returns a human readable verdict, e.g. 'p95 met at 96% confidence after 9 sample(s) (0 over 800.00ms)'."""
+        return "p{:g} {} at {:.0%} confidence after {} sample(s) ({} over {:.2f}ms)".format(self.percentile,
+            self.decision or 'undecided', self.confidence, self.samples, self.exceeded, self.threshold*1000)
+
+
+class SequentialTest:
+    """Wald's sequential probability ratio test of a latency percentile against its threshold.
+
+    Every sample either exceeds the threshold or not. The percentile is met
+    if at most its allowed share of samples do (5% for p95), and violated if
+    `tolerance` more do (30% for p95). After each sample the log likelihood
+    ratio of the two is updated, and the test decides as soon as it crosses
+    the bound of the wanted `confidence`: a few samples settle a clear pass
+    or failure, and only borderline latencies need many. The confidence
+    reported is the probability of the favoured outcome given the samples,
+    both outcomes being equally likely beforehand.
+    """
+
+    def __init__(self, percentile, threshold, confidence=0.95, tolerance=DEFAULT_TOLERANCE):
+        if not 0.5 < confidence < 1:
+            raise ValueError("Sequential confidence must be between 0.5 and 1, got {}".format(confidence))
+        self.percentile = percentile
+        self.threshold = threshold
+        allowed = 1 - percentile / 100
+        violated = min(allowed + tolerance, 0.999)
+        self._over = math.log(violated / allowed)
+        self._under = math.log((1 - violated) / (1 - allowed))
+        self._bound = math.log(confidence / (1 - confidence))
+        self.log_ratio = 0.0
+        self.samples = 0
+        self.exceeded = 0
+        self.decision = None
+
+    def record(self, latency):
+        """Accounts a latency sample in seconds. Samples recorded once the test decided are ignored."""
+        if self.decision is not None:
+            return
+        self.samples += 1
+        if latency > self.threshold:
+            self.exceeded += 1
+            self.log_ratio += self._over
+        else:
+            self.log_ratio += self._under
+        if self.log_ratio >= self._bound:
+            self.decision = VIOLATED
+        elif self.log_ratio <= -self._bound:
+            self.decision = MET
+
+    @property
+    def confidence(self):
+        return 1 / (1 + math.exp(-abs(self.log_ratio)))
+
+    def verdict(self):
+        """Returns the Verdict reached so far."""
+        return Verdict(self.percentile, self.threshold, self.decision, self.samples, self.exceeded, self.confidence)
+
+
+def sequential_tests(thresholds, confidence, tolerance=DEFAULT_TOLERANCE):
+    """A simple function that returns a SequentialTest per percentile of thresholds, e.g. {95: 1.0, 99: 2.0}."""
+    return {percentile: SequentialTest(percentile, threshold, confidence, tolerance)
+        for percentile, threshold in thresholds.items()}
+
+def settled(tests):
+    """A simple function that returns if sampling may stop: one percentile is violated, or every one is met."""
+    decisions = [test.decision for test in tests.values()]
+    return VIOLATED in decisions or all(decision == MET for decision in decisions)
@@ -0,0 +1,114 @@
+import collections
+import functools
+import json
+
+from timing import endpoint_pattern
+
+DEFAULT_PATH = "gorest_test/slo.json"
+FIELDS = ('latency', 'error_rate', 'min_throughput')
+
+Objective = collections.namedtuple('Objective', FIELDS)
+
+
+class SLOError(ValueError):
+    """Raised when an SLO file is not well formed."""
+
+
+def _parse_objective(spec, where):
+    if not isinstance(spec, dict):
+        raise SLOError("{}: expected an object, got {!r}".format(where, spec))
+    unknown = set(spec) - set(FIELDS)
+    if unknown:
+        raise SLOError("{}: unknown field(s) {}. Expected {}".format(where, ", ".join(sorted(unknown)), ", ".join(FIELDS)))
+    objective = dict(spec)
+    if 'latency' in objective:
+        try:
+            objective['latency'] = {float(percentile): float(seconds) for percentile, seconds in objective['latency'].items()}
+        except (AttributeError, TypeError, ValueError):
+            raise SLOError("{}: latency must map percentiles to seconds, e.g. {{\"95\": 1.0}}".format(where))
+    return objective
+
+def _parse_level(spec, where):
+    """Returns (default, {endpoint: objective}) of one level of an SLO file."""
+    default = _parse_objective(spec.get('default', {}), where + ".default")
+    endpoints = {endpoint: _parse_objective(objective, "{}.endpoints['{}']".format(where, endpoint))
+        for endpoint, objective in spec.get('endpoints', {}).items()}
+    return default, endpoints
+
+def _merge(objective, override):
+    merged = dict(objective)
+    for field, value in override.items():
+        if field == 'latency':
+            merged['latency'] = dict(merged.get('latency') or {})
+            merged['latency'].update(value)
+        else:
+            merged[field] = value
+    return merged
+
+
+class SLO:
+    """Latency percentiles, error-rate ceilings and minimum throughput per endpoint.
+
+    An SLO file holds a default objective, objectives per endpoint keyed
+    like 'PUT /public-api/users/{id}', and per-environment overrides of
+    both keyed by main url. The objective of an endpoint is the default,
+    overridden field by field (percentile by percentile for latency) by the
+    endpoint's, then by the environment's default and endpoint's.
+    """
+
+    def __init__(self, spec, environment=None):
+        if not isinstance(spec, dict):
+            raise SLOError("An SLO file must hold an object")
+        self.environment = environment
+        self._levels = [_parse_level(spec, 'slo')]
+        environments = spec.get('environments', {})
+        if environment in environments:
+            self._levels.append(_parse_level(environments[environment], "environments['{}']".format(environment)))
+        self._objectives = {}
+
+    @classmethod
+    def load(cls, path=DEFAULT_PATH, environment=None):
+        """Returns the SLO held in the JSON file at path, with the overrides of environment."""
+        with open(path, 'r') as f:
+            try:
+                spec = json.load(f)
+            except ValueError as e:
+                raise SLOError("{} is not valid JSON: {}".format(path, e))
+        return cls(spec, environment)
+
+    def objective(self, endpoint):
+        """Returns the Objective of an endpoint, e.g. 'GET /public-api/users'."""
+        if endpoint not in self._objectives:
+            merged = {}
+            for default, endpoints in self._levels:
+                merged = _merge(merged, default)
+                merged = _merge(merged, endpoints.get(endpoint, {}))
+            self._objectives[endpoint] = Objective(merged.get('latency') or {}, merged.get('error_rate'),
+                merged.get('min_throughput'))
+        return self._objectives[endpoint]
+
+    def of(self, method, url):
+        """Returns the Objective of a request."""
+        return self.objective(endpoint_pattern(method, url))
+
+    def thresholds(self, method, url):
+        """Returns the maximum latency in seconds allowed at each percentile for a request, e.g. {95: 1.0, 99: 2.0}."""
+        return self.of(method, url).latency
+
+
+@functools.lru_cache(maxsize=None)
+def load_slo(path=DEFAULT_PATH, environment=None):
+    """A function that returns the SLO held in the JSON file at path, with the overrides of environment, loading it once."""
+    return SLO.load(path, environment)
+
+def throughput_errors(rate, objective, unit='requests/s'):
+    """A simple function that returns a Throughput Error message if rate is under the objective's minimum."""
+    if objective.min_throughput is not None and rate < objective.min_throughput:
+        return ["Throughput Error: {:.2f} {} is under the minimum of {:.2f}".format(rate, unit, objective.min_throughput)]
+    return []
+
+def error_rate_errors(rate, objective):
+    """A simple function that returns an Error Rate Error message if rate is over the objective's ceiling."""
+    if objective.error_rate is not None and rate > objective.error_rate:
+        return ["Error Rate Error: {:.2f}% of requests failed. Ceiling is {:.2f}%".format(rate*100, objective.error_rate*100)]
+    return []
@@ -0,0 +1,77 @@
+import asyncio
+import random
+
+import pytest
+
+from client import ApiClient, AsyncClient
+from fake_server import FakeGorestServer
+from history import HistoryStore, mann_whitney_greater
+from timing import TimingLog
+
+USERS_PATH = "/public-api/users"
+
+
+class Test_HistoryStore:
+
+    def test_samples_keyed_by_test(self, tmp_path):
+        """A test of the test node id history samples are keyed by
+
+        Requests sent by a test, on its own thread or fanned out through
+        `AsyncClient.run`, must be stored under the test's node id.
+        """
+
+        server = FakeGorestServer(seed_users=1).start()
+        timing_log = TimingLog()
+        client = ApiClient(token=server.token, timing_log=timing_log)
+        async_client = AsyncClient(client, concurrency=2)
+        try:
+            timing_log.current = 'gorest_test/test_history.py::keyed'
+            client.get(server.url + USERS_PATH)
+            asyncio.run(async_client.get(server.url + USERS_PATH))
+            timing_log.current = None
+        finally:
+            async_client.close()
+            client.close()
+            server.stop()
+
+        store = HistoryStore(str(tmp_path / "history.sqlite"))
+        try:
+            run_id = store.record_run(timing_log.take_new(), url='fake', session='keyed')
+            tests = [row[0] for row in store.connection.execute("SELECT test FROM samples WHERE run_id = ?", (run_id,))]
+        finally:
+            store.close()
+
+        assert tests == ['gorest_test/test_history.py::keyed'] * 2
+
+
+class Test_Mann_Whitney:
+
+    def test_shifted_sample(self):
+        """A test that latencies shifted upward are flagged as slower, and not the other way round"""
+        rng = random.Random(1)
+        baseline = [rng.gauss(0.1, 0.01) for _ in range(50)]
+        candidate = [value + 0.02 for value in baseline]
+
+        assert mann_whitney_greater(baseline, candidate) < 0.001
+        assert mann_whitney_greater(candidate, baseline) > 0.999
+
+    def test_identical_sample(self):
+        """A test that identical latencies are not flagged as slower"""
+        rng = random.Random(2)
+        baseline = [rng.gauss(0.1, 0.01) for _ in range(50)]
+
+        assert mann_whitney_greater(baseline, list(baseline)) > 0.5
+
+    def test_ties(self):
+        """A test of the tie correction, against a p-value worked out by hand
+
+        Tied values share the average of their ranks: U = 14 out of a mean of
+        8, with a tie-corrected variance of 16/12 * (9 - 72/56), so z = 1.715.
+        """
+        assert mann_whitney_greater([1, 1, 2, 2], [2, 2, 3, 3]) == pytest.approx(0.0432, abs=1e-4)
+
+    def test_degenerate_samples(self):
+        """A test that empty samples, or samples where every value ties, are never flagged"""
+        assert mann_whitney_greater([], [0.1]) == 1.0
+        assert mann_whitney_greater([0.1], []) == 1.0
+        assert mann_whitney_greater([0.1] * 5, [0.1] * 5) == 1.0
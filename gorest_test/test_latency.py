@@ -0,0 +1,57 @@
+import datetime
+
+import pytest
+
+from latency import Schedule
+
+
+class Response:
+    """A stand-in for a response that took `latency` seconds."""
+
+    def __init__(self, latency):
+        self.elapsed = datetime.timedelta(seconds=latency)
+
+
+class FakeClock:
+    """A clock that only moves when requests are sent or the schedule sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def send(self, latency):
+        self.now += latency
+        return Response(latency)
+
+
+class Test_Schedule:
+
+    def test_back_to_back_records_as_measured(self):
+        """A test that requests sent back to back are recorded as measured, however much their latencies vary"""
+        clock = FakeClock()
+        schedule = Schedule(clock=clock, sleep=clock.sleep)
+        for latency in (0.01, 0.5):
+            schedule.send(lambda: clock.send(latency))
+        histogram = schedule.histogram()
+
+        assert histogram.count == 2
+        assert histogram.uncorrected is None
+
+    def test_interval_adds_lateness(self):
+        """A test that requests on an interval have their lateness added, and each due send is recorded once"""
+        clock = FakeClock()
+        schedule = Schedule(interval=0.1, precision=0.001, clock=clock, sleep=clock.sleep)
+        for latency in (0.35, 0.01, 0.01):
+            schedule.send(lambda: clock.send(latency))
+        histogram = schedule.histogram()
+
+        # The second request left 0.25s late, and the third, due at 0.2s, 0.16s late
+        assert histogram.count == 3
+        assert histogram.uncorrected.count == 3
+        assert histogram.max == pytest.approx(0.35)
+        assert schedule.last == pytest.approx(0.17)
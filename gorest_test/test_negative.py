@@ -1,9 +1,18 @@
+import random
+
+import requests
+
+from latency import LatencyHistogram, latency_errors
+from negative import generate_cases, run_cases
+from provisioning import ProvisionedUser
+from race import created_urls, fire_together, post_race_problems, race_summary
+from resources import needs, produces
 from verification import *
 
 
 class Test_GET_User:
 
-    def test_missing_resource(self, user_endpoint, token, timeout_threshold):
+    def test_missing_resource(self, client, user_endpoint, measure, slo):
         """A negative test using GET method on a missing /users endpoint
 
         This test verifies if server correctly handles a valid request that it
@@ -19,10 +28,10 @@ class Test_GET_User:
         url = user_endpoint + "/{}".format(user_id)
         
         # Ensures the resource is empty
-        if make_resource_empty(url=url, token=token):
+        if make_resource_empty(client, url=url):
 
             # Perform GET method on empty resource
-            response = requests.get(url)
+            response, latency = measure(lambda: client.get(url), thresholds=slo.thresholds('GET', url))
 
             # Verify response as handled well by server
             if response.status_code == requests.codes.ok:
@@ -37,10 +46,8 @@ class Test_GET_User:
                 errors.append('Request Error: Response is {}, Expected 200 '\
                         .format(response.status_code))
 
-            # Verify response performance
-            if response.elapsed.total_seconds() > timeout_threshold:
-                errors.append("Performance Error: Response took {:.2f}ms. Threshold is {:.2f}ms"\
-                    .format(response.elapsed.total_seconds()*1000, timeout_threshold*1000))
+            # Verify latency percentiles are within thresholds
+            errors.extend(latency_errors(latency, slo.thresholds('GET', url)))
         
         # Error if test could not be prepared properly
         else:
@@ -51,7 +58,7 @@ class Test_GET_User:
 
 class Test_POST_User:
 
-    def test_unauthorized(self, user_endpoint, valid_payload, token, invalid_token, timeout_threshold):
+    def test_unauthorized(self, client, user_endpoint, valid_payload, invalid_token, measure, slo):
         """A negative test using POST method with an unauthorized token
 
         This test verifies if server correctly handles a valid POST request using
@@ -64,18 +71,16 @@ class Test_POST_User:
         url = user_endpoint
 
         # Only perform test if email is available.
-        if make_email_free(url, valid_payload['email'], token):
+        if make_email_free(client, url, valid_payload['email']):
             # Perform POST
             invalid_token_header = "Bearer " + invalid_token
-            response_post = requests.post(
+            response_post, latency = measure(lambda: client.post(
                 url = url,
                 data = valid_payload,
-                headers={"Authorization": invalid_token_header})
+                headers={"Authorization": invalid_token_header}), thresholds=slo.thresholds('POST', url))
             
-            # Verify Performance
-            if response_post.elapsed.total_seconds() > timeout_threshold:
-                errors.append("Performance Error: Response took {:.2f}ms. Threshold is {:.2f}ms"\
-                    .format(response_post.elapsed.total_seconds()*1000, timeout_threshold*1000))
+            # Verify latency percentiles are within thresholds
+            errors.extend(latency_errors(latency, slo.thresholds('POST', url)))
             
             # Verify Request was well handled by Server
             if response_post.status_code == requests.codes.ok:
@@ -98,7 +103,7 @@ class Test_POST_User:
         # Report any errors    
         assert not errors, "Errors Occured:\n{}".format("\n".join(errors))
     
-    def test_empty_payload(self, user_endpoint, token, timeout_threshold):
+    def test_empty_payload(self, client, user_endpoint, measure, slo):
         """A negative test using POST method with an empty payload
 
         A POST request with an empty payload is expected to be rejected (422).
@@ -112,16 +117,12 @@ class Test_POST_User:
         url = user_endpoint
 
         # Perform POST
-        access_token_header = "Bearer " + token
-        response_post = requests.post(
+        response_post, latency = measure(lambda: client.post(
             url = url,
-            data = {},
-            headers={"Authorization": access_token_header})
+            data = {}), thresholds=slo.thresholds('POST', user_endpoint))
         
-        # Verify Performance
-        if response_post.elapsed.total_seconds() > timeout_threshold:
-            errors.append("Performance Error: Response took {:.2f}ms. Threshold is {:.2f}ms"\
-                .format(response_post.elapsed.total_seconds()*1000, timeout_threshold*1000))
+        # Verify latency percentiles are within thresholds
+        errors.extend(latency_errors(latency, slo.thresholds('POST', user_endpoint)))
         
         # Verify Request was well taken by Server
         if response_post.status_code == requests.codes.ok:
@@ -144,7 +145,7 @@ class Test_POST_User:
         # Report any errors
         assert not errors, "Errors Occured:\n{}".format("\n".join(errors))
 
-    def test_missing_parameter(self, user_endpoint, missing_value_payload, token, timeout_threshold):
+    def test_missing_parameter(self, client, user_endpoint, missing_value_payload, measure, slo):
         """An negative test using POST method with a missing required parameter
 
         A POST request with an incomplete payload is expected to be rejected (422).
@@ -158,16 +159,12 @@ class Test_POST_User:
         url = user_endpoint
 
         # Perform POST
-        access_token_header = "Bearer " + token
-        response_post = requests.post(
+        response_post, latency = measure(lambda: client.post(
             url = url,
-            data = missing_value_payload,
-            headers={"Authorization": access_token_header})
+            data = missing_value_payload), thresholds=slo.thresholds('POST', user_endpoint))
         
-        # Verify Performance
-        if response_post.elapsed.total_seconds() > timeout_threshold:
-            errors.append("Performance Error: Response took {:.2f}ms. Threshold is {:.2f}ms"\
-                .format(response_post.elapsed.total_seconds()*1000, timeout_threshold*1000))
+        # Verify latency percentiles are within thresholds
+        errors.extend(latency_errors(latency, slo.thresholds('POST', user_endpoint)))
         
         # Verify Request was well handled by Server
         if response_post.status_code == requests.codes.ok:
@@ -191,7 +188,7 @@ class Test_POST_User:
         # Report any errors    
         assert not errors, "Errors Occured:\n{}".format("\n".join(errors))
 
-    def test_wrong_datatype(self, user_endpoint, invalid_datatype_payload, token, timeout_threshold):
+    def test_wrong_datatype(self, client, user_endpoint, invalid_datatype_payload, measure, slo):
         """A negative test using POST method with payload of wrong datatype
 
         A POST request with an payload with wrong data types is expected to be
@@ -204,16 +201,12 @@ class Test_POST_User:
         
         errors = []
         # Perform POST
-        access_token_header = "Bearer " + token
-        response_post = requests.post(
+        response_post, latency = measure(lambda: client.post(
             url = user_endpoint,
-            data = invalid_datatype_payload,
-            headers={"Authorization": access_token_header})
+            data = invalid_datatype_payload), thresholds=slo.thresholds('POST', user_endpoint))
         
-        # Verify Performance
-        if response_post.elapsed.total_seconds() > timeout_threshold:
-            errors.append("Performance Error: Response took {:.2f}ms. Threshold is {:.2f}ms"\
-                .format(response_post.elapsed.total_seconds()*1000, timeout_threshold*1000))
+        # Verify latency percentiles are within thresholds
+        errors.extend(latency_errors(latency, slo.thresholds('POST', user_endpoint)))
         
         # Verify Request was well handled by Server
         if response_post.status_code == requests.codes.ok:
@@ -236,14 +229,15 @@ class Test_POST_User:
             
         assert not errors, "Errors Occured:\n{}".format("\n".join(errors))
     
-    def test_duplicate_request(self, user_endpoint, valid_payload,token, timeout_threshold):
+    @produces('user')
+    def test_duplicate_request(self, client, user_endpoint, valid_payload, cleanup_queue, resources, measure, slo):
         """A negative test using duplicate valid POST method
 
         When a server receives duplicate valid POST requests, it should accept 
         the first and reject the second as it already exists. This test verifies 
         if server correctly handles duplicate POST requests. In a single test it 
         verifies the request's status code, the response's status code, and 
-        performance. 
+        performance. The user created is handed on to a test needing one.
         A combination of errors (if any) is reported at the end of the test.
         """
         
@@ -251,19 +245,14 @@ class Test_POST_User:
         url = user_endpoint
 
         # Only perform test if email is available.
-        if make_email_free(url, valid_payload['email'], token):
+        if make_email_free(client, url, valid_payload['email']):
+            # Both POSTs follow one schedule, so that on an interval a stall of the first shows in the latency of the second
+            schedule = measure.schedule()
             
             # Perform POST
-            access_token_header = "Bearer " + token
-            response_post_1 = requests.post(
+            response_post_1 = schedule.send(lambda: client.post(
                 url = url,
-                data = valid_payload,
-                headers={"Authorization": access_token_header})
-            
-            # Verify Performance of first request
-            if response_post_1.elapsed.total_seconds() > timeout_threshold:
-                errors.append("Performance Error: Response took {:.2f}ms. Threshold is {:.2f}ms"\
-                    .format(response_post_1.elapsed.total_seconds()*1000, timeout_threshold*1000))
+                data = valid_payload))
             
             # Verify Request was well handled by Server
             if response_post_1.status_code == requests.codes.ok:
@@ -275,14 +264,9 @@ class Test_POST_User:
                         .format(response_post_dict_1['code']))
 
                 ## Perform Second Request
-                response_post_2 = requests.post(
+                response_post_2 = schedule.send(lambda: client.post(
                     url = url,
-                    data = valid_payload,
-                    headers={"Authorization": access_token_header})
-                # Verify Performance of second request
-                if response_post_2.elapsed.total_seconds() > timeout_threshold:
-                    errors.append("Performance Error: Response took {:.2f}ms. Threshold is {:.2f}ms"\
-                        .format(response_post_2.elapsed.total_seconds()*1000, timeout_threshold*1000))
+                    data = valid_payload))
                 # Verify second request is rejected.
                 response_post_dict_2 = is_proper_json(response_post_2)
                 if response_post_dict_2 != False:
@@ -294,25 +278,99 @@ class Test_POST_User:
                     if response_post_dict_2['data'] != [{'field': 'email', 'message': 'has already been taken'}]:
                         errors.append('Payload Error: Did not receive expected error messages')
                 
-                # Delete user created by POST
+                # Delete user created by POST at session end, and hand it on to a PUT test
                 user_id = str(response_post_dict_1['data']['id'])
-                user_url = url + "/" + user_id
-                if not user_resource_delete(url = user_url, token = token):
-                    errors.append('Clean Up Error: Failed to delete created user (ID: {})'.format(user_id))
+                cleanup_queue.defer(url + "/" + user_id)
+                resources.offer('user', ProvisionedUser(response_post_dict_1['data']['id'], url + "/" + user_id, valid_payload))
 
             # Show error if request was not well taken by Server
             else:
                 errors.append('Request Error: First POST Response {}, Expected 200 '\
                         .format(response_post_1.status_code))
+
+            # Verify latency is within thresholds, corrected for coordinated omission
+            errors.extend(latency_errors(schedule.histogram(), slo.thresholds('POST', url)))
         
         else:
             errors.append('Test Error: Could not verify testing email is free.')
             
         assert not errors, "Errors Occured:\n{}".format("\n".join(errors))
 
+    @produces('user', count='race_rounds')
+    def test_duplicate_request_race(self, client, user_endpoint, payload_factory, cleanup_queue, resources, race_width,
+            race_rounds, measure, slo):
+        """A negative test using identical valid POST requests sent concurrently
+
+        Each round sends the same POST request several times at the same
+        moment. The server should create the user exactly once and reject
+        every other copy as it already exists. This test verifies how often
+        it does not, and the latency of every request under contention. The
+        users created are handed on to tests needing one. A combination of
+        errors (if any) is reported at the end of the test.
+        """
+
+        errors = []
+        rounds = []
+        contention = LatencyHistogram()
+        responses = []
+
+        for _ in range(race_rounds):
+            payload = payload_factory.make(VALID_PAYLOAD)
+
+            # Perform identical POST requests at once
+            attempts = fire_together(client, 'POST', user_endpoint, race_width, data=payload)
+            rounds.append(post_race_problems(attempts))
+            for attempt in attempts:
+                contention.record(attempt.latency)
+            responses.extend(attempt.response for attempt in attempts if not isinstance(attempt.response, Exception))
+
+            # Delete every user created, duplicates included, at session end, and hand them on to PUT tests
+            for url in created_urls(attempts):
+                cleanup_queue.defer(url)
+                resources.offer('user', ProvisionedUser(int(url.rsplit('/', 1)[1]), url, payload))
+
+        # Verify exactly one copy was created in every round
+        summary = race_summary('POST', race_width, rounds, contention)
+        if summary is not None:
+            errors.append(summary)
+
+        # Verify latency percentiles under contention are within thresholds
+        errors.extend(latency_errors(measure.single(*responses), slo.thresholds('POST', user_endpoint)))
+
+        # Report any errors
+        assert not errors, "Errors Occured:\n{}".format("\n".join(errors))
+
+    def test_generated_payloads(self, client, async_client, user_endpoint, payload_factory, cleanup_queue,
+            negative_case_budget, measure, slo):
+        """A negative test using POST method with invalid payloads generated from the user schema
+
+        Missing fields, wrong types, boundary lengths, bad enum values and
+        malformed emails, alone and combined, are sent concurrently. Every
+        payload is expected to be rejected (422) with field errors. Identical
+        server responses are grouped, so failures are reported once per
+        distinct behavior. The latency of every request is also verified. A
+        combination of errors (if any) is reported at the end of the test.
+        """
+
+        errors = []
+        cases = generate_cases(VALID_PAYLOAD, budget=negative_case_budget)
+
+        # Perform every POST concurrently
+        results = run_cases(async_client, 'POST', user_endpoint, cases, payload_factory, VALID_PAYLOAD)
+
+        # Verify every case was rejected, one error per distinct behavior
+        errors.extend(generated_payload_errors(results, cleanup_queue))
+
+        # Verify latency percentiles are within thresholds
+        responses = [response for _, response in results if not isinstance(response, Exception)]
+        errors.extend(latency_errors(measure.single(*responses), slo.thresholds('POST', user_endpoint)))
+
+        # Report any errors
+        assert not errors, "Errors Occured:\n{}".format("\n".join(errors))
+
 class Test_PUT_User_Resource:
 
-    def test_empty_resource(self, user_endpoint, valid_payload, token, timeout_threshold):
+    def test_empty_resource(self, client, user_endpoint, valid_payload):
         """A negative test using PUT method to an empty resource
 
         When a server receives a valid PUT request to an inexistant resource,
@@ -327,14 +385,12 @@ class Test_PUT_User_Resource:
         user_url = user_endpoint + "/123"
 
         # Verify resource at target url is empty
-        if make_resource_empty(user_url, token):
+        if make_resource_empty(client, user_url):
 
             # Send valid PUT request
-            access_token_header = {"Authorization": "Bearer " + token}
-            response_put = requests.put(
+            response_put = client.put(
                 url = user_url,
-                data = valid_payload,
-                headers = access_token_header
+                data = valid_payload
             )
 
             # Verify Request was well handled by Server
@@ -343,7 +399,7 @@ class Test_PUT_User_Resource:
 
                 # Verify status code in response
                 if response_put_dict['code'] != requests.codes.not_found:
-                    errors.append("Status Code Error: Received {}, Expected 404".format(response_get_dict['code']))
+                    errors.append("Status Code Error: Received {}, Expected 404".format(response_put_dict['code']))
             
             # Show error if request was not well taken by Server
             else:
@@ -357,7 +413,8 @@ class Test_PUT_User_Resource:
         # Report any errors
         assert not errors, "Errors Occured:\n{}".format("\n".join(errors))
     
-    def test_unauthorized(self, user_endpoint, valid_payload, invalid_token, timeout_threshold):
+    @needs('user')
+    def test_unauthorized(self, client, existing_user, valid_payload, invalid_token, measure, slo):
         """A negative test using PUT method with an unauthorized token
 
         This test verifies if server correctly handles a valid PUT request using
@@ -367,20 +424,18 @@ class Test_PUT_User_Resource:
         """
         
         errors = []
-        user_id = str(get_valid_user_id(user_endpoint))
-        url = user_endpoint + "/" + user_id
+        # Use a user created by another test or provisioned for this session (deleted at session end)
+        url = existing_user.url
         invalid_token_header = "Bearer " + invalid_token
 
         # Sends PUT request with unauthorized token
-        response_put = requests.put(
+        response_put, latency = measure(lambda: client.put(
             url = url,
             data = valid_payload,
-            headers={"Authorization": invalid_token_header})
+            headers={"Authorization": invalid_token_header}), thresholds=slo.thresholds('PUT', url))
         
-        # Verify Performance
-        if response_put.elapsed.total_seconds() > timeout_threshold:
-            errors.append("Performance Error: Response took {:.2f}ms. Threshold is {:.2f}ms"\
-                .format(response_put.elapsed.total_seconds()*1000, timeout_threshold*1000))
+        # Verify latency percentiles are within thresholds
+        errors.extend(latency_errors(latency, slo.thresholds('PUT', url)))
         
         # Verify Request was well handled by Server
         if response_put.status_code == requests.codes.ok:
@@ -398,7 +453,8 @@ class Test_PUT_User_Resource:
         # Report Any errors
         assert not errors, "Errors Occured:\n{}".format("\n".join(errors))
 
-    def test_wrong_datatype(self, user_endpoint, invalid_datatype_payload, token, timeout_threshold):
+    @needs('user')
+    def test_wrong_datatype(self, client, existing_user, invalid_datatype_payload):
         """A negative test using PUT method with payload of wrong datatype
 
         A PUT request with an payload with wrong data types is expected to be
@@ -410,15 +466,13 @@ class Test_PUT_User_Resource:
         """
         
         errors = []
-        user_id = str(get_valid_user_id(user_endpoint))
-        user_url = user_endpoint + "/" + user_id
-        access_token_header = {"Authorization": "Bearer " + token}
+        # Use a user created by another test or provisioned for this session (deleted at session end)
+        user_url = existing_user.url
 
         # PUT request with payload of invalid data types.
-        response_put = requests.put(
+        response_put = client.put(
             url = user_url,
-            data = invalid_datatype_payload,
-            headers = access_token_header
+            data = invalid_datatype_payload
         )
         
         # Verify request was well handled by server
@@ -444,7 +498,8 @@ class Test_PUT_User_Resource:
         # Report any errors   
         assert not errors, "\nErrors Occured:\n{}".format("\n".join(errors))
     
-    def test_empty_payload(self, user_endpoint, token, timeout_threshold):
+    @needs('user')
+    def test_empty_payload(self, client, existing_user):
         """A negative test using PUT method with an empty payload
 
         A PUT request with an empty payload is expected to work like a GET method.
@@ -455,17 +510,15 @@ class Test_PUT_User_Resource:
         """
 
         errors = []
-        user_id = str(get_valid_user_id(user_endpoint))
-        user_url = user_endpoint + "/" + user_id
+        # Use a user created by another test or provisioned for this session (deleted at session end)
+        user_url = existing_user.url
 
         # Perform GET request
-        response_get = requests.get(user_url)
-        access_token_header = {"Authorization": "Bearer " + token}
+        response_get = client.get(user_url)
 
         # Perform PUT request without payload
-        response_put = requests.put(
-            url = user_url,
-            headers = access_token_header
+        response_put = client.put(
+            url = user_url
         )
 
         # Verify Request was well taken by Server
@@ -481,4 +534,35 @@ class Test_PUT_User_Resource:
                 .format(response_put.status_code, response_get.status_code))
 
         # Report any errors
-        assert not errors, "Errors Occured:\n{}".format("\n".join(errors))
\ No newline at end of file
+        assert not errors, "Errors Occured:\n{}".format("\n".join(errors))
+
+
+    @needs('user')
+    def test_generated_payloads(self, client, async_client, existing_user, payload_factory, cleanup_queue,
+            negative_case_budget, measure, slo):
+        """A negative test using PUT method with invalid payloads generated from the user schema
+
+        Wrong types, boundary lengths, bad enum values and malformed emails,
+        alone and combined, are sent concurrently to an existing user. Missing
+        fields are not generated, as PUT accepts partial updates. Every payload
+        is expected to be rejected (422) with field errors. Identical server
+        responses are grouped, so failures are reported once per distinct
+        behavior. The latency of every request is also verified. A combination
+        of errors (if any) is reported at the end of the test.
+        """
+
+        errors = []
+        cases = generate_cases(VALID_PAYLOAD, partial=True, budget=negative_case_budget)
+
+        # Perform every PUT concurrently
+        results = run_cases(async_client, 'PUT', existing_user.url, cases, payload_factory, VALID_PAYLOAD)
+
+        # Verify every case was rejected, one error per distinct behavior
+        errors.extend(generated_payload_errors(results, cleanup_queue))
+
+        # Verify latency percentiles are within thresholds
+        responses = [response for _, response in results if not isinstance(response, Exception)]
+        errors.extend(latency_errors(measure.single(*responses), slo.thresholds('PUT', existing_user.url)))
+
+        # Report any errors
+        assert not errors, "Errors Occured:\n{}".format("\n".join(errors))
@@ -0,0 +1,25 @@
+from client import ApiClient
+from fake_server import FakeGorestServer
+from pager import iter_pages
+from timing import TimingLog
+
+USERS_PATH = "/public-api/users"
+
+
+class Test_Iter_Pages:
+
+    def test_prefetched_pages_attribution(self):
+        """A test that pages prefetched on the background thread are logged under the test walking the collection"""
+        server = FakeGorestServer(seed_users=50).start()
+        timing_log = TimingLog()
+        client = ApiClient(token=server.token, timing_log=timing_log)
+        try:
+            timing_log.current = 'gorest_test/test_pager.py::prefetched'
+            pages = [page.number for page in iter_pages(client, server.url + USERS_PATH, max_pages=3)]
+            timing_log.current = None
+        finally:
+            client.close()
+            server.stop()
+
+        assert pages == [1, 2, 3]
+        assert [entry['test'] for entry in timing_log.entries] == ['gorest_test/test_pager.py::prefetched'] * 3
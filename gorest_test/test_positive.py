@@ -1,8 +1,19 @@
+import collections
+
+import requests
+
+from latency import LatencyHistogram, latency_errors
+from pager import PageStats, iter_pages
+from provisioning import ProvisionedUser
+from race import fire_together, put_race_problems, race_summary
+from resources import exclusive, needs, produces
+from schema import ValidationResult, failure_summary, validate_users
+from slo import throughput_errors
 from verification import *
 
 class Test_GET_User:
 
-    def test_GET_integrated(self, user_endpoint, timeout_threshold):
+    def test_GET_integrated(self, client, user_endpoint, measure, slo):
         """An integrated positive test for GET method to a /users endpoint
 
         This test verifies if server correctly handles a valid request. 
@@ -13,7 +24,7 @@ class Test_GET_User:
 
         errors = []
         # GET request to endpoint
-        response = requests.get(user_endpoint)
+        response, latency = measure(lambda: client.get(user_endpoint), thresholds=slo.thresholds('GET', user_endpoint))
 
         # Verify Request was well taken by Server
         if response.status_code == requests.codes.ok:
@@ -24,27 +35,61 @@ class Test_GET_User:
                 errors.append("Status Code Error: received {}, expected 200".format(response_dict['code']))
             
             # Verify all user payloads have correct data types
-            wrong_user_cnt = 0
-            for user in response_dict['data']:
-                if not is_user_datatypes(user):
-                    wrong_user_cnt += 1
-            if wrong_user_cnt > 0:
-                errors.append("Payload Error: {} of the received users have wrong datatypes: ".format(wrong_user_cnt))
+            result = validate_users(response_dict['data'])
+            if result.invalid > 0:
+                errors.append("Payload Error: {} of the received users have wrong datatypes: {}"\
+                    .format(result.invalid, failure_summary(result)))
         
         # Show error if request was not well taken by Server
         else:
             errors.append('Request Error: Response is {}, Expected 200 '\
                     .format(response.status_code))
 
-        # Verify request response arrived within expected time threshold
-        if response.elapsed.total_seconds() > timeout_threshold:
-            errors.append("Performance Error: Response took {:.2f}ms. Threshold is {:.2f}ms"\
-                .format(response.elapsed.total_seconds()*1000, timeout_threshold*1000))
+        # Verify latency percentiles are within thresholds
+        errors.extend(latency_errors(latency, slo.thresholds('GET', user_endpoint)))
 
         # Report errors if any
         assert not errors, "Errors Occured:\n{}".format("\n".join(errors))
     
-    def test_GET_idempotency(self, user_endpoint):
+    def test_GET_all_pages(self, client, user_endpoint, max_pages, slo):
+        """A positive test for GET method over every page of a /users endpoint
+
+        This test walks the whole collection page by page and verifies the
+        status code of every page and the data types of every user as they
+        arrive, without holding more than two pages in memory. Per-page
+        latency is checked against the performance thresholds. A combination
+        of errors (if any) is reported at the end of the test.
+        """
+
+        errors = []
+        stats = PageStats()
+        wrong_user_cnt = 0
+        failures = collections.Counter()
+
+        # Validate each page while the next one is being fetched
+        for page in iter_pages(client, user_endpoint, stats=stats, max_pages=max_pages):
+            if page.status_code != requests.codes.ok:
+                errors.append('Request Error: Page {} response is {}, Expected 200 '.format(page.number, page.status_code))
+            elif page.code != requests.codes.ok:
+                errors.append("Status Code Error: Page {} received {}, expected 200".format(page.number, page.code))
+            result = validate_users(page.users)
+            wrong_user_cnt += result.invalid
+            failures.update(result.failures)
+
+        if wrong_user_cnt > 0:
+            errors.append("Payload Error: {} of the received users have wrong datatypes: {}"\
+                .format(wrong_user_cnt, failure_summary(ValidationResult(stats.users, wrong_user_cnt, failures))))
+
+        # Verify page latency percentiles and page rate are within thresholds
+        errors.extend(latency_errors(stats.latency, slo.thresholds('GET', user_endpoint)))
+        if stats.pages > 1:
+            errors.extend(throughput_errors(stats.pages_per_second, slo.of('GET', user_endpoint), 'pages/s'))
+
+        # Report errors if any
+        assert not errors, "Errors Occured:\n{}\n{}".format("\n".join(errors), stats.summary())
+
+    @exclusive
+    def test_GET_idempotency(self, client, user_endpoint):
         """A test of GET method's idempotency to a /users endpoint
 
         This test verifies that two subsequent GET requests to the same endpoint
@@ -53,24 +98,26 @@ class Test_GET_User:
 
         errors = []
         # Send to subsequent GET requests to users endpoint
-        response1 = requests.get(user_endpoint)
-        response2 = requests.get(user_endpoint)
+        response1 = client.get(user_endpoint)
+        response2 = client.get(user_endpoint)
 
         # Verify if responses are the same
         if not is_same_response(response1, response2):
-            errors.append("Response JSONs are not the same")
+            errors.append("Response JSONs are not the same: {}".format(response_differences(response1, response2)))
         
         # Report errors if any
         assert not errors, "Errors Occured:\n{}".format("\n".join(errors))
 
 class Test_POST_User:
 
-    def test_POST_integrated(self, user_endpoint, valid_payload,token, timeout_threshold):
+    @produces('user')
+    def test_POST_integrated(self, client, user_endpoint, valid_payload, cleanup_queue, resources, measure, slo):
         """An integrated positive test for POST method to a /users endpoint
 
         This test verifies that the server correctly handles a valid POST request. 
         In a single test it verifies the request's status code, the response's 
-        status code, payload, and performance. 
+        status code, payload, and performance. The user created is handed on
+        to a test needing one.
         A combination of errors (if any) is reported at the end of the test.
         """
 
@@ -78,18 +125,14 @@ class Test_POST_User:
         url = user_endpoint
 
         # Only perform test if email is available.
-        if make_email_free(url, valid_payload['email'], token):
+        if make_email_free(client, url, valid_payload['email']):
             # Perform valid POST request
-            access_token_header = "Bearer " + token
-            response_post = requests.post(
+            response_post = client.post(
                 url = url,
-                data = valid_payload,
-                headers={"Authorization": access_token_header})
+                data = valid_payload)
            
-            # Verify Performance
-            if response_post.elapsed.total_seconds() > timeout_threshold:
-                errors.append("Performance Error: Response took {:.2f}ms. Threshold is {:.2f}ms"\
-                    .format(response_post.elapsed.total_seconds()*1000, timeout_threshold*1000))
+            # Verify latency is within thresholds
+            errors.extend(latency_errors(measure.single(response_post), slo.thresholds('POST', user_endpoint)))
             
              # Verify Request was well taken by Server
             if response_post.status_code == requests.codes.ok:
@@ -102,16 +145,15 @@ class Test_POST_User:
                 # GET user that was just created
                 user_id = str(response_post_dict['data']['id'])
                 user_url = url + "/" + user_id
-                response_get = requests.get(url= user_url)
+                cleanup_queue.defer(user_url)
+                response_get = client.get(url= user_url)
                 response_get_dict = response_get.json()
                 if response_get_dict['code'] == requests.codes.ok:
                     # Verify GET response and payload are the same.
                     if not same_user(response_get_dict['data'],valid_payload):
                         errors.append('Payload Error: User data in database and payload is not the same')
-
-                    # Delete user created by POST
-                    if not user_resource_delete(url = user_url, token = token):
-                        errors.append('Clean Up Error: Failed to delete created user (ID: {})'.format(user_id))
+                    # Hand the user on to a PUT test (deleted at session end)
+                    resources.offer('user', ProvisionedUser(response_post_dict['data']['id'], user_url, valid_payload))
                 # Show error if GET method fails.
                 else:
                     errors.append('State Error: User could not be found at returned ID.')
@@ -128,7 +170,8 @@ class Test_POST_User:
 
 class Test_PUT_User_Resource:
 
-    def test_PUT_integrated(self, user_endpoint, valid_payload, token, timeout_threshold):
+    @needs('user')
+    def test_PUT_integrated(self, client, existing_user, valid_payload, measure, slo):
         """An integrated positive test for UPUT method to a /users/### endpoint
 
         This test verifies that the server correctly handles a valid PUT request
@@ -138,16 +181,13 @@ class Test_PUT_User_Resource:
         """
         
         errors = []
-        # Get ID of an existing user to create valid URI
-        user_id = str(get_valid_user_id(user_endpoint))
+        # Use a user created by another test or provisioned for this session (deleted at session end)
+        user_url = existing_user.url
 
         # Prepare and send PUT request
-        user_url = user_endpoint + "/" + user_id
-        access_token_header = {"Authorization": "Bearer " + token}
-        response_put = requests.put(
+        response_put = client.put(
             url = user_url,
-            data = valid_payload,
-            headers = access_token_header
+            data = valid_payload
         )
         
         # Verify PUT request was handled by server
@@ -163,61 +203,95 @@ class Test_PUT_User_Resource:
             else:
                 errors.append('Status Code Error: PUT method unsucessful. Received {}, Expected 200'\
                     .format(response_put_dict['code']))
-            
-            # Delete user created by POST
-            if not user_resource_delete(url = user_url, token = token):
-                errors.append('Clean Up Error: Failed to delete modified user (ID: {})'.format(user_id))
         
         # Error if request was not handled well by server
         else:
             errors.append("Server Error: PUT request Failed. Received {}, expected 200"\
                 .format(response_put.status_code))
 
+        # Verify latency is within thresholds
+        errors.extend(latency_errors(measure.single(response_put), slo.thresholds('PUT', user_url)))
+
         # Report Errors (if any)    
         assert not errors, "Errors Occured:\n{}".format("\n".join(errors))
 
-    def test_PUT_idempotency(self, user_endpoint, valid_payload, token):
+    @needs('user')
+    def test_PUT_idempotency(self, client, existing_user, valid_payload, measure, slo):
         """A test of PUT method's idempotency to a /users/### endpoint
 
         This test verifies that two subsequent PUT requests to the same endpoint
-        perform exactly the same action.
+        perform exactly the same action, and that their latency (corrected for
+        coordinated omission) is within thresholds.
         """
 
         errors = []
-        # Get ID of an existing user to create valid URI
-        user_id = str(get_valid_user_id(user_endpoint))
-
-        # Prepare Request
-        user_url = user_endpoint + "/" + user_id
-        access_token_header = {"Authorization": "Bearer " + token}
+        # Use a user created by another test or provisioned for this session (deleted at session end)
+        user_url = existing_user.url
 
-        # Perform two identical PUT requests
-        response_put_1 = requests.put(
+        # Perform two identical PUT requests, on one schedule
+        schedule = measure.schedule()
+        response_put_1 = schedule.send(lambda: client.put(
             url = user_url,
-            data = valid_payload,
-            headers = access_token_header
-        )
-        response_put_2 = requests.put(
+            data = valid_payload
+        ))
+        response_put_2 = schedule.send(lambda: client.put(
             url = user_url,
-            data = valid_payload,
-            headers = access_token_header
-        )
+            data = valid_payload
+        ))
+
+        # Verify latency is within thresholds
+        errors.extend(latency_errors(schedule.histogram(), slo.thresholds('PUT', user_url)))
 
         # Verify if requests were well handled
         if response_put_1.status_code == response_put_2.status_code == requests.codes.ok:
 
             # Error if their response is not exactly the same
             if not is_same_response(response_put_1, response_put_2):
-                errors.append("Response JSONs are not the same")
+                errors.append("Response JSONs are not the same: {}".format(response_differences(response_put_1, response_put_2)))
         
         # Error if any request as not well handled by server
         else:
             errors.append('Request Error: Server responded {} and {} respectively, expected 200 for both'\
                 .format(response_put_1.status_code, response_put_2.status_code))
-        
-        # Delete user edited by PUT
-            if not user_resource_delete(url = user_url, token = token):
-                errors.append('Clean Up Error: Failed to delete modified user (ID: {})'.format(user_id))
 
         # Report Errors (if any)
-        assert not errors, "Errors Occured:\n{}".format("\n".join(errors))
\ No newline at end of file
+        assert not errors, "Errors Occured:\n{}".format("\n".join(errors))
+
+    @needs('user')
+    def test_PUT_idempotency_race(self, client, existing_user, payload_factory, race_width, race_rounds, measure, slo):
+        """A test of PUT method's idempotency under identical concurrent requests to a /users/### endpoint
+
+        Each round sends the same PUT request several times at the same moment.
+        This test verifies that every request succeeds with the same response,
+        and that the user converges to the values sent. The latency of every
+        request under contention is also verified. A combination of errors
+        (if any) is reported at the end of the test.
+        """
+
+        errors = []
+        # Use a user created by another test or provisioned for this session (deleted at session end)
+        user_url = existing_user.url
+        rounds = []
+        contention = LatencyHistogram()
+        responses = []
+
+        for _ in range(race_rounds):
+            payload = payload_factory.make(VALID_PAYLOAD)
+
+            # Perform identical PUT requests at once, then read the user back
+            attempts = fire_together(client, 'PUT', user_url, race_width, data=payload)
+            rounds.append(put_race_problems(attempts, client.get(user_url), payload))
+            for attempt in attempts:
+                contention.record(attempt.latency)
+            responses.extend(attempt.response for attempt in attempts if not isinstance(attempt.response, Exception))
+
+        # Verify every round converged
+        summary = race_summary('PUT', race_width, rounds, contention)
+        if summary is not None:
+            errors.append(summary)
+
+        # Verify latency percentiles under contention are within thresholds
+        errors.extend(latency_errors(measure.single(*responses), slo.thresholds('PUT', user_url)))
+
+        # Report Errors (if any)
+        assert not errors, "Errors Occured:\n{}".format("\n".join(errors))
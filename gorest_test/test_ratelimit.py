@@ -0,0 +1,103 @@
+import pytest
+
+from ratelimit import RateLimiter, retry_after
+
+
+class FakeClock:
+    """A clock that only moves when the limiter sleeps."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class Response:
+    """A stand-in for a response with a status code and headers."""
+
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def limit_headers(limit, remaining, reset):
+    return {'X-RateLimit-Limit': str(limit), 'X-RateLimit-Remaining': str(remaining), 'X-RateLimit-Reset': str(reset)}
+
+
+class Test_RateLimiter:
+
+    def test_unpaced_until_limit_advertised(self):
+        """A test that requests are not paced before any response advertised a limit"""
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+        for _ in range(100):
+            assert limiter.acquire() == 0.0
+        limiter.observe(Response())
+
+        assert limiter.acquire() == 0.0
+        assert clock.sleeps == []
+
+    def test_learns_limit_from_headers(self):
+        """A test that the bucket holds the advertised limit and refills it over the reset period"""
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+        limiter.observe(Response(headers=limit_headers(2, 2, 1.0)))
+
+        assert limiter.acquire() == 0.0
+        assert limiter.acquire() == 0.0
+        # Empty: the next token comes after 1/2s at 2 requests per second
+        assert limiter.acquire() == pytest.approx(0.5)
+        assert limiter.waited == pytest.approx(0.5)
+
+    def test_remaining_caps_tokens(self):
+        """A test that the bucket never holds more tokens than the server says remain"""
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+        limiter.observe(Response(headers=limit_headers(10, 0, 5.0)))
+
+        assert limiter.acquire() == pytest.approx(0.5)
+
+    def test_backs_off_after_429(self):
+        """A test that a 429 blocks every request until the time the server asked to wait has passed"""
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+        limiter.observe(Response(429, {'Retry-After': '3'}))
+
+        assert limiter.acquire() == pytest.approx(3.0)
+        assert limiter.acquire() == 0.0
+
+    def test_retry_after_defaults(self):
+        """A test of the wait read from a 429: Retry-After, then X-RateLimit-Reset, then one second"""
+        assert retry_after(Response(429, {'Retry-After': '2', 'X-RateLimit-Reset': '5'})) == 2.0
+        assert retry_after(Response(429, {'X-RateLimit-Reset': '5'})) == 5.0
+        assert retry_after(Response(429, {'Retry-After': 'soon'})) == 1.0
+        assert retry_after(Response(429, {'Retry-After': '-1'})) == 0.0
+
+    def test_state_file_shared(self, tmp_path):
+        """A test that limiters sharing a state file share one budget"""
+        clock = FakeClock()
+        state_file = str(tmp_path / "bucket.json")
+        first = RateLimiter(state_file, clock=clock, sleep=clock.sleep)
+        second = RateLimiter(state_file, clock=clock, sleep=clock.sleep)
+        first.observe(Response(headers=limit_headers(1, 1, 1.0)))
+
+        assert first.acquire() == 0.0
+        assert second.acquire() == pytest.approx(1.0)
+
+    def test_bound_gives_up(self):
+        """A test that a bound refusing a wait gives up before sleeping"""
+        clock = FakeClock()
+        limiter = RateLimiter(clock=clock, sleep=clock.sleep)
+        limiter.observe(Response(429, {'Retry-After': '30'}))
+
+        def bound(seconds):
+            raise TimeoutError(seconds)
+        with pytest.raises(TimeoutError):
+            limiter.acquire(bound=bound)
+        assert clock.sleeps == []
@@ -0,0 +1,43 @@
+from resources import exclusive, exclusive_plan, needs, produces, resource_plan, waited_for
+
+
+@produces('user')
+def producer():
+    pass
+
+@needs('user')
+def consumer():
+    pass
+
+@exclusive
+def reader():
+    pass
+
+def other():
+    pass
+
+
+class Test_Exclusive_Plan:
+
+    def test_exclusive_runs_alone(self):
+        """A test that every other test either finishes before an exclusive test starts, or waits for it"""
+        funcs = [producer, consumer, reader, other]
+        edges = exclusive_plan(funcs, resource_plan(funcs, {})[0])
+
+        for index in range(len(funcs)):
+            if index != 2:
+                assert index in waited_for(edges, 2) or 2 in waited_for(edges, index)
+        assert all(index not in waited_for(edges, index) for index in range(len(funcs)))
+
+    def test_exclusive_waits_for_its_producers(self):
+        """A test that an exclusive test needing a resource runs after its producer, and before everything else"""
+        @exclusive
+        @needs('user')
+        def exclusive_consumer():
+            pass
+
+        funcs = [other, producer, exclusive_consumer, consumer]
+        edges = exclusive_plan(funcs, resource_plan(funcs, {})[0])
+
+        assert waited_for(edges, 2) == {1}
+        assert 2 in edges[0] and 2 in edges[3]
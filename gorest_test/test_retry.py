@@ -0,0 +1,196 @@
+import pytest
+import requests
+
+from client import ApiClient
+from deadline import CURRENT as CURRENT_DEADLINE, Deadline, DeadlineExceeded
+from ratelimit import RateLimiter
+from fake_server import FakeGorestServer, constant_latency
+from retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+
+USERS_PATH = "/public-api/users"
+
+
+class UpperBound:
+    """A stand-in for random.Random that always draws the upper bound."""
+
+    def uniform(self, low, high):
+        return high
+
+
+class Response:
+    """A stand-in for a response with a status code and headers."""
+
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeClock:
+    """A clock that only moves when told to."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Test_RetryPolicy:
+
+    def test_post_not_retried(self):
+        """A test that only idempotent methods are retried, and no more than the attempts allowed"""
+        policy = RetryPolicy(attempts=3)
+
+        assert not policy.should_retry('POST', 1)
+        assert policy.should_retry('get', 1)
+        assert policy.should_retry('PUT', 2)
+        assert not policy.should_retry('PUT', 3)
+
+    def test_failures(self):
+        """A test of the attempts worth retrying: connection errors, timeouts and 5xx statuses"""
+        policy = RetryPolicy()
+
+        assert policy.is_retryable(error=requests.ConnectionError())
+        assert not policy.is_retryable(error=CircuitOpenError())
+        assert not policy.is_failure(error=CircuitOpenError())
+        assert policy.is_retryable(Response(503))
+        assert not policy.is_retryable(Response(404))
+        assert not policy.is_retryable(Response(429))
+
+    def test_backoff_bounds(self):
+        """A test that waits double from the initial backoff up to the maximum, and never go below zero"""
+        policy = RetryPolicy(backoff=0.1, max_backoff=0.5, rng=UpperBound())
+
+        assert [policy.delay(attempt) for attempt in range(1, 6)] == pytest.approx([0.1, 0.2, 0.4, 0.5, 0.5])
+        jittered = RetryPolicy(backoff=0.1, max_backoff=0.5)
+        assert all(0 <= jittered.delay(attempt) <= 0.5 for attempt in range(1, 50))
+
+    def test_client_retries(self):
+        """A test that a failing GET is sent again as the policy allows, and a failing POST only once"""
+        server = FakeGorestServer(error_rate=1.0, seed_users=1).start()
+        client = ApiClient(token=server.token, retry=RetryPolicy(attempts=3, backoff=0))
+        try:
+            response_get = client.get(server.url + USERS_PATH)
+            response_post = client.post(server.url + USERS_PATH, data={'name': 'x'})
+        finally:
+            client.close()
+            server.stop()
+
+        assert (response_get.status_code, response_get.retries) == (500, 2)
+        assert (response_post.status_code, response_post.retries) == (500, 0)
+
+
+class Test_CircuitBreaker:
+
+    def test_opens_after_threshold(self):
+        """A test that the circuit opens after threshold consecutive failures, and a success resets the count"""
+        breaker = CircuitBreaker(threshold=3, clock=FakeClock())
+        for failed in (True, True, False, True, True):
+            breaker.record(failed)
+        assert not breaker.is_open
+        breaker.record(True)
+
+        assert breaker.is_open
+        with pytest.raises(CircuitOpenError):
+            breaker.before_request(USERS_PATH)
+
+    def test_half_open_trial(self):
+        """A test that a single trial request is let through after the reset timeout, closing the circuit if it succeeds"""
+        clock = FakeClock()
+        breaker = CircuitBreaker(threshold=1, reset_timeout=30.0, clock=clock)
+        breaker.record(True)
+        clock.now = 30.0
+
+        breaker.before_request(USERS_PATH)
+        with pytest.raises(CircuitOpenError):
+            breaker.before_request(USERS_PATH)
+        breaker.record(False)
+
+        assert not breaker.is_open
+        breaker.before_request(USERS_PATH)
+
+    def test_failed_trial_stays_open(self):
+        """A test that a failed trial request keeps the circuit open for another reset timeout"""
+        clock = FakeClock()
+        breaker = CircuitBreaker(threshold=1, reset_timeout=30.0, clock=clock)
+        breaker.record(True)
+        clock.now = 30.0
+        breaker.before_request(USERS_PATH)
+        breaker.record(True)
+
+        assert breaker.is_open
+        with pytest.raises(CircuitOpenError):
+            breaker.before_request(USERS_PATH)
+        clock.now = 60.0
+        breaker.before_request(USERS_PATH)
+
+
+class Test_Deadline:
+
+    def test_deadline_timeout_counts_for_breaker(self):
+        """A test that a deadline timeout is a failure for the circuit breaker, but not worth retrying"""
+        policy = RetryPolicy()
+        error = DeadlineExceeded("Deadline exceeded during request", sent=True)
+
+        assert policy.is_failure(error=error)
+        assert not policy.is_retryable(error=error)
+        assert policy.is_retryable(error=requests.Timeout())
+
+    def test_stalled_server_trips_breaker(self):
+        """A test that tests whose requests stall past their deadline open the circuit instead of resetting it"""
+        server = FakeGorestServer(latency=constant_latency(0.3), seed_users=1).start()
+        breaker = CircuitBreaker(threshold=2)
+        client = ApiClient(token=server.token, timeout=5.0, retry=RetryPolicy(attempts=3, backoff=0), breaker=breaker)
+        try:
+            for _ in range(2):
+                token = CURRENT_DEADLINE.set(Deadline(0.1, shares={'request': 1.0}))
+                try:
+                    with pytest.raises(DeadlineExceeded) as raised:
+                        client.get(server.url + USERS_PATH)
+                    assert raised.value.sent
+                finally:
+                    CURRENT_DEADLINE.reset(token)
+        finally:
+            client.close()
+            server.stop()
+
+        assert breaker.is_open
+
+    def test_exhausted_budget_keeps_breaker_closed(self):
+        """A test that requests refused because the test's budget is used up do not count toward the circuit breaker"""
+        server = FakeGorestServer(seed_users=1).start()
+        breaker = CircuitBreaker(threshold=2)
+        client = ApiClient(token=server.token, breaker=breaker)
+        token = CURRENT_DEADLINE.set(Deadline(0.0))
+        try:
+            for _ in range(5):
+                with pytest.raises(DeadlineExceeded) as raised:
+                    client.get(server.url + USERS_PATH)
+                assert not raised.value.sent
+        finally:
+            CURRENT_DEADLINE.reset(token)
+
+        try:
+            assert not breaker.is_open
+            assert client.get(server.url + USERS_PATH).status_code == 200
+        finally:
+            client.close()
+            server.stop()
+
+    def test_waits_bounded_by_deadline(self):
+        """A test that a rate limiter or retry backoff wait outlasting the deadline raises instead of blocking"""
+        server = FakeGorestServer(error_rate=1.0, seed_users=1).start()
+        limiter = RateLimiter()
+        limiter.observe(Response(429, {'Retry-After': '60'}))
+        clients = [ApiClient(token=server.token, rate_limiter=limiter),
+            ApiClient(token=server.token, retry=RetryPolicy(attempts=3, backoff=60, max_backoff=60, rng=UpperBound()))]
+        token = CURRENT_DEADLINE.set(Deadline(5.0))
+        try:
+            for client in clients:
+                with pytest.raises(DeadlineExceeded, match="would outlast"):
+                    client.get(server.url + USERS_PATH)
+        finally:
+            CURRENT_DEADLINE.reset(token)
+            for client in clients:
+                client.close()
+            server.stop()
@@ -0,0 +1,85 @@
+import math
+
+import pytest
+
+from sequential import MET, VIOLATED, SequentialTest, sequential_tests, settled
+
+FAST = 0.01
+SLOW = 2.0
+
+
+def samples_to_decide(test, latency):
+    """Records latency until test decides, and returns how many samples it took."""
+    for count in range(1, 1000):
+        test.record(latency)
+        if test.decision is not None:
+            return count
+    raise AssertionError("no decision after 1000 samples")
+
+
+class Test_SequentialTest:
+
+    def test_accept_bound(self):
+        """A test that fast samples meet a percentile as soon as the log likelihood ratio crosses the lower bound
+
+        At 95% confidence the bound is log(19); for p95 every fast sample adds log(0.70/0.95).
+        """
+        test = SequentialTest(95, 1.0, confidence=0.95)
+        expected = math.ceil(math.log(19) / -math.log(0.70 / 0.95))
+
+        assert samples_to_decide(test, FAST) == expected
+        assert test.decision == MET
+        assert test.confidence >= 0.95
+
+    def test_reject_bound(self):
+        """A test that slow samples violate a percentile as soon as the log likelihood ratio crosses the upper bound
+
+        For p95 every slow sample adds log(0.30/0.05).
+        """
+        test = SequentialTest(95, 1.0, confidence=0.95)
+        expected = math.ceil(math.log(19) / math.log(0.30 / 0.05))
+
+        assert samples_to_decide(test, SLOW) == expected
+        assert test.decision == VIOLATED
+        assert test.verdict().exceeded == expected
+
+    def test_decision_is_final(self):
+        """A test that samples recorded once the test decided are ignored"""
+        test = SequentialTest(95, 1.0, confidence=0.9)
+        samples_to_decide(test, SLOW)
+        verdict = test.verdict()
+        for _ in range(50):
+            test.record(FAST)
+
+        assert test.verdict() == verdict
+
+    def test_undecided(self):
+        """A test that samples alternating between the hypotheses leave the test undecided"""
+        test = SequentialTest(50, 1.0, confidence=0.99, tolerance=0.25)
+        for latency in (FAST, SLOW) * 5:
+            test.record(latency)
+
+        assert test.decision is None
+        assert "undecided" in test.verdict().summary()
+
+    def test_confidence_range(self):
+        """A test that the confidence must be above one half and below one"""
+        for confidence in (0.5, 1.0, 1.5):
+            with pytest.raises(ValueError):
+                SequentialTest(95, 1.0, confidence=confidence)
+
+
+class Test_Settled:
+
+    def test_settled(self):
+        """A test that sampling stops once one percentile is violated, or once every one is met"""
+        tests = sequential_tests({95: 1.0, 99: 5.0}, confidence=0.95)
+        tests[95].record(SLOW)
+        tests[95].record(SLOW)
+        assert settled(tests)
+
+        tests = sequential_tests({95: 1.0, 99: 2.0}, confidence=0.95)
+        samples_to_decide(tests[95], FAST)
+        assert not settled(tests)
+        samples_to_decide(tests[99], FAST)
+        assert settled(tests)
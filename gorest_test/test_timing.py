@@ -0,0 +1,46 @@
+import asyncio
+
+from client import ApiClient, AsyncClient
+from fake_server import FakeGorestServer
+from timing import TimingLog
+
+USERS_PATH = "/public-api/users"
+
+
+class Test_TimingLog:
+
+    def test_fanned_out_request_attribution(self):
+        """A test of the attribution of requests sent from AsyncClient worker threads
+
+        A request sent through `AsyncClient.run` while a test is current must
+        be logged under that test, not under none.
+        """
+
+        server = FakeGorestServer(seed_users=1).start()
+        timing_log = TimingLog()
+        client = ApiClient(token=server.token, timing_log=timing_log)
+        async_client = AsyncClient(client, concurrency=2)
+        try:
+            timing_log.current = 'gorest_test/test_timing.py::fanned_out'
+            asyncio.run(async_client.get(server.url + USERS_PATH))
+            timing_log.current = None
+        finally:
+            async_client.close()
+            client.close()
+            server.stop()
+
+        assert [entry['test'] for entry in timing_log.entries] == ['gorest_test/test_timing.py::fanned_out']
+
+    def test_request_outside_test(self):
+        """A test of the attribution of requests sent while no test is current"""
+
+        server = FakeGorestServer(seed_users=1).start()
+        timing_log = TimingLog()
+        client = ApiClient(token=server.token, timing_log=timing_log)
+        try:
+            client.get(server.url + USERS_PATH)
+        finally:
+            client.close()
+            server.stop()
+
+        assert [entry['test'] for entry in timing_log.entries] == [None]
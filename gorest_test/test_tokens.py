@@ -0,0 +1,40 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from tokens import TokenPool, token_label
+
+TOKENS = ['a' * 64, 'b' * 64, 'c' * 64]
+USER_URL = "http://127.0.0.1/public-api/users"
+
+
+class Test_TokenPool:
+
+    def test_fanned_out_requests_share_token(self):
+        """A test that requests a test fans out to worker threads are sent with the token assigned to it"""
+        pool = TokenPool(TOKENS)
+        token = pool.assign()
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, pool.token_for, USER_URL) for _ in range(8)]
+            tokens = {future.result() for future in futures}
+        pool.release()
+
+        assert tokens == {token}
+        assert pool.current is None
+
+    def test_release_without_requests(self):
+        """A test that tests sending no request do not keep weighing on least_loaded once released"""
+        pool = TokenPool(TOKENS, strategy='least_loaded')
+        for _ in range(len(TOKENS)):
+            pool.assign()
+            pool.release()
+
+        # No token has sent a request, so none is busier than the first
+        assert pool.assign() == TOKENS[0]
+        assert pool.report()[token_label(TOKENS[0])]['tests'] == len(TOKENS) + 1
+
+    def test_least_loaded_spreads_running_tests(self):
+        """A test that tests running at the same time are assigned different tokens by least_loaded"""
+        pool = TokenPool(TOKENS, strategy='least_loaded')
+        contexts = [contextvars.copy_context() for _ in TOKENS]
+
+        assert len({context.run(pool.assign) for context in contexts}) == len(TOKENS)
@@ -0,0 +1,84 @@
+import itertools
+import os
+import threading
+import uuid
+
+
+def worker_id():
+    """A simple function that returns the name of the current test worker (pytest-xdist sets PYTEST_XDIST_WORKER)."""
+    return os.environ.get('PYTEST_XDIST_WORKER', 'main')
+
+
+class PayloadFactory:
+    """Builds user payloads whose emails cannot collide with any other run.
+
+    Every email gets the run tag (random per process), the worker name and a
+    counter appended to its local part, so two workers, CI shards or
+    engineers never post or clean up the same address.
+    """
+
+    def __init__(self, run_tag=None, worker=None):
+        self.run_tag = run_tag or uuid.uuid4().hex[:8]
+        self.worker = worker or worker_id()
+        self._counter = itertools.count(1)
+
+    def email(self, template_email):
+        """Returns a new unique email based on template_email."""
+        local, domain = template_email.split('@', 1)
+        return "{}.{}.{}.{}@{}".format(local, self.run_tag, self.worker, next(self._counter), domain)
+
+    def make(self, template):
+        """Returns a copy of the template payload with a unique email."""
+        payload = dict(template)
+        if isinstance(payload.get('email'), str):
+            payload['email'] = self.email(payload['email'])
+        return payload
+
+
+class OwnershipRegistry:
+    """Keeps track of the users created by this run.
+
+    Installed as a response hook on the HTTP client, it registers the URL of
+    every user created by a successful POST and forgets it once a DELETE
+    succeeds. Cleanup helpers only delete URLs found here.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._urls = set()
+
+    def register(self, url):
+        """Marks the user at url as created by this run."""
+        with self._lock:
+            self._urls.add(url)
+
+    def release(self, url):
+        """Forgets the user at url."""
+        with self._lock:
+            self._urls.discard(url)
+
+    def owns(self, url):
+        """Returns if the user at url was created by this run."""
+        with self._lock:
+            return url in self._urls
+
+    def owned(self):
+        """Returns the URLs of every user created by this run and not yet deleted."""
+        with self._lock:
+            return sorted(self._urls)
+
+    def observe(self, response, *args, **kwargs):
+        """A requests response hook that registers created users and releases deleted ones."""
+        method = response.request.method
+        if method not in ('POST', 'DELETE') or response.status_code != 200:
+            return
+        try:
+            response_dict = response.json()
+        except ValueError:
+            return
+        if not isinstance(response_dict, dict):
+            return
+        if method == 'POST' and response_dict.get('code') == 201:
+            self.register(response.request.url.rstrip('/') + '/{}'.format(response_dict['data']['id']))
+        elif method == 'DELETE' and response_dict.get('code') in (204, 404):
+            self.release(response.request.url)
@@ -0,0 +1,215 @@
+import collections
+import contextvars
+import json
+import re
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+
+from latency import LatencyHistogram
+
+PHASES = ('dns', 'connect', 'tls', 'send', 'ttfb', 'download')
+
+
+class PhaseTimings(collections.namedtuple('PhaseTimings', PHASES)):
+    """Where the time of a single request went, in seconds.
+
+    dns, connect and tls are only spent by requests that opened a new
+    connection, and are zero on a reused keep-alive connection. send is the
+    time to write the request, ttfb the wait from the request being sent to
+    the response headers being received (server processing plus one round
+    trip), and download the time to read the response body.
+    """
+    __slots__ = ()
+
+    @property
+    def total(self):
+        return sum(self)
+
+    def summary(self):
+        """Returns a one-line breakdown in milliseconds."""
+        return " ".join("{}={:.2f}ms".format(phase, value*1000) for phase, value in zip(PHASES, self))
+
+
+class _TimedConnectionMixin:
+    """Records the phases of every request sent on a urllib3 connection."""
+
+    def _reset_timings(self):
+        self._setup = [0.0, 0.0, 0.0]
+        self._request_sent = None
+        self._send = 0.0
+
+    def _new_conn(self):
+        started = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(self._dns_host, self.port, 0, socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise NewConnectionError(self, "Failed to establish a new connection: %s" % e)
+        resolved = time.perf_counter()
+        host, error = self._dns_host, None
+        try:
+            # Connect to the addresses already resolved, so DNS is not timed twice
+            for address in collections.OrderedDict.fromkeys(info[4][0] for info in addresses):
+                self._dns_host = address
+                try:
+                    conn = super()._new_conn()
+                    break
+                except NewConnectionError as e:
+                    error = e
+            else:
+                raise error
+        finally:
+            self._dns_host = host
+        self._setup[0] += resolved - started
+        self._setup[1] += time.perf_counter() - resolved
+        return conn
+
+    def connect(self):
+        if not hasattr(self, '_setup'):
+            self._reset_timings()
+        started = time.perf_counter()
+        dns, tcp = self._setup[0], self._setup[1]
+        super().connect()
+        # Anything that was not DNS or TCP is the TLS handshake (zero over plain HTTP)
+        self._setup[2] += max(time.perf_counter() - started - (self._setup[0] - dns) - (self._setup[1] - tcp), 0.0)
+
+    def request(self, *args, **kwargs):
+        if not hasattr(self, '_setup'):
+            self._reset_timings()
+        started = time.perf_counter()
+        setup = sum(self._setup)
+        super().request(*args, **kwargs)
+        self._request_sent = time.perf_counter()
+        # Plain HTTP connects lazily while sending the first request
+        self._send = self._request_sent - started - (sum(self._setup) - setup)
+
+    def getresponse(self, *args, **kwargs):
+        response = super().getresponse(*args, **kwargs)
+        received = time.perf_counter()
+        sent = self._request_sent if self._request_sent is not None else received
+        self.timings = (self._setup[0], self._setup[1], self._setup[2], self._send, received - sent)
+        self._reset_timings()
+        return response
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimingAdapter(HTTPAdapter):
+    """An HTTPAdapter that attaches the PhaseTimings of every request to its response as `response.timings`.
+
+    The body is read here rather than by the session, so its download time
+    is measured too. Streamed responses are returned unread and report a
+    download time of zero.
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': TimedHTTPConnectionPool, 'https': TimedHTTPSConnectionPool}
+
+    def send(self, request, stream=False, **kwargs):
+        response = super().send(request, stream=True, **kwargs)
+        connection = getattr(response.raw, '_connection', None)
+        phases = getattr(connection, 'timings', None) or (0.0, 0.0, 0.0, 0.0, response.elapsed.total_seconds())
+        download = 0.0
+        if not stream:
+            started = time.perf_counter()
+            response.content
+            download = time.perf_counter() - started
+        response.timings = PhaseTimings(*phases, download)
+        return response
+
+
+def endpoint_pattern(method, url):
+    """A simple function that returns the endpoint of a request with ids replaced, e.g. 'PUT /public-api/users/{id}'."""
+    path = re.sub(r'/\d+(?=/|$)', '/{id}', urlsplit(url).path.rstrip('/'))
+    return "{} {}".format(method.upper(), path)
+
+
+class TimingLog:
+    """A thread-safe log of the phase timings of every response, written as a JSON report.
+
+    Responses are attributed to the test set as `current` in the context
+    that sent them, so requests fanned out to worker threads are attributed
+    to the test that fanned them out. Attempts that were retried are logged, but kept out of the
+    latency summary.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current = contextvars.ContextVar('timing_test', default=None)
+        self.entries = []
+        self._taken = 0
+
+    @property
+    def current(self):
+        return self._current.get()
+
+    @current.setter
+    def current(self, test):
+        self._current.set(test)
+
+    def observe(self, response, retried=False):
+        timings = getattr(response, 'timings', None)
+        if timings is None:
+            return
+        entry = {
+            'test': self.current,
+            'endpoint': endpoint_pattern(response.request.method, response.request.url),
+            'url': response.request.url,
+            'status_code': response.status_code,
+            'retried': retried,
+            'total': timings.total,
+            'phases': timings._asdict(),
+        }
+        with self._lock:
+            self.entries.append(entry)
+
+    def take_new(self):
+        """Returns the entries logged since the previous call."""
+        with self._lock:
+            entries, self._taken = self.entries[self._taken:], len(self.entries)
+        return entries
+
+    def summary(self):
+        """Returns the latency distribution of every phase, and the number of retried attempts, per endpoint."""
+        histograms = collections.defaultdict(lambda: {phase: LatencyHistogram() for phase in PHASES + ('total',)})
+        retried = collections.Counter()
+        with self._lock:
+            entries = list(self.entries)
+        for entry in entries:
+            if entry.get('retried'):
+                retried[entry['endpoint']] += 1
+                continue
+            endpoint = histograms[entry['endpoint']]
+            endpoint['total'].record(entry['total'])
+            for phase, value in entry['phases'].items():
+                endpoint[phase].record(value)
+        summary = {endpoint: {phase: histogram.to_dict() for phase, histogram in phases.items()}
+            for endpoint, phases in histograms.items()}
+        for endpoint, count in retried.items():
+            summary.setdefault(endpoint, {})['retried_attempts'] = count
+        return summary
+
+    def write(self, path, **sections):
+        """Writes every request and the per-endpoint summary as JSON to path, along with any extra sections."""
+        with self._lock:
+            entries = list(self.entries)
+        with open(path, 'w') as f:
+            json.dump(dict({'endpoints': self.summary(), 'requests': entries}, **sections), f, indent=2)
@@ -0,0 +1,175 @@
+import collections
+import contextvars
+import itertools
+import os
+import re
+import threading
+
+STRATEGIES = ('round_robin', 'least_loaded', 'worker')
+DEFAULT_PATH = "gorest_test/tokens.txt"
+
+
+def read_tokens(environ, path=DEFAULT_PATH):
+    """A function that returns the tokens of the pool, from GOREST_TOKENS (separated by commas or whitespace) or one per line in path.
+
+    Returns an empty list if neither is set."""
+    if environ.get('GOREST_TOKENS'):
+        text = environ['GOREST_TOKENS']
+    elif os.path.isfile(path):
+        with open(path, 'r') as f:
+            text = f.read()
+    else:
+        return []
+    return list(dict.fromkeys(token for token in re.split(r'[\s,]+', text) if token))
+
+def token_label(token):
+    """A simple function that returns a token shortened so that it can be shown in reports, e.g. '90a560...'."""
+    return token[:6] + '...'
+
+def bearer_token(request):
+    """A simple function that returns the bearer token a prepared request was sent with, or None."""
+    authorization = request.headers.get('Authorization', '')
+    return authorization[len('Bearer '):] if authorization.startswith('Bearer ') else None
+
+def worker_index(worker):
+    """A simple function that returns the number of a pytest-xdist worker name, e.g. 3 for 'gw3'. 0 for the main process."""
+    digits = re.sub(r'\D', '', worker or '')
+    return int(digits) if digits else 0
+
+
+class TokenPool:
+    """Several API accounts' bearer tokens, sharing the write traffic of a run.
+
+    Each test is assigned a token when it starts, kept as `current` in the
+    context running it so that requests it fans out to worker threads share
+    it: the next one in turn (round_robin), the one with the fewest requests
+    sent and tests running so far (least_loaded), or the same one for every
+    test of a pytest-xdist worker (worker). The test releases it when it
+    ends. Requests sent outside a test get a token of their own the same way. Requests to a user this run created are
+    always sent with the token that created it, so that the account owning
+    the user is the one updating and deleting it.
+
+    Every token has its own rate limiter when a limiter factory is given, and
+    the requests, 429s and failures of each token are counted for the report.
+    Installed as a response hook on the HTTP client, the pool observes every
+    response.
+    """
+
+    def __init__(self, tokens, strategy='round_robin', limiter_factory=None, worker=None):
+        if strategy not in STRATEGIES:
+            raise ValueError("Unknown token strategy '{}'. Expected one of {}".format(strategy, ", ".join(STRATEGIES)))
+        self.tokens = list(dict.fromkeys(tokens))
+        if not self.tokens:
+            raise ValueError("A token pool needs at least one token")
+        self.strategy = strategy
+        self.worker = worker
+        self._lock = threading.Lock()
+        self._current = contextvars.ContextVar('pool_token', default=None)
+        self._cycle = itertools.cycle(self.tokens)
+        self._usage = {token: collections.Counter() for token in self.tokens}
+        self._owners = {}
+        self._limiters = {token: limiter_factory(token) for token in self.tokens} if limiter_factory else {}
+
+    def __len__(self):
+        return len(self.tokens)
+
+    @property
+    def current(self):
+        return self._current.get()
+
+    @current.setter
+    def current(self, token):
+        self._current.set(token)
+
+    def _pick(self):
+        with self._lock:
+            if self.strategy == 'worker':
+                token = self.tokens[worker_index(self.worker) % len(self.tokens)]
+            elif self.strategy == 'least_loaded':
+                token = min(self.tokens, key=lambda token: self._usage[token]['requests'] + self._usage[token]['pending'])
+            else:
+                token = next(self._cycle)
+        return token
+
+    def assign(self):
+        """Assigns a token to the test run in the calling context, and returns it."""
+        token = self._pick()
+        with self._lock:
+            self._usage[token]['tests'] += 1
+            # Counted while the test runs, so that tests starting together spread out
+            self._usage[token]['pending'] += 1
+        self.current = token
+        return token
+
+    def release(self):
+        """Ends the assignment of the test run in the calling context."""
+        token, self.current = self.current, None
+        if token is None:
+            return
+        with self._lock:
+            if self._usage[token]['pending']:
+                self._usage[token]['pending'] -= 1
+
+    def token_for(self, url):
+        """Returns the token a request to url is sent with."""
+        with self._lock:
+            owner = self._owners.get(url.rstrip('/'))
+        return owner or self.current or self._pick()
+
+    def limiter(self, token):
+        """Returns the rate limiter of token, or None."""
+        return self._limiters.get(token)
+
+    def failed(self, token):
+        """Counts a request sent with token that got no response."""
+        with self._lock:
+            self._count(token, failed=True)
+
+    def _count(self, token, throttled=False, failed=False):
+        usage = self._usage.get(token)
+        if usage is None:
+            return
+        usage['requests'] += 1
+        usage['throttled'] += throttled
+        usage['failed'] += failed
+
+    def observe(self, response, *args, **kwargs):
+        """A requests response hook that counts the request against its token, and records who owns the users it created."""
+        token = bearer_token(response.request)
+        if token not in self._usage:
+            return
+        with self._lock:
+            self._count(token, throttled=response.status_code == 429, failed=response.status_code >= 500)
+        method = response.request.method
+        if method not in ('POST', 'DELETE') or response.status_code != 200:
+            return
+        try:
+            response_dict = response.json()
+        except ValueError:
+            return
+        if not isinstance(response_dict, dict):
+            return
+        with self._lock:
+            if method == 'POST' and response_dict.get('code') == 201:
+                self._owners[response.request.url.rstrip('/') + '/{}'.format(response_dict['data']['id'])] = token
+            elif method == 'DELETE' and response_dict.get('code') in (204, 404):
+                self._owners.pop(response.request.url.rstrip('/'), None)
+
+    def report(self):
+        """Returns the tests, requests, 429s, failures and rate limit waits of every token, keyed by token label."""
+        report = {}
+        with self._lock:
+            for token in self.tokens:
+                usage = self._usage[token]
+                limiter = self._limiters.get(token)
+                report[token_label(token)] = {'tests': usage['tests'], 'requests': usage['requests'],
+                    'throttled': usage['throttled'], 'failed': usage['failed'],
+                    'waited': round(limiter.waited, 3) if limiter is not None else 0.0}
+        return report
+
+
+def print_usage(report, out):
+    """A function that prints a token usage report, one line per token."""
+    for label, usage in report.items():
+        out.write("Token {}: {} test(s), {} request(s), {} throttled, {} failed, {:.2f}s waiting on the rate limit\n".format(
+            label, usage['tests'], usage['requests'], usage['throttled'], usage['failed'], usage['waited']))
@@ -2,88 +2,466 @@ import pytest
 import requests
 import json
 import datetime
-import sys
 import random
 import os.path
+import uuid
+import itertools
+from client import ApiClient, AsyncClient
+from cache import TTLCache
+from cassette import cassette_from_env
+from events import CURRENT_TEST, sink_from_env
+from deadline import CURRENT as CURRENT_DEADLINE, Deadline, in_phase
+from ratelimit import RateLimiter, default_state_file
+from retry import CircuitBreaker, RetryPolicy
+from digest import response_digest, structured_diff
+from timing import TimingLog
+from tokens import TokenPool, read_tokens
+from history import HistoryStore
+from negative import (describe_behavior, describe_case, group_behaviors, inconsistent_cases, is_rejected,
+    response_signature)
+from provisioning import CleanupQueue, UserPool
+from resources import ResourceBroker, shortfall
+from testdata import OwnershipRegistry, PayloadFactory
+from fake_server import FakeGorestServer, options_from_env
+from latency import LatencySampler
+from slo import DEFAULT_PATH as SLO_PATH, load_slo
+
+# The fixtures, payloads and helpers the test modules take with `from verification import *`
+__all__ = [
+    'fake_server', 'main_url', 'user_endpoint', 'slo', 'latency_samples', 'latency_budget', 'latency_interval',
+    'latency_confidence', 'latency_max_samples', 'measure', 'max_pages', 'payload_factory', 'ownership_registry',
+    'valid_payload', 'missing_value_payload', 'invalid_value_payload', 'invalid_datatype_payload', 'token',
+    'invalid_token', 'pool_size', 'request_timeout', 'async_client', 'cleanup_queue', 'user_pool_size', 'user_pool',
+    'negative_case_budget', 'race_width', 'race_rounds', 'resources', 'existing_user', 'setup_cache', 'timing_log',
+    'cassette_seed', 'timed_test', 'event_sink', 'token_pool', 'pooled_token', 'deadline_budget', 'test_deadline',
+    'rate_limiter', 'retry_policy', 'circuit_breaker', 'client',
+    'MAIN_URL', 'USERS_PATH', 'USER_ENDPOINT', 'REQUEST_TIMEOUT', 'INVALID_TOKEN', 'VALID_PAYLOAD',
+    'MISSING_VALUE_PAYLOAD', 'INVALID_VALUE_PAYLOAD', 'INVALID_DATATYPE_PAYLOAD',
+    'is_id', 'is_name', 'is_email', 'is_gender', 'is_status', 'is_time', 'is_proper_json', 'is_user_datatypes',
+    'is_same_response', 'response_differences', 'same_user', 'user_resource_exists', 'is_owned',
+    'user_resource_delete', 'verify_email_free', 'make_email_free', 'make_resource_empty',
+    'generated_payload_errors', 'correct_empty_payload', 'get_valid_user_id',
+]
+
+MAIN_URL = "https://gorest.co.in"
+USERS_PATH = "/public-api/users"
+USER_ENDPOINT = MAIN_URL + USERS_PATH
+REQUEST_TIMEOUT = (3.05, 10.0)
+INVALID_TOKEN = '90a5606d1cc51be7d824fdd9c19201273b890961e8e4720d8045b9476de020da'
+
+VALID_PAYLOAD = {
+    "name": "Dan Doney",
+    "email": "dan@safemoney.com",
+    "gender" : "Male",
+    "status" : "Active"
+}
+
+MISSING_VALUE_PAYLOAD = {
+    "name": "Patrick Campos",
+    "email": "pat@safemoney.com",
+    "gender" : "Male"
+}
+
+INVALID_VALUE_PAYLOAD = {
+    "name": "John Doe",
+    "email": "john@safemoney.com",
+    "gender" : "Nonbinary",
+    "status" : "Active"
+}
+
+INVALID_DATATYPE_PAYLOAD = {
+    "name": "Jeff Truitt",
+    "email": "jeff@safemoney.com",
+    "gender" : "Male",
+    "status" : 1,
+}
+
+
+def read_token():
+    """A simple function that returns the bearer token stored in gorest_test/token.txt. Returns None if it is missing."""
+    if os.path.isfile("gorest_test/token.txt"):
+        f = open("gorest_test/token.txt", "r")
+        token = f.readline()
+        f.close()
+        return token
+    return None
 
+@pytest.fixture(scope='session')
+def fake_server():
+    """A pytest fixture that runs a local stand-in for the gorest server when GOREST_FAKE is set. Returns None otherwise."""
+    if not os.environ.get('GOREST_FAKE') or (CASSETTE is not None and CASSETTE.mode == 'replay'):
+        yield None
+        return
+    server = FakeGorestServer(**options_from_env(os.environ)).start()
+    yield server
+    server.stop()
 
 @pytest.fixture(scope='session')
-def main_url():
+def main_url(fake_server):
     """A simple pytest fixture that returns the main url of the resources being tested."""
-    return "https://gorest.co.in"
+    if CASSETTE is not None and CASSETTE.mode == 'replay':
+        return CASSETTE.url
+    url = fake_server.url if fake_server is not None else os.environ.get('GOREST_URL', MAIN_URL)
+    if CASSETTE is not None:
+        CASSETTE.url = url
+    return url
 
 @pytest.fixture(scope='session')
-def user_endpoint():
+def user_endpoint(main_url):
     """A simple pytest fixture that returns the URL of the users resource."""
-    return "https://gorest.co.in/public-api/users"
+    return main_url + USERS_PATH
 
 @pytest.fixture(scope='session')
-def timeout_threshold():
-    """A simple pytest fixture that returns the minimum performance expected from an HTTP method."""
-    return 1.000
+def slo(main_url, fake_server):
+    """A pytest fixture that returns the latency, error-rate and throughput objectives of every endpoint.
+
+    They are read once from GOREST_SLO (gorest_test/slo.json by default), with the overrides of the
+    environment under test: its main url, or 'fake' for the fake server."""
+    return load_slo(os.environ.get('GOREST_SLO', SLO_PATH), 'fake' if fake_server is not None else main_url)
 
 @pytest.fixture(scope='session')
-def valid_payload():
-    """A simple pytest fixture that returns a dictionary for a valid payload to the users endpoint."""
-    payload = {
-        "name": "Dan Doney",
-        "email": "dan@safemoney.com",
-        "gender" : "Male",
-        "status" : "Active"
-    }
-    return payload
+def latency_samples():
+    """A simple pytest fixture that returns how many times a repeatable request is sent to measure its latency."""
+    return int(os.environ.get('GOREST_LATENCY_SAMPLES', 5))
 
 @pytest.fixture(scope='session')
-def missing_value_payload():
-    """A simple pytest fixture that returns a dictionary for a payload to the users endpoint a one missing category."""
-    payload = {
-        "name": "Patrick Campos",
-        "email": "pat@safemoney.com",
-        "gender" : "Male"
-    }
-    return payload
+def latency_budget():
+    """A simple pytest fixture that returns the time budget in seconds for sampling one request (None for no budget)."""
+    budget = os.environ.get('GOREST_LATENCY_BUDGET')
+    return float(budget) if budget else None
 
 @pytest.fixture(scope='session')
-def invalid_value_payload():
-    """A simple pytest fixture that returns a dictionary for a payload to the users endpoint with an unaccounted gender field."""
-    payload = {
-        "name": "John Doe",
-        "email": "john@safemoney.com",
-        "gender" : "Nonbinary",
-        "status" : "Active"
-    }
-    return payload
+def latency_interval():
+    """A simple pytest fixture that returns the seconds between the intended sends of sampled requests (None for back to back)."""
+    interval = os.environ.get('GOREST_LATENCY_INTERVAL')
+    return float(interval) if interval else None
+
+@pytest.fixture(scope='session')
+def latency_confidence():
+    """A simple pytest fixture that returns the confidence latency verdicts are sampled sequentially to (None for fixed samples)."""
+    confidence = os.environ.get('GOREST_LATENCY_CONFIDENCE')
+    return float(confidence) if confidence else None
+
+@pytest.fixture(scope='session')
+def latency_max_samples():
+    """A simple pytest fixture that returns the most times a request is sent when sampled sequentially."""
+    return int(os.environ.get('GOREST_LATENCY_MAX_SAMPLES', 30))
 
 @pytest.fixture(scope='session')
-def invalid_datatype_payload():
+def measure(latency_samples, latency_budget, latency_interval, latency_confidence, latency_max_samples):
+    """A simple pytest fixture that returns the sampler used to measure request latencies."""
+    return LatencySampler(samples=latency_samples, budget=latency_budget, interval=latency_interval,
+        confidence=latency_confidence, max_samples=latency_max_samples)
+
+@pytest.fixture(scope='session')
+def max_pages():
+    """A simple pytest fixture that returns the maximum number of pages walked in a collection (None for all)."""
+    pages = os.environ.get('GOREST_MAX_PAGES')
+    return int(pages) if pages else None
+
+@pytest.fixture(scope='session')
+def payload_factory():
+    """A simple pytest fixture that returns the factory giving every test payload a collision-free email."""
+    if CASSETTE is not None:
+        # Recorded and replayed runs must send the same emails
+        return PayloadFactory(run_tag="cassette{}".format(next(CASSETTE_TAGS)), worker='main')
+    return PayloadFactory()
+
+@pytest.fixture(scope='session')
+def ownership_registry():
+    """A simple pytest fixture that returns the registry of users created by this run."""
+    return OwnershipRegistry()
+
+@pytest.fixture
+def valid_payload(payload_factory):
+    """A simple pytest fixture that returns a dictionary for a valid payload to the users endpoint."""
+    return payload_factory.make(VALID_PAYLOAD)
+
+@pytest.fixture
+def missing_value_payload(payload_factory):
+    """A simple pytest fixture that returns a dictionary for a payload to the users endpoint a one missing category."""
+    return payload_factory.make(MISSING_VALUE_PAYLOAD)
+
+@pytest.fixture
+def invalid_value_payload(payload_factory):
+    """A simple pytest fixture that returns a dictionary for a payload to the users endpoint with an unaccounted gender field."""
+    return payload_factory.make(INVALID_VALUE_PAYLOAD)
+
+@pytest.fixture
+def invalid_datatype_payload(payload_factory):
     """A simple pytest fixture that returns a dictionary for a payload to the users endpoint with an unaccounted status field."""
-    payload = {
-        "name": "Jeff Truitt",
-        "email": "jeff@safemoney.com",
-        "gender" : "Male",
-        "status" : 1,
-    }
-    return payload
+    return payload_factory.make(INVALID_DATATYPE_PAYLOAD)
 
 @pytest.fixture(scope='session')
-def token():
+def token(fake_server):
     """A simple pytest fixture that returns the bearer token needed for some HTTP requests."""
 
-    if os.path.isfile("token.txt"):
+    if CASSETTE is not None and CASSETTE.mode == 'replay':
+        # Tokens are never recorded, and replay needs none
+        return 'replay'
+
+    elif fake_server is not None:
+        return fake_server.token
+
+    elif os.path.isfile("token.txt"):
         pytest.exit('Please run pytest from repository main folder')
 
-    elif os.path.isfile("gorest_test/token.txt"):
-        f = open("gorest_test/token.txt", "r")
-        token = f.readline()
-        f.close()
-        return token
-    else:
+    token = read_token()
+    if token is None:
         pytest.exit('Token file not found. Hint: run setup.py again')
+    return token
 
 @pytest.fixture(scope='session')
 def invalid_token():
     """A simple pytest fixture that returns an invalid bearer token."""
-    return '90a5606d1cc51be7d824fdd9c19201273b890961e8e4720d8045b9476de020da'
+    return INVALID_TOKEN
+
+@pytest.fixture(scope='session')
+def pool_size():
+    """A simple pytest fixture that returns the number of keep-alive connections kept per host."""
+    return int(os.environ.get('GOREST_POOL_SIZE', 10))
+
+@pytest.fixture(scope='session')
+def request_timeout():
+    """A simple pytest fixture that returns the (connect, read) timeout in seconds for every HTTP request."""
+    return REQUEST_TIMEOUT
+
+@pytest.fixture(scope='session')
+def async_client(client, pool_size):
+    """A pytest fixture that returns an asyncio front-end to the pooled client, for concurrent setup and teardown."""
+    api_client = AsyncClient(client, concurrency=pool_size)
+    yield api_client
+    api_client.close()
+
+@pytest.fixture(scope='session')
+def cleanup_queue(async_client):
+    """A pytest fixture that returns the queue of resources deleted concurrently at session end."""
+    deferred = CleanupQueue(async_client, user_resource_delete)
+    yield deferred
+    failed = deferred.drain()
+    assert not failed, "Clean Up Error: Failed to delete {}".format(", ".join(failed))
+
+@pytest.fixture(scope='session')
+def user_pool_size():
+    """A simple pytest fixture that returns how many users are provisioned up front per test module (None to work it out)."""
+    size = os.environ.get('GOREST_USER_POOL_SIZE')
+    return int(size) if size else None
+
+@pytest.fixture(scope='module')
+def user_pool(request, async_client, user_endpoint, payload_factory, cleanup_queue, user_pool_size):
+    """A pytest fixture that returns the pool of users provisioned concurrently for a test module.
+
+    Unless GOREST_USER_POOL_SIZE says otherwise, it holds as many users as the
+    module's tests need beyond those its tests create and hand on. Fails the
+    setup of the module's tests if any could not be created."""
+    pool = UserPool(async_client, user_endpoint, payload_factory, VALID_PAYLOAD, cleanup_queue)
+    if user_pool_size is None:
+        funcs = [item.function for item in request.session.items if item.module is request.module]
+        counts = {name: request.getfixturevalue(name) for func in funcs
+            for name in getattr(func, 'produces', {}).values() if isinstance(name, str)}
+        user_pool_size = shortfall(funcs, counts, 'user')
+    errors = pool.provision(user_pool_size)
+    if errors:
+        pool.release_all()
+        pytest.fail("Provisioning Error: Could not create {} of {} user(s): {}".format(len(errors), user_pool_size,
+            "; ".join(str(error) for error in errors)))
+    yield pool
+    pool.release_all()
+
+@pytest.fixture(scope='session')
+def negative_case_budget():
+    """A simple pytest fixture that returns how many generated invalid payloads are sent per method (GOREST_NEGATIVE_CASES)."""
+    return int(os.environ.get('GOREST_NEGATIVE_CASES', 200))
+
+@pytest.fixture(scope='session')
+def race_width():
+    """A simple pytest fixture that returns how many identical requests are sent at once by the race tests (GOREST_RACE_WIDTH)."""
+    return int(os.environ.get('GOREST_RACE_WIDTH', 5))
+
+@pytest.fixture(scope='session')
+def race_rounds():
+    """A simple pytest fixture that returns how many rounds of identical requests the race tests send (GOREST_RACE_ROUNDS)."""
+    return int(os.environ.get('GOREST_RACE_ROUNDS', 3))
+
+@pytest.fixture(scope='session')
+def resources():
+    """A simple pytest fixture that returns the broker handing resources created by tests on to the tests needing them."""
+    return RESOURCES
+
+@pytest.fixture
+def existing_user(resources, user_pool):
+    """A simple pytest fixture that returns an existing user owned by this run, deleted at session end.
+
+    It is a user another test created and handed on if there is one, and one from the pool otherwise."""
+    return resources.take('user', user_pool.acquire)
+
+@pytest.fixture(scope='session')
+def setup_cache():
+    """A simple pytest fixture that returns the cache shared by the setup lookups of the whole session."""
+    return TTLCache(ttl=float(os.environ.get('GOREST_CACHE_TTL', 30)), maxsize=int(os.environ.get('GOREST_CACHE_SIZE', 256)))
+
+# Every test module of a session appends to the same history run
+HISTORY_SESSION = uuid.uuid4().hex
+
+# Shared by every test module of a session, so every event carries the session's id
+EVENTS = sink_from_env(os.environ, run=HISTORY_SESSION)
+
+# Shared by every test module of a session, so all exchanges land in one cassette
+CASSETTE = cassette_from_env(os.environ)
+CASSETTE_TAGS = itertools.count(1)
+
+# Shared by every test module of a session, so reports cover the whole session
+TIMING_LOG = TimingLog()
+
+# One pool per set of tokens, shared by every test module of a session
+TOKEN_POOLS = {}
+
+# Shared by every test module of a session, so users created by one module's tests can serve another's
+RESOURCES = ResourceBroker()
+
+def shared_token_pool(tokens):
+    """A function that returns the pool of tokens, assigned as GOREST_TOKEN_STRATEGY says. None with fewer than two tokens.
+
+    Every caller with the same tokens gets the same pool, so that usage is
+    counted once per session. Each token is paced by its own rate limiter
+    unless GOREST_RATE_LIMIT=0."""
+    if len(tokens) < 2:
+        return None
+    key = tuple(tokens)
+    if key not in TOKEN_POOLS:
+        limiter_factory = None
+        if os.environ.get('GOREST_RATE_LIMIT') != '0':
+            limiter_factory = lambda token: RateLimiter(state_file=default_state_file(token))
+        TOKEN_POOLS[key] = TokenPool(tokens, strategy=os.environ.get('GOREST_TOKEN_STRATEGY', 'round_robin'),
+            limiter_factory=limiter_factory, worker=os.environ.get('PYTEST_XDIST_WORKER'))
+    return TOKEN_POOLS[key]
+
+def token_usage():
+    """A simple function that returns the usage of every token of every pool in the session, keyed by token label."""
+    usage = {}
+    for pool in TOKEN_POOLS.values():
+        usage.update(pool.report())
+    return usage
+
+def record_history(timing_log, url, session=HISTORY_SESSION):
+    """A function that appends the requests of timing_log to the latency history (GOREST_HISTORY), if one is set."""
+    path = os.environ.get('GOREST_HISTORY')
+    if not path or (CASSETTE is not None and CASSETTE.mode == 'replay'):
+        return None
+    entries = timing_log.take_new()
+    if not entries:
+        return None
+    store = HistoryStore(path)
+    try:
+        return store.record_run(entries, url, session)
+    finally:
+        store.close()
+
+@pytest.fixture(scope='session')
+def timing_log(main_url, fake_server):
+    """A pytest fixture that returns the log of every request's phase timings.
+
+    At session end it is written to GOREST_TIMING_REPORT if set, with the usage of every pooled token, and appended to the latency history."""
+    log = TIMING_LOG
+    yield log
+    if os.environ.get('GOREST_TIMING_REPORT'):
+        log.write(os.environ['GOREST_TIMING_REPORT'], tokens=token_usage())
+    # Runs against fake servers share one label, whatever port they listened on
+    record_history(log, 'fake' if fake_server is not None else main_url)
+
+@pytest.fixture(autouse=True)
+def cassette_seed(request):
+    """A pytest fixture that makes random choices repeat from recording to replay, by seeding them per test."""
+    if CASSETTE is not None:
+        random.seed(request.node.nodeid)
+
+@pytest.fixture(autouse=True)
+def timed_test(request, timing_log):
+    """A pytest fixture that attributes the requests sent during each test to it in the timing log and event stream."""
+    timing_log.current = request.node.nodeid
+    token = CURRENT_TEST.set(request.node.nodeid)
+    yield
+    CURRENT_TEST.reset(token)
+    timing_log.current = None
+
+@pytest.fixture(scope='session')
+def event_sink():
+    """A pytest fixture that returns the sink of structured events (GOREST_EVENTS), or None. Flushed at session end."""
+    yield EVENTS
+    if EVENTS is not None:
+        EVENTS.flush()
+
+@pytest.fixture(scope='session')
+def token_pool(fake_server):
+    """A pytest fixture that returns the pool of tokens sharing the session's requests, or None for a single token.
+
+    Tokens are read from GOREST_TOKENS or gorest_test/tokens.txt, or are the fake server's."""
+    if CASSETTE is not None and CASSETTE.mode == 'replay':
+        return None
+    tokens = sorted(fake_server.tokens) if fake_server is not None else read_tokens(os.environ)
+    return shared_token_pool(tokens)
+
+@pytest.fixture(autouse=True)
+def pooled_token(token_pool):
+    """A pytest fixture that assigns each test a token of the pool, when there is one."""
+    if token_pool is None:
+        yield None
+        return
+    yield token_pool.assign()
+    token_pool.release()
+
+@pytest.fixture(scope='session')
+def deadline_budget():
+    """A simple pytest fixture that returns the time budget in seconds of every test (GOREST_TEST_DEADLINE, None if 0)."""
+    budget = float(os.environ.get('GOREST_TEST_DEADLINE', 120))
+    return budget or None
+
+@pytest.fixture(autouse=True)
+def test_deadline(deadline_budget):
+    """A pytest fixture that bounds the time every request of each test may take by the test's deadline budget."""
+    if deadline_budget is None:
+        yield None
+        return
+    deadline = Deadline(deadline_budget)
+    token = CURRENT_DEADLINE.set(deadline)
+    yield deadline
+    CURRENT_DEADLINE.reset(token)
+
+@pytest.fixture(scope='session')
+def rate_limiter(token):
+    """A pytest fixture that returns the rate limiter pacing every request, or None if GOREST_RATE_LIMIT=0.
+
+    Its bucket is kept in GOREST_RATE_LIMIT_FILE (a temporary file per token by default), so every worker shares it."""
+    if os.environ.get('GOREST_RATE_LIMIT') == '0' or (CASSETTE is not None and CASSETTE.mode == 'replay'):
+        return None
+    return RateLimiter(state_file=os.environ.get('GOREST_RATE_LIMIT_FILE') or default_state_file(token))
+
+@pytest.fixture(scope='session')
+def retry_policy():
+    """A simple pytest fixture that returns how failed idempotent requests are retried (GOREST_RETRIES attempts, 3 by default)."""
+    return RetryPolicy(attempts=int(os.environ.get('GOREST_RETRIES', 3)),
+        backoff=float(os.environ.get('GOREST_RETRY_BACKOFF', 0.1)))
+
+@pytest.fixture(scope='session')
+def circuit_breaker():
+    """A simple pytest fixture that returns the circuit breaker failing the session fast once the server is down."""
+    return CircuitBreaker(threshold=int(os.environ.get('GOREST_BREAKER_THRESHOLD', 5)),
+        reset_timeout=float(os.environ.get('GOREST_BREAKER_RESET', 30)))
+
+@pytest.fixture(scope='session')
+def client(token, pool_size, request_timeout, ownership_registry, setup_cache, timing_log, rate_limiter, retry_policy,
+        circuit_breaker, token_pool, event_sink):
+    """A pytest fixture that returns the pooled HTTP client shared by the whole session."""
+    api_client = ApiClient(token=token, pool_size=pool_size, timeout=request_timeout, registry=ownership_registry,
+        cache=setup_cache, timing_log=timing_log, cassette=CASSETTE, rate_limiter=rate_limiter, retry=retry_policy,
+        breaker=circuit_breaker, token_pool=token_pool, events=event_sink)
+    yield api_client
+    # Delete any user this run created but did not clean up
+    for url in ownership_registry.owned():
+        user_resource_delete(api_client, url)
+    api_client.close()
+    if CASSETTE is not None and CASSETTE.mode == 'record':
+        CASSETTE.save()
 
 def is_id(id):
     """A simple function that returns if the value is a valid ID datatype."""
@@ -105,13 +483,13 @@ def is_email(email):
 def is_gender(gender):
     """A simple function that returns if the value is a valid gender datatype."""
     # Valid gender must be a string either 'Male' or 'Female'
-    return isinstance(gender, str) and gender == 'Male' or gender == 'Female'
+    return isinstance(gender, str) and gender in ('Male', 'Female')
 
 
 def is_status(status):
     """A simple function that returns if the value is a valid status datatype."""
     # Valid status must be a string either 'Active' or 'Inactive'
-    return isinstance(status, str) and status == 'Active' or status == 'Inactive'
+    return isinstance(status, str) and status in ('Active', 'Inactive')
 
 
 def is_time(time):
@@ -146,17 +524,21 @@ def is_user_datatypes(user):
         is_time(user['updated_at'])
     ])
 
-def is_same_response(response1, response2):
-    """A simple function that checks if two responses are exactly the same"""
-    response1_dict = is_proper_json(response1)
-    response2_dict = is_proper_json(response2)
-    if response1_dict != False and response2_dict != False:
-        # Converts response JSONs into string form and verifies they are equal.
-        return str(response1_dict) ==  str(response2_dict)
+def is_same_response(response1, response2, ignore=()):
+    """A simple function that checks if two responses are exactly the same, except for keys named in ignore"""
+    digest1 = response_digest(response1, ignore)
+    digest2 = response_digest(response2, ignore)
+    if digest1 is not None and digest2 is not None:
+        # Compares canonical digests, so key order and number format do not matter
+        return digest1 == digest2
     else:
         assert 0
         return False
 
+def response_differences(response1, response2, ignore=()):
+    """A simple function that describes where the JSON bodies of two responses differ."""
+    return "; ".join(structured_diff(response1.json(), response2.json(), ignore))
+
 def same_user(response_1_dict, response_2_dict):
     """A simple function that returns if two user dictionaries have the same mandatory values"""
     # Converts response JSONs into string form and verifies they are equal.
@@ -167,81 +549,109 @@ def same_user(response_1_dict, response_2_dict):
         response_1_dict['status'] ==  response_2_dict['status'],
     ])
 
-def user_resource_exists(url):
+def user_resource_exists(client, url):
     """A simple function that confirms if url points to a an existing resource"""
-    response = requests.get(url)
+    response = client.get(url)
     return response.status_code == requests.codes.ok
 
-def user_resource_delete(url, token):
-    """A simple function that deletes resource at url. Returns true if successful."""
-    access_token_header = "Bearer " + token
-    response = requests.delete(
-        url = url,
-        headers={"Authorization": access_token_header}
-    )
-    return response.status_code == requests.codes.ok
+def is_owned(client, url):
+    """A simple function that returns if the resource at url was created by this run."""
+    # Without a registry every resource is considered owned
+    return client.registry is None or client.registry.owns(url)
+
+def emit_decision(client, helper, outcome, **fields):
+    """A simple function that records a helper's decision as a 'decision' event, if the client has an event sink."""
+    if client.events is not None:
+        client.events.emit('decision', helper=helper, outcome=outcome, **fields)
+
+@in_phase('cleanup')
+def user_resource_delete(client, url):
+    """A simple function that deletes resource at url. Returns true if successful.
 
-def verify_email_free(url, email):
+    Only resources created by this run are deleted."""
+    if not is_owned(client, url):
+        emit_decision(client, 'user_resource_delete', 'refused', url=url)
+        return False
+    response = client.delete(url = url)
+    deleted = response.status_code == requests.codes.ok
+    emit_decision(client, 'user_resource_delete', 'deleted' if deleted else 'failed', url=url, status=response.status_code)
+    return deleted
+
+def lookup_email(client, url, email, helper):
+    """A function that looks an email address up. Returns ('free', None), ('taken', user) or ('other', None).
+
+    Returns (None, None) if the lookup failed, after recording why."""
+    response = client.cached_get(url, params={'email': email})
+    if response.status_code != requests.codes.ok:
+        emit_decision(client, helper, 'lookup_failed', email=email, status=response.status_code)
+        return None, None
+    try:
+        response_dict = response.json()
+        if response_dict['meta']['pagination']['total'] != 1:
+            return 'free', None
+        user = response_dict['data'][0]
+        return ('taken', user) if user['email'] == email else ('other', None)
+    except (ValueError, KeyError, IndexError, TypeError) as e:
+        emit_decision(client, helper, 'unexpected_body', email=email, error=type(e).__name__)
+        return None, None
+
+@in_phase('setup')
+def verify_email_free(client, url, email):
     """A simple function that returns if an email address is free."""
-    print("\nVerifying if {} exists".format(email))
-    response = requests.get(url, params={'email': email})
-    if response.status_code == requests.codes.ok:
-        print("GET method successful")
-        try:
-            response_dict = response.json()
-            if response_dict['meta']['pagination']['total'] != 1:
-                print('{} is free'.format(email))
-                return True
-            elif response_dict['data'][0]['email'] == email:
-                return False
-        except:
-            print ("Unexpected error:", sys.exc_info()[0])
-            return False
-    else:
-        print("GET method was unsuccessful ({})".format(response.status_code))
-        return None
+    found, _ = lookup_email(client, url, email, 'verify_email_free')
+    if found is not None:
+        emit_decision(client, 'verify_email_free', found, email=email)
+    if found == 'free':
+        return True
+    elif found == 'taken':
+        return False
+    return None
 
-def make_email_free(url, email, token):
+@in_phase('setup')
+def make_email_free(client, url, email):
     """A function that ensures an email address is free in the database. Returns True if successful."""
-    print("\nVerifying if {} exists".format(email))
-    response = requests.get(url, params={'email': email})
-    if response.status_code == requests.codes.ok:
-        print("GET method successful")
-        try:
-            response_dict = response.json()
-            if response_dict['meta']['pagination']['total'] != 1:
-                print('{} is free'.format(email))
-                return True
-            elif response_dict['data'][0]['email'] == email:
-                print('Result found {}. Attempting to delete'.format(response_dict['data'][0]['email']))
-                user_id = response_dict['data'][0]['id']
-                user_url = url + '/{}'.format(user_id)
-                return user_resource_delete(url = user_url, token=token)
-        except:
-            print ("Unexpected error:", sys.exc_info()[0])
-            return False
-    else:
-        print("GET method was unsuccessful ({})".format(response.status_code))
-        return False
+    found, user = lookup_email(client, url, email, 'make_email_free')
+    if found is not None:
+        emit_decision(client, 'make_email_free', found, email=email)
+    if found == 'free':
+        return True
+    elif found == 'taken':
+        return user_resource_delete(client, url = url + '/{}'.format(user['id']))
+    return False if found is None else None
 
-def make_resource_empty(url, token):
+@in_phase('setup')
+def make_resource_empty(client, url):
     """A function that ensures a resource is empty in the database. Returns True if successful."""
-    response = requests.get(url)
-    if response.status_code == requests.codes.ok:
-        try:
-            response_dict = response.json()
-            if response_dict['code'] == requests.codes.not_found:
-                print('\n{} is free'.format(url))
-                return True
-            else:
-                print('\nResult found. Attempting to delete')
-                return user_resource_delete(url = url, token = token)
-        except:
-            print ("\nUnexpected error:", sys.exc_info()[0])
-            return False
-    else:
-        print("\nGET method was unsuccessful ({})".format(response.status_code))
+    response = client.cached_get(url)
+    if response.status_code != requests.codes.ok:
+        emit_decision(client, 'make_resource_empty', 'lookup_failed', url=url, status=response.status_code)
+        return False
+    try:
+        empty = response.json()['code'] == requests.codes.not_found
+    except (ValueError, KeyError, TypeError) as e:
+        emit_decision(client, 'make_resource_empty', 'unexpected_body', url=url, error=type(e).__name__)
         return False
+    emit_decision(client, 'make_resource_empty', 'free' if empty else 'taken', url=url)
+    return True if empty else user_resource_delete(client, url = url)
+
+def generated_payload_errors(results, cleanup_queue):
+    """A function that returns the errors of generated invalid payload cases, one per distinct server behavior.
+
+    Every case is expected to be rejected (422) with field errors, and
+    combined cases with the union of their single-field errors. Users
+    created by cases the server accepted are deleted at session end."""
+    errors = []
+    for behavior in group_behaviors(results):
+        if not is_rejected(behavior.signature):
+            errors.append("Validation Error: Expected 422 with field errors. " + describe_behavior(behavior))
+    for case, response in results:
+        if response_signature(response)[1:2] == (201,):
+            cleanup_queue.defer(response.request.url + "/{}".format(response.json()['data']['id']))
+    inconsistent = inconsistent_cases(results)
+    if inconsistent:
+        errors.append("Payload Error: {} combined case(s) not reported as the union of their field errors. e.g. {}"\
+            .format(len(inconsistent), " | ".join(describe_case(case) for case in inconsistent[:3])))
+    return errors
 
 def correct_empty_payload(received_payload):
     """A simple function that returns if the received payload dictionary corresponds to expected error messages."""
@@ -253,9 +663,10 @@ def correct_empty_payload(received_payload):
     ]
     return expected == received_payload
 
-def get_valid_user_id(user_endpoint):
+@in_phase('setup')
+def get_valid_user_id(client, user_endpoint):
     """ A simple function that returns an ID from a valid user at the specified endpoint."""
-    response = requests.get(user_endpoint)
+    response = client.cached_get(user_endpoint)
     response_dict = is_proper_json(response)
     if response_dict != False:
         user_id = response_dict['data'][0]['id']